@@ -0,0 +1,440 @@
+"""Headless benchmarks for the sketch engine.
+
+Builds synthetic sketches of increasing size and times the operations the
+builder performs on every edit. Nothing is launched and no network access is
+needed, so it can run in CI:
+
+    python -m gradio_layout_visualizer.bench --output bench.json
+    python -m gradio_layout_visualizer.bench --compare bench.json
+
+`--compare` exits with status 1 if any metric got slower than the stored
+baseline by more than `--threshold`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import functools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import gradio as gr
+import gradio.utils
+
+from gradio_layout_visualizer.sketch.codegen import CodeEmitter
+from gradio_layout_visualizer.sketch.history import History
+from gradio_layout_visualizer.sketch.journal import Journal
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import (
+    Project,
+    ProjectFormatError,
+    encode_project,
+    load_project,
+    project_encoding,
+    save_project,
+)
+from gradio_layout_visualizer.sketch.registry import get_registry
+from gradio_layout_visualizer.sketch.run import add_component, create
+from gradio_layout_visualizer.sketch.sessions import SessionStore
+from gradio_layout_visualizer.sketch.storage import atomic_write
+from gradio_layout_visualizer.sketch.utils import build_chat_history
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# Below this many seconds a metric is considered noise and never flagged.
+NOISE_FLOOR = 50e-6
+
+MAX_SYNTHETIC_DEPTH = 4
+
+# Metric suffix -> project file extension timed by the save/load benchmarks.
+PROJECT_ENCODINGS = {"": ".json", "_gz": ".json.gz", "_msgpack": ".msgpack"}
+
+SYNTHETIC_COMPONENTS = [
+    ("Textbox", {"label": "Name", "lines": 2}),
+    ("Number", {"label": "Count", "value": 3.0}),
+    ("Button", {"value": "Run", "variant": "primary"}),
+    ("Markdown", {"value": "## Section"}),
+    ("Slider", {"minimum": 0.0, "maximum": 10.0}),
+    ("Checkbox", {"label": "Enabled"}),
+    ("Dropdown", {"choices": ["a", "b", "c"]}),
+    ("Image", {"type": "filepath"}),
+]
+
+
+def synthetic_sketch(n: int, seed: int = 0) -> tuple[LayoutTree, dict, list]:
+    """
+    Build a sketch of `n` components the way a designer would: by repeatedly
+    clicking a '+' next to a recently added component. Rows and columns are
+    nested at most `MAX_SYNTHETIC_DEPTH` levels deep.
+    """
+    rnd = random.Random(seed)
+    layout, components, dependencies = LayoutTree(), {}, []
+    for new_id in range(n):
+        if new_id == 0:
+            add_index = None
+        else:
+            anchor = rnd.randrange(max(0, new_id - 30), new_id)
+            node, depth = layout.node(anchor), 0
+            while node.parent is not None:
+                node, depth = node.parent, depth + 1
+            vertical = layout.is_vertical(anchor)
+            along = ("up", "down") if vertical else ("left", "right")
+            across = ("left", "right") if vertical else ("up", "down")
+            nest = depth < MAX_SYNTHETIC_DEPTH and rnd.random() < 0.35
+            add_index = [anchor, rnd.choice(across if nest else along)]
+        name, kwargs = SYNTHETIC_COMPONENTS[new_id % len(SYNTHETIC_COMPONENTS)]
+        add_component(
+            getattr(gr, name), layout, components, dependencies, add_index, new_id
+        )
+        components[new_id][1].update(kwargs)
+
+    for index in range(max(1, n // 10)):
+        ids = rnd.sample(range(n), min(n, 3))
+        dependencies.append(
+            [
+                [(ids[0], "change")],
+                ids[1:2],
+                ids[2:],
+                f"fn_{index + 1}",
+                [],
+                None if index % 2 else f"def fn_{index + 1}(x):\n    return x",
+                None,
+                None,
+            ]
+        )
+    return layout, components, dependencies
+
+
+def measure(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Best-of-`repeat` wall time of `fn` in seconds (least sensitive to noise)."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def canvas_render_seconds(
+    layout: LayoutTree, components: dict, dependencies: list
+) -> float:
+    """Time one server-side render of the canvas for the given sketch."""
+    from gradio.state_holder import SessionState
+
+    with tempfile.TemporaryDirectory() as tmp:
+        demo = create(os.path.join(tmp, "app.py"), os.path.join(tmp, "app.json"))
+    render_fn = next(
+        fn
+        for fn in demo.fns.values()
+        if fn.renderable is not None and fn.renderable.fn.__name__ == "app"
+    )
+    state = SessionState(demo)
+    # What a new session's sketch State starts as: a handle into the store.
+    handle = copy.deepcopy(render_fn.inputs[0].value)
+    handle.store.replace(
+        handle, Project(layout, components, dependencies, len(components))
+    )
+    values = [handle, False, None, "default"]
+    for block, value in zip(render_fn.inputs, values):
+        state[block._id] = value
+
+    loop = asyncio.new_event_loop()
+    try:
+
+        def render():
+            loop.run_until_complete(
+                demo.process_api(render_fn, [None] * len(values), state)
+            )
+
+        render()
+        return measure(render, repeat=3)
+    finally:
+        loop.close()
+
+
+def bench_size(n: int, seed: int = 0, render: bool = True) -> dict[str, float]:
+    results = {}
+
+    start = time.perf_counter()
+    layout, components, dependencies = synthetic_sketch(n, seed)
+    results["add_component"] = (time.perf_counter() - start) / n
+
+    ids = list(components)
+    start = time.perf_counter()
+    for component_id in ids:
+        layout.node(component_id)
+    results["node_lookup"] = (time.perf_counter() - start) / n
+
+    rnd = random.Random(seed)
+    victims = rnd.sample(ids, min(len(ids) - 1, 100))
+
+    def delete():
+        tree = copy.deepcopy(layout)
+        start = time.perf_counter()
+        for component_id in victims:
+            tree.remove(component_id)
+        return time.perf_counter() - start
+
+    results["delete"] = min(delete() for _ in range(3)) / len(victims)
+
+    results["render_code_cold"] = measure(
+        lambda: CodeEmitter().emit(layout, components, dependencies)
+    )
+    emitter = CodeEmitter()
+    emitter.emit(layout, components, dependencies)
+
+    def edit_and_emit():
+        components[ids[0]][1]["label"] = str(time.perf_counter())
+        emitter.touch(ids[0])
+        emitter.emit(layout, components, dependencies)
+
+    results["render_code_edit"] = measure(edit_and_emit)
+
+    project = Project(layout, components, dependencies, n)
+    with tempfile.TemporaryDirectory() as tmp:
+        for suffix, extension in PROJECT_ENCODINGS.items():
+            config_file = os.path.join(tmp, f"app{extension}")
+            try:
+                save_project(config_file, project)
+            except ProjectFormatError:
+                # Optional encoder (msgpack) not installed.
+                continue
+            # A save that changed something: encode, write, fsync, rename.
+            encoding = project_encoding(config_file)
+            results[f"config_save{suffix}"] = measure(
+                lambda path=config_file, encoding=encoding: atomic_write(
+                    path, encode_project(project, encoding)
+                )
+            )
+            if not suffix:
+                results["config_save_unchanged"] = measure(
+                    functools.partial(save_project, config_file, project)
+                )
+            results[f"config_load{suffix}"] = measure(
+                functools.partial(load_project, config_file)
+            )
+
+        # What persisting one edit costs with the journal instead of a full save.
+        journal = Journal(os.path.join(tmp, "app.json"), compact_every=10**9)
+        op = {"op": "set_kwarg", "id": ids[0], "key": "label", "value": "Name"}
+        results["journal_record"] = measure(lambda: journal.record(op))
+
+    # gradio hashes a session's sketch State before and after every event.
+    store = SessionStore(project)
+    handle = store.handle()
+    results["state_hash"] = measure(lambda: gradio.utils.deep_hash(handle))
+
+    if render:
+        results["canvas_render"] = canvas_render_seconds(
+            layout, components, dependencies
+        )
+    return results
+
+
+def bench_create() -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        return measure(
+            lambda: create(os.path.join(tmp, "app.py"), os.path.join(tmp, "app.json")),
+            repeat=3,
+        )
+
+
+def bench_prompt_build(io_count: int = 20) -> float:
+    """Time assembling a code-generation prompt for a function with many I/O components."""
+    inputs = []
+    for i in range(io_count):
+        name, kwargs = SYNTHETIC_COMPONENTS[i % len(SYNTHETIC_COMPONENTS)]
+        inputs.append((f"in_{i}", getattr(gr, name), dict(kwargs)))
+    outputs = [(component, kwargs) for _, component, kwargs in inputs]
+    return measure(
+        lambda: build_chat_history([["Do the task", None]], "fn", inputs, outputs)
+    )
+
+
+def history_edits(n: int, steps: int, seed: int = 0) -> list[dict]:
+    """Journal operations as a designer makes them: mostly config and renames."""
+    rnd = random.Random(seed)
+    ids, new_id, ops = list(range(n)), n, []
+    for step in range(steps):
+        r = rnd.random()
+        if r < 0.1:
+            ops.append(
+                {
+                    "op": "add",
+                    "id": new_id,
+                    "name": "Textbox",
+                    "kwargs": {"label": f"Field {new_id}"},
+                    "var_name": f"textbox_{new_id}",
+                    "anchor": [rnd.choice(ids), 0],
+                    "direction": rnd.choice(("up", "down", "left", "right")),
+                }
+            )
+            ids.append(new_id)
+            new_id += 1
+        elif r < 0.15:
+            ops.append({"op": "remove", "node": [ids.pop(rnd.randrange(len(ids))), 0]})
+        elif r < 0.85:
+            ops.append(
+                {
+                    "op": "set_kwarg",
+                    "id": rnd.choice(ids),
+                    "key": "label",
+                    "value": f"Label {step}",
+                }
+            )
+        else:
+            ops.append({"op": "rename", "id": rnd.choice(ids), "var_name": f"v_{step}"})
+    return ops
+
+
+def bench_history(n: int = 1000, steps: int = 10_000) -> dict[str, float]:
+    """Time and memory of recording undo steps on an `n`-component sketch."""
+    layout, components, dependencies = synthetic_sketch(n)
+    project = Project(layout, components, dependencies, n)
+    ops = history_edits(n, steps)
+
+    history = History(max_steps=steps)
+    history.reset(project)
+    start = time.perf_counter()
+    for op in ops:
+        history.record(op)
+    seconds = (time.perf_counter() - start) / steps
+
+    history.reset(project)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for op in ops:
+            history.record(op)
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return {"record": seconds, "bytes_per_step": retained / steps}
+
+
+def run(sizes: list[int], max_render: int, seed: int = 0) -> dict:
+    registry_start = time.perf_counter()
+    get_registry()
+    report = {
+        "meta": {
+            "gradio": gr.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "registry": time.perf_counter() - registry_start,
+        "create": bench_create(),
+        "prompt_build": bench_prompt_build(),
+        "history": bench_history(),
+        "sizes": {},
+    }
+    for n in sizes:
+        report["sizes"][str(n)] = bench_size(n, seed, render=n <= max_render)
+    return report
+
+
+def flatten(report: dict) -> dict[str, float]:
+    metrics = {"create": report["create"]}
+    if "prompt_build" in report:
+        metrics["prompt_build"] = report["prompt_build"]
+    if "history" in report:
+        metrics["history_record"] = report["history"]["record"]
+    for n, results in report["sizes"].items():
+        for name, seconds in results.items():
+            metrics[f"{name}[{n}]"] = seconds
+    return metrics
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Return the metrics that regressed by more than `threshold` (e.g. 0.2 = 20%)."""
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    for name, seconds in new.items():
+        if name not in old or max(seconds, old[name]) < NOISE_FLOOR:
+            continue
+        ratio = seconds / old[name] if old[name] else float("inf")
+        marker = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            marker = "  <-- regression"
+        print(
+            f"{name:28} {old[name] * 1000:10.3f} ms -> {seconds * 1000:10.3f} ms"
+            f"  x{ratio:5.2f}{marker}"
+        )
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f"registry: {report['registry'] * 1000:.1f} ms")
+    print(f"create(): {report['create'] * 1000:.1f} ms")
+    print(f"prompt build (20 I/O): {report['prompt_build'] * 1000:.3f} ms")
+    history = report["history"]
+    print(
+        f"undo history (1,000 components): {history['record'] * 1000:.3f} ms "
+        f"and {history['bytes_per_step'] / 1024:.1f} KiB per step"
+    )
+    for n, results in report["sizes"].items():
+        print(f"\n{n} components")
+        for name, seconds in results.items():
+            print(f"  {name:20} {seconds * 1000:10.3f} ms")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Gradio Layout Visualizer sketch engine"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Sketch sizes to benchmark (default: 10 100 1000 10000)",
+    )
+    parser.add_argument(
+        "--max-render",
+        type=int,
+        default=1000,
+        help="Largest size for which to time a full canvas render (default: 1000)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument(
+        "--compare", help="Baseline JSON to compare against; exits 1 on regressions"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown before a metric is flagged (default: 0.25 = 25%%)",
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.max_render, args.seed)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
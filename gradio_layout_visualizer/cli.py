@@ -2,7 +2,16 @@
 
 import argparse
 import os
-from gradio_layout_visualizer.sketch.run import create
+import time
+from gradio_layout_visualizer.sketch.generation_cache import generation_cache
+from gradio_layout_visualizer.sketch.inference import async_client_pool, client_pool
+from gradio_layout_visualizer.sketch.metrics import metrics_enabled, serve_prometheus
+from gradio_layout_visualizer.sketch.preview import preview_pool
+from gradio_layout_visualizer.sketch.project import ProjectFormatError
+from gradio_layout_visualizer.sketch.registry import get_registry, startup_timing
+from gradio_layout_visualizer.sketch.run import MAX_CONCURRENT_GENERATIONS, create
+from gradio_layout_visualizer.sketch.sessions import DEFAULT_BUDGET_BYTES
+from gradio_layout_visualizer.sketch.utils import DEFAULT_BATCH_PARALLELISM
 
 
 def main():
@@ -18,7 +27,8 @@ def main():
     parser.add_argument(
         "--config",
         default="app.json",
-        help="Path to the config file (default: app.json)",
+        help="Path to the project file; .json, .json.gz or .msgpack "
+        "(default: app.json)",
     )
     parser.add_argument(
         "--share",
@@ -31,8 +41,96 @@ def main():
         default=7860,
         help="Port to run the server on (default: 7860)",
     )
+    parser.add_argument(
+        "--no-journal",
+        action="store_true",
+        help="Only persist the project on 'Save & Render' instead of "
+        "journaling every edit next to it",
+    )
+    parser.add_argument(
+        "--session-memory-mb",
+        type=int,
+        default=DEFAULT_BUDGET_BYTES >> 20,
+        help="Memory for open sketches across all sessions; beyond it, idle "
+        f"sessions are moved to disk (default: {DEFAULT_BUDGET_BYTES >> 20})",
+    )
+    parser.add_argument(
+        "--no-schema-cache",
+        action="store_true",
+        help="Re-derive component schemas instead of using the on-disk cache",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Record handler latencies and show them in a debug panel "
+        "(also enabled by GRADIO_LAYOUT_VISUALIZER_METRICS=1)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=9464,
+        help="Port for the Prometheus /metrics endpoint when --metrics is set (default: 9464)",
+    )
+    parser.add_argument(
+        "--no-generation-cache",
+        action="store_true",
+        help="Always call the model instead of replaying identical earlier "
+        "generations (also GRADIO_LAYOUT_VISUALIZER_GENERATION_CACHE=0)",
+    )
+    parser.add_argument(
+        "--max-concurrent-generations",
+        type=int,
+        default=MAX_CONCURRENT_GENERATIONS,
+        help="Code generations streamed at once; the rest are queued "
+        f"(default: {MAX_CONCURRENT_GENERATIONS})",
+    )
+    parser.add_argument(
+        "--batch-parallelism",
+        type=int,
+        default=DEFAULT_BATCH_PARALLELISM,
+        help="Functions generated at once by 'Generate All' "
+        f"(default: {DEFAULT_BATCH_PARALLELISM})",
+    )
+    parser.add_argument(
+        "--preview-workers",
+        type=int,
+        default=preview_pool.workers,
+        help="Worker processes running the preview's functions, i.e. how many "
+        f"run at once (default: {preview_pool.workers})",
+    )
+    parser.add_argument(
+        "--preview-timeout",
+        type=float,
+        default=preview_pool.timeout,
+        help="Seconds a preview function may run before its worker is "
+        f"restarted (default: {preview_pool.timeout:g})",
+    )
+    parser.add_argument(
+        "--preview-memory-mb",
+        type=int,
+        default=preview_pool.memory_limit >> 20,
+        help="Memory each preview worker may allocate "
+        f"(default: {preview_pool.memory_limit >> 20})",
+    )
+    parser.add_argument(
+        "--inference-url",
+        help="OpenAI-compatible base URL for code generation, e.g. a local "
+        "mock server (also read from GRADIO_LAYOUT_VISUALIZER_INFERENCE_URL)",
+    )
 
     args = parser.parse_args()
+    metrics = args.metrics or metrics_enabled()
+    if args.no_generation_cache:
+        generation_cache.enabled = False
+    if args.inference_url:
+        client_pool.base_url = args.inference_url
+        async_client_pool.base_url = args.inference_url
+    preview_pool.workers = args.preview_workers
+    preview_pool.timeout = args.preview_timeout
+    preview_pool.memory_limit = args.preview_memory_mb << 20
+    # Started now, so the workers are warm by the first preview.
+    preview_pool.start()
 
     # Ensure file paths are absolute
     app_file = os.path.abspath(args.file)
@@ -42,7 +140,32 @@ def main():
     print(f"📝 App file: {app_file}")
     print(f"⚙️  Config file: {config_file}")
 
-    demo = create(app_file, config_file)
+    registry_start = time.perf_counter()
+    get_registry(use_cache=not args.no_schema_cache)
+    registry_seconds = time.perf_counter() - registry_start
+    create_start = time.perf_counter()
+    try:
+        demo = create(
+            app_file,
+            config_file,
+            metrics=metrics,
+            generation_concurrency=args.max_concurrent_generations,
+            batch_parallelism=args.batch_parallelism,
+            journal=not args.no_journal,
+            session_budget=args.session_memory_mb << 20,
+        )
+    except ProjectFormatError as e:
+        raise SystemExit(f"❌ Could not load the project: {e}") from e
+    create_seconds = time.perf_counter() - create_start
+
+    print(
+        f"⏱️  Startup: component schemas {registry_seconds * 1000:.0f} ms "
+        f"({startup_timing['registry_source']}), "
+        f"create() {create_seconds * 1000:.0f} ms"
+    )
+    if metrics:
+        serve_prometheus(args.metrics_port)
+        print(f"📈 Metrics: http://127.0.0.1:{args.metrics_port}/metrics")
     demo.launch(share=args.share, server_port=args.port)
 
 
@@ -0,0 +1,450 @@
+"""Local load test for the app a sketch generates.
+
+Launches the app on localhost and drives it the way browsers do, through
+gradio's queue API, so it can be tried under concurrent users before it is
+deployed. Nothing outside this machine is involved:
+
+    python -m gradio_layout_visualizer.loadtest app.json --clients 20 --rate 50
+    python -m gradio_layout_visualizer.loadtest app.py --duration 60 --output load.json
+
+A project file is first turned into the app "Save & Render" writes; an app
+file is run as is (it must call `demo.launch()`); `--url` targets an app
+that is already running. Every event listener with a backend function is
+fired, with the current values of its input components as data.
+
+Each simulated client is one session. Together they fire `--rate` events
+per second at evenly spaced times, whether or not earlier events finished,
+so a saturated app shows up as growing queue waits rather than as a lower
+request rate. Per event, the report gives throughput, the time spent in
+gradio's queue before the function started, and end-to-end latency.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import httpx
+import orjson
+
+from gradio_layout_visualizer.sketch.codegen import CodeEmitter
+from gradio_layout_visualizer.sketch.metrics import QUANTILES, percentile
+from gradio_layout_visualizer.sketch.project import load_project
+
+DEFAULT_CLIENTS = 10
+DEFAULT_RATE = 20.0
+DEFAULT_DURATION = 30.0
+
+# Time allowed for the app to start, and for events still running at the end.
+STARTUP_TIMEOUT = 60.0
+DRAIN_TIMEOUT = 30.0
+
+
+@dataclass
+class Event:
+    """An event listener of the app under test."""
+
+    name: str
+    fn_index: int
+    trigger_id: int | None
+    data: list
+
+
+@dataclass
+class EventStats:
+    sent: int = 0
+    completed: int = 0
+    failed: int = 0
+    queue_wait: list[float] = field(default_factory=list)
+    latency: list[float] = field(default_factory=list)
+
+    def summary(self, duration: float) -> dict:
+        summary = {
+            "sent": self.sent,
+            "completed": self.completed,
+            "failed": self.failed,
+            "throughput": self.completed / duration,
+        }
+        for name, samples in (
+            ("queue_wait", self.queue_wait),
+            ("latency", self.latency),
+        ):
+            for q in QUANTILES:
+                summary[f"{name}_p{int(q * 100)}"] = percentile(samples, q)
+        return summary
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def generated_app(config_file: str, directory: str) -> str:
+    """Write the app generated from a project file into `directory`; returns its path."""
+    project = load_project(config_file)
+    if project is None:
+        raise SystemExit(f"No project at {config_file}")
+    app_file = os.path.join(directory, "app.py")
+    with open(app_file, "w", encoding="utf-8") as f:
+        f.write(
+            CodeEmitter().emit(
+                project.layout,
+                project.components,
+                project.dependencies,
+                project.queue,
+            )
+        )
+    return app_file
+
+
+def launch(app_file: str, port: int, log_file: str) -> subprocess.Popen:
+    """Run an app file on localhost, with its output going to `log_file`."""
+    env = dict(
+        os.environ,
+        GRADIO_SERVER_NAME="127.0.0.1",
+        GRADIO_SERVER_PORT=str(port),
+        GRADIO_ANALYTICS_ENABLED="False",
+    )
+    with open(log_file, "wb") as log:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(app_file)],
+            cwd=os.path.dirname(os.path.abspath(app_file)),
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+
+def read_log_tail(log_file: str, size: int = 2000) -> str:
+    with open(log_file, encoding="utf-8", errors="replace") as f:
+        return f.read()[-size:]
+
+
+async def wait_until_ready(
+    http: httpx.AsyncClient,
+    url: str,
+    process: subprocess.Popen | None = None,
+    log_file: str | None = None,
+) -> dict:
+    """Poll until the app serves its config, and return it."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            output = await asyncio.to_thread(read_log_tail, log_file)
+            raise SystemExit(
+                f"The app exited with status {process.returncode}:\n{output}"
+            )
+        try:
+            response = await http.get(f"{url}/config")
+            if response.status_code == 200:
+                return response.json()
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit(f"The app at {url} did not start within {STARTUP_TIMEOUT:g} s")
+
+
+def discover_events(
+    config: dict, info: dict, only: list[str] | None = None
+) -> list[Event]:
+    """
+    Events to fire, with data for their inputs.
+
+    Named endpoints use gradio's example inputs, except file-like ones (which
+    point at remote samples) and components without an example, which are
+    sent their current value, as are all inputs of unnamed events.
+    """
+    values = {
+        component["id"]: component.get("props", {}).get("value")
+        for component in config["components"]
+    }
+    named = info.get("named_endpoints", {})
+    events = []
+    for dep in config["dependencies"]:
+        if not dep.get("backend_fn") or dep.get("queue") is False:
+            continue
+        name = dep["api_name"] or f"fn_index_{dep['id']}"
+        if only and name not in only:
+            continue
+        targets = dep.get("targets") or [[None, None]]
+        data = [values.get(i) for i in dep["inputs"]]
+        parameters = named.get(f"/{dep['api_name']}", {}).get("parameters", [])
+        for i, parameter in enumerate(parameters[: len(data)]):
+            example = parameter.get("example_input")
+            if example is not None and not isinstance(example, (dict, list)):
+                data[i] = example
+        events.append(
+            Event(
+                name=name,
+                fn_index=dep["id"],
+                trigger_id=targets[0][0],
+                data=data,
+            )
+        )
+    return events
+
+
+class Client:
+    """One simulated browser session: joins the queue and reads its event stream."""
+
+    def __init__(self, http: httpx.AsyncClient, api_url: str, stats: dict):
+        self.http = http
+        self.api_url = api_url
+        self.stats = stats
+        self.session_hash = uuid.uuid4().hex[:11]
+        self._pending: dict[str, tuple[Event, float, asyncio.Future]] = {}
+        self._started: dict[str, float] = {}
+        # Results that arrived before /queue/join returned their event id.
+        self._completed: dict[str, bool] = {}
+        self._reader: asyncio.Task | None = None
+
+    async def fire(self, event: Event) -> None:
+        stats = self.stats[event.name]
+        stats.sent += 1
+        sent = time.perf_counter()
+        try:
+            response = await self.http.post(
+                f"{self.api_url}/queue/join",
+                json={
+                    "data": event.data,
+                    "fn_index": event.fn_index,
+                    "trigger_id": event.trigger_id,
+                    "session_hash": self.session_hash,
+                    "event_data": None,
+                },
+            )
+            response.raise_for_status()
+        except httpx.HTTPError:
+            stats.failed += 1
+            return
+        event_id = response.json()["event_id"]
+        done = asyncio.get_running_loop().create_future()
+        self._pending[event_id] = (event, sent, done)
+        if event_id in self._completed:
+            self._finish(event_id, success=self._completed.pop(event_id))
+        elif self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        await done
+
+    async def _read(self) -> None:
+        # gradio closes a session's stream once none of its events are
+        # pending; events joined after that are picked up by a new stream.
+        while self._pending:
+            try:
+                async with self.http.stream(
+                    "GET",
+                    f"{self.api_url}/queue/data",
+                    params={"session_hash": self.session_hash},
+                ) as response:
+                    async for line in response.aiter_lines():
+                        if line.startswith("data:"):
+                            self._handle(orjson.loads(line[5:]))
+            except httpx.HTTPError:
+                for event_id in list(self._pending):
+                    self._finish(event_id, success=False)
+
+    def _handle(self, message: dict) -> None:
+        event_id = message.get("event_id")
+        if message.get("msg") == "process_starts":
+            self._started[event_id] = time.perf_counter()
+        elif message.get("msg") == "process_completed":
+            success = bool(message.get("success"))
+            if event_id in self._pending:
+                self._finish(event_id, success=success)
+            else:
+                # The session's stream can deliver an event's result before
+                # the join request that queued it has returned.
+                self._completed[event_id] = success
+
+    def _finish(self, event_id: str, success: bool) -> None:
+        event, sent, done = self._pending.pop(event_id)
+        started = self._started.pop(event_id, None)
+        stats = self.stats[event.name]
+        if success:
+            now = time.perf_counter()
+            stats.completed += 1
+            stats.latency.append(now - sent)
+            if started is not None:
+                stats.queue_wait.append(started - sent)
+        else:
+            stats.failed += 1
+        if not done.done():
+            done.set_result(None)
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+async def run(
+    url: str,
+    events: list[Event],
+    clients: int = DEFAULT_CLIENTS,
+    rate: float = DEFAULT_RATE,
+    duration: float = DEFAULT_DURATION,
+    http: httpx.AsyncClient | None = None,
+) -> dict:
+    """Fire `events` at `url` from `clients` sessions; returns the report."""
+    own_http = http is None
+    if own_http:
+        http = httpx.AsyncClient(
+            timeout=None, limits=httpx.Limits(max_connections=None)
+        )
+    stats = {event.name: EventStats() for event in events}
+    api_url = f"{url}/gradio_api"
+    sessions = [Client(http, api_url, stats) for _ in range(clients)]
+    fired = []
+    start = time.perf_counter()
+    try:
+        # Round-robin over clients and events, one every 1 / rate seconds.
+        for i, (client, event) in enumerate(
+            zip(itertools.cycle(sessions), itertools.cycle(events))
+        ):
+            at = start + i / rate
+            if at - start >= duration:
+                break
+            await asyncio.sleep(max(0.0, at - time.perf_counter()))
+            fired.append(asyncio.create_task(client.fire(event)))
+        elapsed = time.perf_counter() - start
+        _, unfinished = (
+            await asyncio.wait(fired, timeout=DRAIN_TIMEOUT) if fired else ((), ())
+        )
+        for task in unfinished:
+            task.cancel()
+    finally:
+        for client in sessions:
+            await client.close()
+        if own_http:
+            await http.aclose()
+    report = {
+        "clients": clients,
+        "rate": rate,
+        "duration": elapsed,
+        "unfinished": len(unfinished),
+        "events": {name: s.summary(elapsed) for name, s in stats.items()},
+    }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['clients']} clients, {report['rate']:g} events/s for "
+        f"{report['duration']:.1f} s; {report['unfinished']} unfinished"
+    )
+    columns = ["queue_wait", "latency"]
+    header = f"{'event':24} {'sent':>6} {'ok':>6} {'fail':>5} {'/s':>7}"
+    for column in columns:
+        header += "".join(f" {column[:5]} p{int(q * 100):<3}" for q in QUANTILES)
+    print(header + "  (ms)")
+    for name, s in report["events"].items():
+        line = (
+            f"{name:24} {s['sent']:6d} {s['completed']:6d} {s['failed']:5d} "
+            f"{s['throughput']:7.1f}"
+        )
+        for column in columns:
+            line += "".join(
+                f" {s[f'{column}_p{int(q * 100)}'] * 1000:10.1f}" for q in QUANTILES
+            )
+        print(line)
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    process = log_file = None
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url
+        if url is None:
+            app_file = (
+                args.target
+                if args.target.endswith(".py")
+                else generated_app(args.target, tmp)
+            )
+            port = args.port or free_port()
+            url = f"http://127.0.0.1:{port}"
+            log_file = os.path.join(tmp, "app.log")
+            process = launch(app_file, port, log_file)
+        try:
+            async with httpx.AsyncClient(
+                timeout=None, limits=httpx.Limits(max_connections=None)
+            ) as http:
+                url = url.rstrip("/")
+                config = await wait_until_ready(http, url, process, log_file)
+                info = (await http.get(f"{url}/gradio_api/info")).json()
+                events = discover_events(config, info, args.event)
+                if not events:
+                    raise SystemExit("The app has no event listeners to fire.")
+                return await run(
+                    url,
+                    events,
+                    clients=args.clients,
+                    rate=args.rate,
+                    duration=args.duration,
+                    http=http,
+                )
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Load-test the app generated from a sketch on localhost"
+    )
+    parser.add_argument(
+        "target",
+        nargs="?",
+        default="app.json",
+        help="Project file to generate the app from, or an app .py file "
+        "(default: app.json)",
+    )
+    parser.add_argument("--url", help="Test an app already running at this URL")
+    parser.add_argument("--port", type=int, help="Port for the launched app")
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=DEFAULT_CLIENTS,
+        help=f"Simulated sessions (default: {DEFAULT_CLIENTS})",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Events fired per second across all clients (default: {DEFAULT_RATE:g})",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=DEFAULT_DURATION,
+        help=f"Seconds to keep firing events (default: {DEFAULT_DURATION:g})",
+    )
+    parser.add_argument(
+        "--event",
+        action="append",
+        help="Only fire this event (its API name); may be repeated",
+    )
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(_main(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    failed = sum(s["failed"] for s in report["events"].values())
+    return 1 if failed or report["unfinished"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
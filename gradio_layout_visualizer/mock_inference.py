@@ -0,0 +1,193 @@
+"""Local stand-in for an OpenAI-compatible chat-completion endpoint.
+
+Streams a canned function back over server-sent events, the way the Hugging
+Face router does, so code generation can be exercised and timed offline:
+
+    python -m gradio_layout_visualizer.mock_inference --port 8765
+    GRADIO_LAYOUT_VISUALIZER_INFERENCE_URL=http://127.0.0.1:8765/v1 \\
+        gradio-visualizer app.py
+
+The generated function uses the header found in the prompt, so every
+dependency gets a plausible, distinct answer.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Self
+
+HEADER_PATTERN = re.compile(r"`(def [^`]*\):)`")
+
+
+def canned_response(messages: list[dict]) -> str:
+    prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+    match = HEADER_PATTERN.search(prompt)
+    header = match.group(1) if match else "def fn():"
+    return f"```python\n{header}\n    # Generated offline\n    return None\n```"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are not worth a traceback.
+        pass
+
+
+class MockCompletionServer:
+    """
+    Threaded HTTP server answering POST /v1/chat/completions.
+
+    `first_token_delay` is slept before the first chunk and `token_delay`
+    between chunks of `chunk_size` characters. `requests` counts completed
+    calls; `max_in_flight` records the highest number served at once.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_delay: float = 0.0,
+        token_delay: float = 0.0,
+        chunk_size: int = 4,
+    ):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> MockCompletionServer:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self._stream(payload)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                        server.requests += 1
+
+            def _stream(self, payload: dict):
+                text = canned_response(payload.get("messages", []))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(server.first_token_delay)
+                for i in range(0, len(text), server.chunk_size):
+                    if i:
+                        time.sleep(server.token_delay)
+                    self._event(
+                        {
+                            "id": "mock",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": payload.get("model", "mock"),
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "delta": {
+                                        "role": "assistant",
+                                        "content": text[i : i + server.chunk_size],
+                                    },
+                                    "finish_reason": None,
+                                }
+                            ],
+                        }
+                    )
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _event(self, data: dict):
+                self._chunk(f"data: {json.dumps(data)}\n\n".encode())
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve canned chat completions for offline code generation"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--first-token-delay",
+        type=float,
+        default=0.2,
+        help="Seconds before the first chunk (default: 0.2)",
+    )
+    parser.add_argument(
+        "--token-delay",
+        type=float,
+        default=0.01,
+        help="Seconds between chunks (default: 0.01)",
+    )
+    args = parser.parse_args(argv)
+
+    server = MockCompletionServer(
+        args.host, args.port, args.first_token_delay, args.token_delay
+    )
+    print(f"Serving mock chat completions at {server.url}/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
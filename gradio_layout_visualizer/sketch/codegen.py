@@ -0,0 +1,347 @@
+"""Incremental generation of the app file shown in the "Generated File" panel.
+
+`CodeEmitter` keeps one source fragment per component, container and
+dependency. Containers are cached by the layout's frozen tuples, so only
+containers whose structure changed are re-joined, and components are only
+re-formatted when the handler reports an edit to them (`CodeEmitter.touch`).
+The file is assembled with `str.join` rather than repeated concatenation.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+
+INDENT = "    "
+HEADER = "import gradio as gr\n\nwith gr.Blocks() as demo:\n"
+FOOTER = "\ndemo.launch()"
+
+# Keyword arguments of event listeners that a function can set, with
+# gradio's defaults. Dependencies store only the ones that differ.
+EVENT_OPTIONS = {
+    "concurrency_limit": "default",
+    "concurrency_id": None,
+    "queue": True,
+    "batch": False,
+    "max_batch_size": 4,
+    "trigger_mode": None,
+    "stream_every": 0.5,
+}
+
+# Keyword arguments of `demo.queue`, as stored in `Project.queue`.
+QUEUE_OPTIONS = {
+    "default_concurrency_limit": "not_set",
+    "max_size": None,
+}
+
+
+def format_kwarg_value(value: Any) -> str:
+    if isinstance(value, str):
+        return f'"{value}"'.replace("\n", "\\n")
+    return f"{value}"
+
+
+def render_component_line(
+    component_name: str, kwargs: dict, var_name: str, depth: int
+) -> str:
+    args = ", ".join(f"{k}={format_kwarg_value(v)}" for k, v in kwargs.items())
+    return f"{INDENT * depth}{var_name} = gr.{component_name}({args})\n"
+
+
+def render_container_line(is_column: bool, depth: int) -> str:
+    return f"{INDENT * depth}with gr.{'Column' if is_column else 'Row'}():\n"
+
+
+def non_default(options: dict, defaults: dict) -> dict:
+    """The known options that differ from their defaults, in the defaults' order."""
+    return {
+        key: options[key]
+        for key in defaults
+        if key in options and options[key] != defaults[key]
+    }
+
+
+def render_kwargs(options: dict | None, defaults: dict) -> str:
+    return "".join(
+        f", {key}={format_kwarg_value(value)}"
+        for key, value in non_default(options or {}, defaults).items()
+    )
+
+
+def render_footer(queue: dict | None) -> str:
+    kwargs = render_kwargs(queue, QUEUE_OPTIONS)
+    if not kwargs:
+        return FOOTER
+    return f"\ndemo.queue({kwargs[2:]})" + FOOTER
+
+
+def is_batched(dep: list) -> bool:
+    """
+    Whether `dep` is generated as a batch function.
+
+    Gradio sizes a batch by the function's first input, so a function
+    without inputs cannot be batched and is generated unbatched instead.
+    """
+    return bool(dep[7] and dep[7].get("batch") and dep[1])
+
+
+def placeholder_return(output_count: int, batch_input: str | None = None) -> str:
+    """
+    The return statement of a function without code, one `...` per output.
+
+    A batched function returns one list per output, as long as its input
+    list `batch_input`, and as a tuple even when there is only one output,
+    which is what gradio expects of them.
+    """
+    if batch_input is None:
+        return "return " + ", ".join(["..."] * output_count)
+    values = ", ".join([f"[...] * len({batch_input})"] * output_count)
+    return f"return ({values},)" if output_count == 1 else f"return {values}"
+
+
+def render_dependency(dep: list, components: dict) -> str:
+    triggers = [components[c][2] + "." + t for c, t in dep[0]]
+    inputs = [components[c][2] for c in dep[1]]
+    outputs = [components[c][2] for c in dep[2]]
+    fn_name = dep[3]
+    if dep[5] is not None:
+        fn_code = dep[5].replace("\n", "\n    ")
+    else:
+        batch = is_batched(dep)
+        params = [f"{name}: list" for name in inputs] if batch else inputs
+        fn_code = f"""def {fn_name}({", ".join(params)}):
+        ...
+        {placeholder_return(len(outputs), inputs[0] if batch else None)}"""
+
+    options = dict(dep[7] or {})
+    if not is_batched(dep):
+        options.pop("batch", None)
+        options.pop("max_batch_size", None)
+    options = render_kwargs(options, EVENT_OPTIONS)
+
+    return f"""
+    @{triggers[0] + "(" if len(triggers) == 1 else "gr.on([" + ", ".join(triggers) + "], "}inputs=[{", ".join(inputs)}], outputs=[{", ".join(outputs)}]{options})
+    {fn_code}
+"""
+
+
+class _Block:
+    """Cached source of one container: its line, then its children's fragments."""
+
+    __slots__ = ("depth", "frozen", "index", "parts", "stale", "text")
+
+    def __init__(self, frozen: tuple, depth: int, parts: list[str], index: dict):
+        self.frozen = frozen
+        self.depth = depth
+        self.parts = parts
+        # Child key (component id, or id() of a container's tuple) -> part.
+        self.index = index
+        # Parts of child containers that changed since `text` was joined.
+        self.stale: set[int] = set()
+        self.text: str | None = "".join(parts)
+
+
+class CodeEmitter:
+    """
+    Incremental code generator for one sketch.
+
+    The layout is walked as `LayoutTree.freeze` tuples. A container's tuple
+    is kept until an edit below it changes the structure, so each tuple keys
+    the cached source of its container (`_Block`). Changes to a component's
+    name, kwargs or var name leave the tuples alone; the handler reports them
+    through `touch`, and `emit` re-formats just those lines and splices them
+    into their ancestors' cached parts. Functions are only re-rendered after
+    `touch_functions`, and then each one is looked up by what it renders
+    from. Python-level work per emit is therefore proportional to the edit
+    and its depth, not to the sketch; only the final `str.join` of the file
+    copies the whole text. A different `LayoutTree` object, as undo
+    produces, starts the caches over.
+    """
+
+    def __init__(self):
+        self._layout: LayoutTree | None = None
+        # Component id -> (depth, line).
+        self._leaves: dict[int, tuple[int, str]] = {}
+        # id() of a container's frozen tuple -> its block.
+        self._blocks: dict[int, _Block] = {}
+        self._dirty: set[int] = set()
+        self._deps: dict[tuple, str] = {}
+        self._dependencies: list | None = None
+        self._functions: list[str] = []
+        self._functions_dirty = True
+        self._parts: tuple = ()
+        self.last_code: str | None = None
+
+    def touch(self, component_id: int) -> None:
+        """Note that a component's name, kwargs or var name changed."""
+        self._dirty.add(component_id)
+
+    def touch_functions(self) -> None:
+        """Note that a function, or a var name a function uses, changed."""
+        self._functions_dirty = True
+
+    def _leaf(self, component_id: int, components: dict, depth: int) -> str:
+        cached = self._leaves.get(component_id)
+        if cached is not None and cached[0] == depth:
+            return cached[1]
+        component_name, kwargs, var_name = components[component_id]
+        line = render_component_line(component_name, kwargs, var_name, depth)
+        self._leaves[component_id] = (depth, line)
+        return line
+
+    def _block(self, frozen: tuple, depth: int, components: dict) -> str:
+        block = self._blocks.get(id(frozen))
+        if block is not None and block.frozen is frozen and block.depth == depth:
+            if block.text is None:
+                offset = 0 if depth == 0 else 1
+                for part in block.stale:
+                    block.parts[part] = self._block(
+                        frozen[part - offset], depth + 1, components
+                    )
+                block.stale.clear()
+                block.text = "".join(block.parts)
+            return block.text
+        # Rows and columns alternate, starting with the root column.
+        parts = [] if depth == 0 else [render_container_line(depth % 2 == 0, depth)]
+        index = {}
+        for element in frozen:
+            if isinstance(element, tuple):
+                index[id(element)] = len(parts)
+                parts.append(self._block(element, depth + 1, components))
+            else:
+                index[element] = len(parts)
+                parts.append(self._leaf(element, components, depth + 1))
+        block = _Block(frozen, depth, parts, index)
+        self._blocks[id(frozen)] = block
+        return block.text
+
+    def _splice(self, layout: LayoutTree, component_id: int, components: dict):
+        """Re-format a touched component and mark its ancestors' text stale."""
+        cached = self._leaves.pop(component_id, None)
+        if component_id not in layout or cached is None:
+            return
+        line = self._leaf(component_id, components, cached[0])
+        if line == cached[1]:
+            return
+        node, key = layout.node(component_id), component_id
+        parent = node.parent
+        block = self._blocks.get(id(parent.frozen))
+        if block is None or block.frozen is not parent.frozen:
+            return
+        block.parts[block.index[key]] = line
+        block.text = None
+        while parent.parent is not None:
+            key, parent = id(parent.frozen), parent.parent
+            block = self._blocks.get(id(parent.frozen))
+            if block is None or block.frozen is not parent.frozen:
+                return
+            part = block.index[key]
+            if part in block.stale:
+                return
+            block.stale.add(part)
+            block.text = None
+
+    def _prune(self, root: tuple, components: dict) -> None:
+        # Blocks of replaced tuples and lines of deleted components are only
+        # dropped once they make up half the cache, keeping `emit` amortized
+        # O(1) in the size of the sketch.
+        if len(self._leaves) > 2 * len(components) + 16:
+            self._leaves = {k: v for k, v in self._leaves.items() if k in components}
+        # Every container holds at least two nodes, so there are fewer
+        # containers than components.
+        if len(self._blocks) > 2 * len(components) + 16:
+            live = {}
+            stack = [root]
+            while stack:
+                frozen = stack.pop()
+                if id(frozen) in self._blocks:
+                    live[id(frozen)] = self._blocks[id(frozen)]
+                stack.extend(e for e in frozen if isinstance(e, tuple))
+            self._blocks = live
+
+    def _dependency(self, dep: list, components: dict, used_deps: dict) -> str:
+        key = (
+            tuple((components[c][2], t) for c, t in dep[0]),
+            tuple(components[c][2] for c in dep[1]),
+            tuple(components[c][2] for c in dep[2]),
+            dep[3],
+            dep[5],
+            tuple(non_default(dep[7] or {}, EVENT_OPTIONS).items()),
+        )
+        fragment = self._deps.get(key)
+        if fragment is None:
+            fragment = render_dependency(dep, components)
+        used_deps[key] = fragment
+        return fragment
+
+    def _assemble(
+        self,
+        layout: LayoutTree,
+        components: dict,
+        dependencies: list,
+        queue: dict | None,
+    ) -> tuple[str, list[str], str]:
+        if layout is not self._layout:
+            self._layout = layout
+            self._leaves.clear()
+            self._blocks.clear()
+            self._dirty.clear()
+            self._functions_dirty = True
+        root = layout.freeze()
+        dirty, self._dirty = self._dirty, set()
+        for component_id in dirty:
+            self._splice(layout, component_id, components)
+        body = self._block(root, 0, components)
+        if self._functions_dirty or dependencies is not self._dependencies:
+            self._functions_dirty = False
+            self._dependencies = dependencies
+            used_deps: dict = {}
+            self._functions = [
+                self._dependency(dep, components, used_deps) for dep in dependencies
+            ]
+            self._deps = used_deps
+        self._prune(root, components)
+        return body, self._functions, render_footer(queue)
+
+    def emit(
+        self,
+        layout: LayoutTree,
+        components: dict,
+        dependencies: list,
+        queue: dict | None = None,
+    ) -> str:
+        self._parts = self._assemble(layout, components, dependencies, queue)
+        body, functions, footer = self._parts
+        self.last_code = "".join([HEADER, body, *functions, footer])
+        return self.last_code
+
+    def emit_if_changed(
+        self,
+        layout: LayoutTree,
+        components: dict,
+        dependencies: list,
+        queue: dict | None = None,
+    ) -> str | None:
+        """
+        Return the new code, or None if it is identical to the last emit.
+
+        Unchanged parts are the same cached objects, so an emit with nothing
+        touched is detected without joining or comparing any text.
+        """
+        previous = self._parts
+        parts = self._parts = self._assemble(layout, components, dependencies, queue)
+        if (
+            self.last_code is not None
+            and previous
+            and parts[0] is previous[0]
+            and parts[1] is previous[1]
+            and parts[2] == previous[2]
+        ):
+            return None
+        body, functions, footer = parts
+        code = "".join([HEADER, body, *functions, footer])
+        if code == self.last_code:
+            return None
+        self.last_code = code
+        return code
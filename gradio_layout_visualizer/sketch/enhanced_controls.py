@@ -53,7 +53,18 @@ def get_param_type_info(component_class: type, param_name: str) -> dict[str, Any
     if param_name not in sig.parameters:
         return {"control_type": "textbox", "options": {}}
 
-    param = sig.parameters[param_name]
+    return get_param_info_from_parameter(param_name, sig.parameters[param_name])
+
+
+def get_param_info_from_parameter(
+    param_name: str, param: inspect.Parameter
+) -> dict[str, Any]:
+    """
+    Same as get_param_type_info, but for an already resolved signature parameter.
+
+    Lets callers that walk a whole signature (e.g. the component registry)
+    classify every parameter from a single inspect.signature call.
+    """
     annotation = param.annotation
     default_value = param.default if param.default is not inspect.Parameter.empty else None
 
@@ -0,0 +1,146 @@
+"""Content-addressed cache of generated function code.
+
+A generation is keyed by a hash of the model name and the fully built chat
+history sent to it (prompt, function header, input/output component types
+and configs, earlier turns), so pressing "Generate Code" again for an
+identical request replays the stored code instead of calling the model.
+
+Entries live in a bounded in-memory LRU and, below it, as one JSON file per
+key under the user cache directory, so they survive restarts and are shared
+by every designer served from the same machine. Only generations that
+streamed to completion are stored.
+
+Set GRADIO_LAYOUT_VISUALIZER_GENERATION_CACHE=0 (or `--no-generation-cache`)
+to always call the model.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from gradio_layout_visualizer.sketch.metrics import register_stats
+from gradio_layout_visualizer.sketch.paths import get_cache_dir
+
+GENERATION_CACHE_ENV = "GRADIO_LAYOUT_VISUALIZER_GENERATION_CACHE"
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def generation_cache_enabled() -> bool:
+    return os.getenv(GENERATION_CACHE_ENV, "1").lower() not in ("0", "false", "no")
+
+
+def generation_key(model: str, chat_history: list[dict]) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": chat_history}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier (memory LRU, then disk) store of generated code by key.
+
+    `directory=None` keeps the cache in memory only. Disk errors are ignored,
+    the same as for the schema cache: a cache that cannot be written just
+    misses.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        directory: str | None = None,
+        enabled: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, code: str) -> None:
+        self._memory[key] = code
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            code = self._memory.get(key)
+            if code is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return code
+        code = self._read(key)
+        with self._lock:
+            if code is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+                self._remember(key, code)
+        return code
+
+    def put(self, key: str, code: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remember(key, code)
+        self._write(key, code)
+
+    def _read(self, key: str) -> str | None:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)["code"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write(self, key: str, code: str) -> None:
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"code": code}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+            }
+
+
+generation_cache = GenerationCache(
+    directory=os.path.join(get_cache_dir(), "generations"),
+    enabled=generation_cache_enabled(),
+)
+register_stats("generation_cache", generation_cache.stats)
@@ -0,0 +1,393 @@
+"""Undo/redo history of a sketch.
+
+Handlers edit the layout and component table in place, so keeping deep
+copies for undo would cost the whole project per step. Instead every edit
+recorded in the journal (see `journal.apply_op`) is also applied to a
+private replica of the project, and the history stores immutable versions
+of it that share everything an edit did not touch:
+
+- the layout as `LayoutTree.freeze` tuples, where an edit rebuilds only the
+  edited node's ancestors;
+- the component table as a 32-way trie over component ids, where an edit
+  copies one path of at most a few 32-slot nodes plus the edited entries;
+- the functions as a tuple of per-function copies, where an edit copies the
+  one function it changed;
+- the app's queue settings as a dict, replaced when they change.
+
+A step therefore costs memory in proportion to the edit rather than to the
+project. The budget is 64 MiB for `DEFAULT_MAX_STEPS` (10,000) steps on a
+1,000-component sketch. Typical edits retain about 1.8 KiB a step, 17 MiB
+in all, as reported on the "undo history" line of
+
+    python -m gradio_layout_visualizer.bench --sizes 10
+
+Undo and redo rebuild the live project from a version, in time linear in
+its size.
+
+Every session has its own history, kept by `SessionStore` next to the
+session's project and forked from the history of the project loaded at
+startup on the session's first edit, so undo only ever steps back through
+that session's own edits.
+"""
+
+from __future__ import annotations
+
+import copy
+import sys
+import threading
+from collections import deque
+from collections.abc import Iterator
+from itertools import compress, zip_longest
+from operator import is_not
+from typing import Any, NamedTuple
+
+from gradio_layout_visualizer.sketch.journal import apply_op
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import Project
+
+DEFAULT_MAX_STEPS = 10_000
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_NODE_BYTES = sys.getsizeof((None,) * _WIDTH)
+
+
+class ComponentTable:
+    """
+    Immutable map from component id to a frozen component entry.
+
+    Component ids are small, dense integers, so the table is a trie of
+    32-slot tuples indexed by the id's bits. `set` returns a new table that
+    shares every branch except the path to the changed id.
+    """
+
+    __slots__ = ("_root", "_shift")
+
+    def __init__(self, root: tuple | None = None, shift: int = 0):
+        self._root = root
+        self._shift = shift
+
+    @classmethod
+    def from_dict(cls, components: dict[int, Any]) -> ComponentTable:
+        table = cls()
+        for component_id, entry in components.items():
+            table = table.set(component_id, entry)
+        return table
+
+    def get(self, key: int) -> Any:
+        if key < 0 or key >> (self._shift + _BITS):
+            return None
+        node, shift = self._root, self._shift
+        while node is not None and shift > 0:
+            node, shift = node[(key >> shift) & _MASK], shift - _BITS
+        return None if node is None else node[key & _MASK]
+
+    def set(self, key: int, value: Any) -> ComponentTable:
+        """A table with `key` mapped to `value`; None removes it."""
+        root, shift = self._root, self._shift
+        while key >> (shift + _BITS):
+            root = None if root is None else (root,) + (None,) * (_WIDTH - 1)
+            shift += _BITS
+        return ComponentTable(_assoc(root, shift, key, value), shift)
+
+    def items(self) -> Iterator[tuple[int, Any]]:
+        stack = [(self._root, self._shift, 0)]
+        while stack:
+            node, shift, prefix = stack.pop()
+            if node is None:
+                continue
+            for i in reversed(range(_WIDTH)):
+                child = node[i]
+                if child is None:
+                    continue
+                key = prefix | (i << shift)
+                if shift == 0:
+                    yield key, child
+                else:
+                    stack.append((child, shift - _BITS, key))
+
+    def changed(self, other: ComponentTable) -> list[int]:
+        """Ids whose entries differ between the two tables, skipping shared branches."""
+        a, b = _lift(self, other._shift), _lift(other, self._shift)
+        keys = []
+        stack = [(a._root, b._root, a._shift, 0)]
+        while stack:
+            x, y, shift, prefix = stack.pop()
+            if x is y:
+                continue
+            for i in range(_WIDTH):
+                cx = None if x is None else x[i]
+                cy = None if y is None else y[i]
+                if cx is cy:
+                    continue
+                key = prefix | (i << shift)
+                if shift == 0:
+                    keys.append(key)
+                else:
+                    stack.append((cx, cy, shift - _BITS, key))
+        return keys
+
+    def added_bytes(self, keys: list[int]) -> int:
+        """Approximate size of what `set`ting `keys` allocated."""
+        total = len(keys) * (self._shift // _BITS + 1) * _NODE_BYTES
+        for key in keys:
+            entry = self.get(key)
+            if entry is not None:
+                # Counts the kwargs' values as new, which most edits' are not.
+                kwargs = entry[1]
+                total += sys.getsizeof(entry) + sys.getsizeof(kwargs)
+                total += sum(map(sys.getsizeof, kwargs.values()))
+        return total
+
+
+def _assoc(node: tuple | None, shift: int, key: int, value: Any) -> tuple:
+    slots = list(node) if node is not None else [None] * _WIDTH
+    i = (key >> shift) & _MASK
+    slots[i] = value if shift == 0 else _assoc(slots[i], shift - _BITS, key, value)
+    return tuple(slots)
+
+
+def _lift(table: ComponentTable, shift: int) -> ComponentTable:
+    root, own = table._root, table._shift
+    while own < shift:
+        root = None if root is None else (root,) + (None,) * (_WIDTH - 1)
+        own += _BITS
+    return ComponentTable(root, own)
+
+
+class Version(NamedTuple):
+    layout: tuple
+    components: ComponentTable
+    dependencies: tuple
+    queue: dict
+    # What the version added to the one it was recorded over; see `_added_bytes`.
+    nbytes: int = 0
+
+
+def _added_bytes(old: Any, new: Any) -> int:
+    """
+    Approximate size of the objects in `new` that are not shared with `old`.
+
+    Descends only into the children that are not shared, pairing them with
+    those of `old` in order, so it costs about as much as the edit that made
+    `new` did. The scans run in C, as layout containers can have hundreds of
+    children.
+    """
+    if new is old:
+        return 0
+    total = sys.getsizeof(new)
+    if isinstance(new, dict):
+        if not isinstance(old, dict):
+            old = {}
+        keys = [key for key in new if new[key] is not old.get(key)]
+        pairs = zip(map(old.get, keys), map(new.__getitem__, keys))
+    elif isinstance(new, (tuple, list)):
+        if not isinstance(old, (tuple, list)):
+            old = ()
+        # Edits change a run of children: skip the shared ends.
+        shortest = min(len(old), len(new))
+        start = next(compress(range(shortest), map(is_not, old, new)), shortest)
+        end = next(
+            compress(
+                range(shortest - start), map(is_not, reversed(old), reversed(new))
+            ),
+            shortest - start,
+        )
+        pairs = zip_longest(old[start : len(old) - end], new[start : len(new) - end])
+    else:
+        return total
+    for old_child, child in pairs:
+        if child is not None and child is not old_child:
+            total += _added_bytes(old_child, child)
+    return total
+
+
+def _freeze_entry(entry: list) -> tuple:
+    name, kwargs, var_name = entry
+    return (name, copy.deepcopy(kwargs), var_name)
+
+
+def _thaw_entry(entry: tuple) -> list:
+    name, kwargs, var_name = entry
+    return [name, copy.deepcopy(kwargs), var_name]
+
+
+class History:
+    """
+    Undo and redo stacks of project versions.
+
+    `record` is called with every journaled edit, after the handler applied
+    it; `merge=True` folds the edit into the previous step. `undo` and
+    `redo` move between versions and return the journal operations that
+    turn the previous version into the restored one; `project` then gives a
+    fresh, mutable copy of the restored version for the session.
+    """
+
+    def __init__(self, max_steps: int = DEFAULT_MAX_STEPS):
+        self.max_steps = max_steps
+        self._lock = threading.Lock()
+        self.reset(Project())
+
+    def reset(self, project: Project) -> None:
+        """Start over from `project`, which is copied."""
+        replica = copy.deepcopy(project)
+        with self._lock:
+            self._replica = replica
+            self._current = Version(
+                replica.layout.freeze(),
+                ComponentTable.from_dict(
+                    {k: _freeze_entry(v) for k, v in replica.components.items()}
+                ),
+                tuple(copy.deepcopy(dep) for dep in replica.dependencies),
+                dict(replica.queue),
+            )
+            self._undo: deque[Version] = deque(maxlen=self.max_steps)
+            self._redo: list[Version] = []
+            self.revision = 0
+            # Sum of `Version.nbytes` over the versions held: the memory the
+            # steps take on top of the project they started from.
+            self.nbytes = 0
+
+    def fork(self) -> History:
+        """An independent history that starts with this one's versions and steps."""
+        forked = History.__new__(History)
+        forked.max_steps = self.max_steps
+        forked._lock = threading.Lock()
+        with self._lock:
+            # Versions are immutable, so the copies share them.
+            forked._replica = copy.deepcopy(self._replica)
+            forked._current = self._current
+            forked._undo = deque(self._undo, maxlen=self.max_steps)
+            forked._redo = list(self._redo)
+            forked.revision = self.revision
+            forked.nbytes = self.nbytes
+        return forked
+
+    def __getstate__(self) -> dict[str, Any]:
+        with self._lock:
+            state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, op: dict[str, Any], merge: bool = False) -> None:
+        with self._lock:
+            replica = self._replica
+            changed = apply_op(replica, op)
+            components = self._current.components
+            for component_id in changed:
+                entry = replica.components.get(component_id)
+                components = components.set(
+                    component_id, None if entry is None else _freeze_entry(entry)
+                )
+            dependencies = self._current.dependencies
+            kind = op["op"]
+            if kind == "set_dependency":
+                index = op["index"]
+                dependencies = (
+                    dependencies[:index]
+                    + (copy.deepcopy(replica.dependencies[index]),)
+                    + dependencies[index + 1 :]
+                )
+            elif kind == "delete_dependency":
+                dependencies = (
+                    dependencies[: op["index"]] + dependencies[op["index"] + 1 :]
+                )
+            elif kind == "set_dependencies":
+                dependencies = tuple(copy.deepcopy(d) for d in replica.dependencies)
+            queue = dict(replica.queue) if kind == "set_queue" else self._current.queue
+            current = self._current
+            layout = replica.layout.freeze()
+            added = (
+                _added_bytes(current.layout, layout)
+                + components.added_bytes(changed)
+                + _added_bytes(current.dependencies, dependencies)
+                + _added_bytes(current.queue, queue)
+            )
+            if merge:
+                added += current.nbytes
+                self.nbytes -= current.nbytes
+            else:
+                if len(self._undo) == self.max_steps:
+                    # The oldest step falls off the deque.
+                    self.nbytes -= (self._undo or [current])[0].nbytes
+                self._undo.append(current)
+            self.nbytes -= sum(version.nbytes for version in self._redo)
+            self._redo.clear()
+            self._current = Version(layout, components, dependencies, queue, added)
+            self.nbytes += added
+            self.revision += 1
+
+    def _move(self, source: list | deque, target: list | deque) -> list[dict] | None:
+        with self._lock:
+            if not source:
+                return None
+            previous = self._current
+            target.append(previous)
+            self._current = source.pop()
+            self._replica = self._thaw(self._current)
+            self.revision += 1
+            return _diff(previous, self._current)
+
+    def undo(self) -> list[dict] | None:
+        """Step back; None if there is nothing to undo."""
+        return self._move(self._undo, self._redo)
+
+    def redo(self) -> list[dict] | None:
+        """Step forward again; None if there is nothing to redo."""
+        return self._move(self._redo, self._undo)
+
+    def _thaw(self, version: Version) -> Project:
+        return Project(
+            # Seeded with the version's tuples, so later versions keep sharing them.
+            layout=LayoutTree.from_list(version.layout),
+            components={k: _thaw_entry(v) for k, v in version.components.items()},
+            dependencies=[copy.deepcopy(dep) for dep in version.dependencies],
+            queue=dict(version.queue),
+            # Ids are never reused, even for components an undo took away.
+            next_component_id=self._replica.next_component_id,
+        )
+
+    def project(self) -> Project:
+        """A mutable copy of the current version."""
+        with self._lock:
+            return self._thaw(self._current)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "undo_steps": len(self._undo),
+                "redo_steps": len(self._redo),
+                "bytes": self.nbytes,
+            }
+
+
+def _diff(old: Version, new: Version) -> list[dict]:
+    """Journal operations that turn `old` into `new`."""
+    ops = []
+    if old.layout is not new.layout:
+        ops.append({"op": "set_layout", "layout": new.layout})
+    for component_id in old.components.changed(new.components):
+        entry = new.components.get(component_id)
+        if entry is None:
+            ops.append({"op": "delete_component", "id": component_id})
+        else:
+            name, kwargs, var_name = entry
+            ops.append(
+                {
+                    "op": "put_component",
+                    "id": component_id,
+                    "name": name,
+                    "kwargs": kwargs,
+                    "var_name": var_name,
+                }
+            )
+    if old.dependencies is not new.dependencies:
+        ops.append({"op": "set_dependencies", "dependencies": list(new.dependencies)})
+    if old.queue is not new.queue:
+        ops.append({"op": "set_queue", "queue": new.queue})
+    return ops
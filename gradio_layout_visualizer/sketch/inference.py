@@ -0,0 +1,208 @@
+"""Pooled inference clients for code generation.
+
+`ai()` used to construct a new `huggingface_hub.InferenceClient` for every
+generation. Clients are now checked out of a process-wide `ClientPool`, keyed
+by token and model, and returned to it afterwards so their state (headers,
+provider resolution, the underlying HTTP session) is reused by the next
+`generate` call. Idle clients are evicted after `idle_timeout` seconds and at
+most `max_idle` are kept. `async_client_pool` does the same for the
+`AsyncInferenceClient`s used by `ai_async`.
+
+Set GRADIO_LAYOUT_VISUALIZER_INFERENCE_URL (or `--inference-url`) to send
+chat completions to an OpenAI-compatible server instead of the Hugging Face
+router, e.g. the stand-in server in `gradio_layout_visualizer.mock_inference`.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any
+
+import huggingface_hub
+
+from gradio_layout_visualizer.sketch.metrics import register_stats
+
+INFERENCE_URL_ENV = "GRADIO_LAYOUT_VISUALIZER_INFERENCE_URL"
+
+DEFAULT_MAX_IDLE = 8
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_MAX_USES = 64
+
+
+def get_inference_url() -> str | None:
+    return os.getenv(INFERENCE_URL_ENV) or None
+
+
+class ClientPool:
+    """
+    Thread-safe pool of `InferenceClient`s keyed by (token, model, base URL).
+
+    A checked-out client is used by one generation at a time. On return its
+    finished responses are released and it is kept for reuse until it has
+    been idle for `idle_timeout` seconds or the pool holds more than
+    `max_idle` idle clients, oldest first.
+    """
+
+    client_class = huggingface_hub.InferenceClient
+
+    def __init__(
+        self,
+        max_idle: int = DEFAULT_MAX_IDLE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        base_url: str | None = None,
+    ):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._idle: dict[tuple, list[tuple[float, Any]]] = {}
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def _key(self, token: str | None, model: str) -> tuple:
+        return (token, model, self.base_url or get_inference_url())
+
+    def _create(self, key: tuple) -> Any:
+        token, model, base_url = key
+        if base_url is not None:
+            return self.client_class(base_url=base_url, token=token)
+        return self.client_class(model=model, token=token)
+
+    def _evict_expired(self, now: float) -> list:
+        expired = []
+        for key in list(self._idle):
+            fresh = []
+            for last_used, client in self._idle[key]:
+                if now - last_used > self.idle_timeout:
+                    expired.append(client)
+                else:
+                    fresh.append((last_used, client))
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                del self._idle[key]
+        while self.idle_count() > self.max_idle:
+            oldest = min(self._idle, key=lambda k: self._idle[k][0][0])
+            expired.append(self._idle[oldest].pop(0)[1])
+            if not self._idle[oldest]:
+                del self._idle[oldest]
+        self.evicted += len(expired)
+        return expired
+
+    def idle_count(self) -> int:
+        return sum(len(clients) for clients in self._idle.values())
+
+    def _checkout(self, key: tuple) -> tuple[Any, list]:
+        with self._lock:
+            expired = self._evict_expired(time.monotonic())
+            clients = self._idle.get(key)
+            client = clients.pop()[1] if clients else None
+            if clients is not None and not clients:
+                del self._idle[key]
+            if client is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        return (client if client is not None else self._create(key)), expired
+
+    def _checkin(self, key: tuple, client: Any) -> list:
+        with self._lock:
+            self._idle.setdefault(key, []).append((time.monotonic(), client))
+            return self._evict_expired(time.monotonic())
+
+    @contextmanager
+    def client(
+        self, token: str | None, model: str
+    ) -> Iterator[huggingface_hub.InferenceClient]:
+        key = self._key(token, model)
+        client, expired = self._checkout(key)
+        for stale in expired:
+            stale.close()
+        try:
+            yield client
+        finally:
+            # Closing only releases the responses this client streamed; the
+            # client itself stays usable.
+            client.close()
+            for stale in self._checkin(key, client):
+                stale.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            clients = [c for entries in self._idle.values() for _, c in entries]
+            self._idle.clear()
+        for client in clients:
+            client.close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "idle": self.idle_count(),
+            }
+
+
+class AsyncClientPool(ClientPool):
+    """
+    Pool of `AsyncInferenceClient`s, for `ai_async`.
+
+    Each async client owns its HTTP connection pool, so returned clients are
+    kept open rather than closed. As they keep a handle on every response
+    they streamed, a client is closed and replaced after `max_uses`
+    generations.
+    """
+
+    client_class = huggingface_hub.AsyncInferenceClient
+
+    def __init__(self, *args, max_uses: int = DEFAULT_MAX_USES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_uses = max_uses
+        self._uses: dict[int, int] = {}
+
+    def _evict_expired(self, now: float) -> list:
+        expired = super()._evict_expired(now)
+        for client in expired:
+            self._uses.pop(id(client), None)
+        return expired
+
+    @asynccontextmanager
+    async def client(
+        self, token: str | None, model: str
+    ) -> AsyncIterator[huggingface_hub.AsyncInferenceClient]:
+        key = self._key(token, model)
+        client, expired = self._checkout(key)
+        for stale in expired:
+            await stale.close()
+        try:
+            yield client
+        finally:
+            with self._lock:
+                uses = self._uses.pop(id(client), 0) + 1
+                if uses < self.max_uses:
+                    self._uses[id(client)] = uses
+            if uses < self.max_uses:
+                expired = self._checkin(key, client)
+            else:
+                expired = [client]
+            for stale in expired:
+                await stale.close()
+
+    def clear(self) -> None:
+        # Async clients can only be closed from the event loop; dropping them
+        # lets their connections be garbage collected.
+        with self._lock:
+            self._idle.clear()
+            self._uses.clear()
+
+
+client_pool = ClientPool()
+async_client_pool = AsyncClientPool()
+register_stats("client_pool", client_pool.stats)
+register_stats("async_client_pool", async_client_pool.stats)
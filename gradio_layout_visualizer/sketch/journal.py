@@ -0,0 +1,428 @@
+"""Append-only journal of sketch edits.
+
+"Save & Render" writes the whole project, so edits made since the last save
+used to be lost when the process stopped. Every edit is now also appended as
+one small JSON line to `<config file>.journal`:
+
+    {"op": "add", "id": 3, "name": "Textbox", "kwargs": {...}, ...}
+    {"op": "set_kwarg", "id": 3, "key": "label", "value": "Name"}
+    {"op": "remove", "node": [3, 0]}
+
+On startup the journal is replayed over the project file. Once it holds
+`compact_every` operations it is folded into the project file in the
+background and truncated, and "Save & Render" drops the lines its snapshot
+covers, so the journal stays short and persisting an edit costs
+a single line however large the project is.
+
+Layout nodes are referred to by `LayoutTree.ref` rather than by node id, as
+container ids are not preserved when a project is reloaded.
+
+Every session edits its own copy of the project, so the journal follows one
+session at a time: the one that recorded or saved last. A session that takes
+over from another first appends its whole project as one `set_project` line,
+and its edits continue from there, so replaying the journal always yields
+the project of the session that edited last. The first session to edit
+after startup takes over without one, as it started from the replayed file.
+
+A takeover costs a line the size of the project, and a snapshot of it is
+then folded into the project file like a "Save & Render" checkpoint, which
+drops that line again. `set_project` lines do not count towards
+`compact_every`, so two tabs edited in turns pay one project-sized write per
+switch, coalesced by the background writer, rather than compacting the
+journal every few switches.
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from typing import Any
+
+import orjson
+
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import (
+    Project,
+    decode_project,
+    encode_project,
+    load_project,
+    normalize_dependency,
+    project_encoding,
+)
+from gradio_layout_visualizer.sketch.storage import (
+    BackgroundWriter,
+    write_if_changed,
+)
+
+JOURNAL_SUFFIX = ".journal"
+
+DEFAULT_COMPACT_EVERY = 500
+
+# How every `set_project` line starts, as `orjson` keeps the key order.
+_SET_PROJECT = b'{"op":"set_project",'
+
+
+def journal_path(config_file: str) -> str:
+    return config_file + JOURNAL_SUFFIX
+
+
+def apply_op(project: Project, op: dict[str, Any]) -> list[int]:
+    """Apply one journaled edit to `project` in place; returns the component ids it changed."""
+    kind = op["op"]
+    layout, components, dependencies = (
+        project.layout,
+        project.components,
+        project.dependencies,
+    )
+    if kind == "add":
+        if op["anchor"] is not None:
+            layout.insert(op["id"], layout.resolve(op["anchor"]), op["direction"])
+        else:
+            layout.insert(op["id"])
+        components[op["id"]] = [op["name"], op["kwargs"], op["var_name"]]
+        project.next_component_id = max(project.next_component_id, op["id"] + 1)
+        return [op["id"]]
+    if kind == "remove":
+        removed = layout.remove(layout.resolve(op["node"]))
+        for component_id in removed:
+            del components[component_id]
+        return removed
+    if kind == "rename":
+        components[op["id"]][2] = op["var_name"]
+        return [op["id"]]
+    if kind == "set_kwarg":
+        components[op["id"]][1][op["key"]] = op["value"]
+        return [op["id"]]
+    if kind == "unset_kwarg":
+        components[op["id"]][1].pop(op["key"], None)
+        return [op["id"]]
+    if kind == "set_dependency":
+        dep = normalize_dependency(op["dependency"])
+        if op["index"] == len(dependencies):
+            dependencies.append(dep)
+        else:
+            dependencies[op["index"]] = dep
+        return []
+    if kind == "delete_dependency":
+        del dependencies[op["index"]]
+        return []
+    if kind == "set_queue":
+        project.queue = dict(op["queue"])
+        return []
+    # Written by undo and redo, which restore whole versions of the project.
+    if kind == "set_layout":
+        project.layout = LayoutTree.from_list(op["layout"])
+        return []
+    if kind == "put_component":
+        components[op["id"]] = [op["name"], op["kwargs"], op["var_name"]]
+        project.next_component_id = max(project.next_component_id, op["id"] + 1)
+        return [op["id"]]
+    if kind == "delete_component":
+        components.pop(op["id"], None)
+        return [op["id"]]
+    if kind == "set_dependencies":
+        project.dependencies = [normalize_dependency(dep) for dep in op["dependencies"]]
+        return []
+    # Written when another session takes over the journal.
+    if kind == "set_project":
+        restored = Project.from_dict(op["project"])
+        changed = list(components.keys() | restored.components.keys())
+        project.layout = restored.layout
+        project.components = restored.components
+        project.dependencies = restored.dependencies
+        project.next_component_id = restored.next_component_id
+        project.queue = restored.queue
+        return changed
+    raise ValueError(f"Unknown journal operation {kind!r}")
+
+
+def replay(project: Project, payload: bytes) -> int:
+    """
+    Apply the journal lines in `payload` to `project`; returns how many applied.
+
+    Lines that cannot be read or no longer apply are skipped rather than
+    failing startup.
+    """
+    applied = 0
+    for line in payload.splitlines():
+        if not line.strip():
+            continue
+        try:
+            apply_op(project, orjson.loads(line))
+        except (
+            orjson.JSONDecodeError,
+            KeyError,
+            IndexError,
+            ValueError,
+            TypeError,
+            AttributeError,
+        ):
+            continue
+        applied += 1
+    return applied
+
+
+def _count_edits(payload: bytes) -> int:
+    """The journal lines in `payload` other than `set_project` snapshots."""
+    return payload.count(b"\n") - payload.count(_SET_PROJECT)
+
+
+class Journal:
+    """
+    Edit journal for one project file.
+
+    `record` appends an operation and, every `compact_every` operations,
+    schedules a compaction. `checkpoint` writes a project snapshot and drops
+    the journal lines it covers. Snapshots are written by `writer` when one
+    is given (otherwise compaction runs on its own thread and checkpoints
+    synchronously), and never replace the project file with an older state.
+    """
+
+    def __init__(
+        self,
+        config_file: str,
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        fsync: bool = False,
+        writer: BackgroundWriter | None = None,
+    ):
+        self.config_file = config_file
+        self.path = journal_path(config_file)
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.writer = writer
+        self._lock = threading.Lock()
+        # Held while the project file is written and the journal rewritten.
+        self._io_lock = threading.Lock()
+        self._pending = 0
+        # Positions count every byte ever appended, so they keep growing
+        # across truncations. The project file on disk holds every edit
+        # before `_start`, the position of the journal file's first byte;
+        # `_end` is the position after its last line.
+        self._start = 0
+        self._end = 0
+        self._compacting = False
+        # The session the journal follows; None until the first edit.
+        self._owner: Hashable | None = None
+        self.recorded = 0
+        self.compactions = 0
+
+    def load(self) -> Project | None:
+        """The project file with the journal replayed over it."""
+        project = load_project(self.config_file)
+        try:
+            with open(self.path, "rb") as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return project
+        # A line torn by a crash is dropped, so new edits start on their own line.
+        whole = payload[: payload.rfind(b"\n") + 1]
+        if len(whole) < len(payload):
+            with open(self.path, "r+b") as f:
+                f.truncate(len(whole))
+        if project is None:
+            project = Project()
+        applied = replay(project, whole)
+        with self._lock:
+            self._pending = _count_edits(whole)
+            self._end = self._start + len(whole)
+        return project if (applied or os.path.exists(self.config_file)) else None
+
+    def record(
+        self,
+        op: dict[str, Any],
+        session: Hashable | None = None,
+        project: Callable[[], Project] | None = None,
+    ) -> None:
+        """
+        Append `op`, which `session` has already applied to its project.
+
+        If another session recorded last, `project()` (the session's project,
+        `op` included) is appended as a `set_project` line instead and then
+        folded into the project file, as `checkpoint` does.
+        """
+        with self._lock:
+            snapshot = self._take_over(session, project)
+            if snapshot is None:
+                compact = self._append(op)
+            else:
+                # Not a pending edit: the fold below drops it with the rest.
+                compact = self._append(snapshot, pending=False)
+                position = self._end
+        if snapshot is not None:
+            self._schedule_fold(project(), position)
+        elif compact:
+            self._start_compaction()
+
+    def _take_over(
+        self, session: Hashable | None, project: Callable[[], Project] | None
+    ) -> dict[str, Any] | None:
+        """
+        Follow `session` from now on; called with the lock held.
+
+        Returns the `set_project` line to append if another session recorded
+        last, None if nothing needs to be written.
+        """
+        if session is None or session == self._owner:
+            return None
+        previous, self._owner = self._owner, session
+        if previous is None or project is None:
+            return None
+        return {"op": "set_project", "project": project().to_dict()}
+
+    def _append(self, op: dict[str, Any], pending: bool = True) -> bool:
+        """Write one line; called with the lock held. Returns whether to compact."""
+        line = orjson.dumps(op, default=str, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+        with open(self.path, "ab") as f:
+            f.write(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._end += len(line)
+        self.recorded += 1
+        self._pending += pending
+        compact = self._pending >= self.compact_every and not self._compacting
+        if compact:
+            self._compacting = True
+        return compact
+
+    def _start_compaction(self) -> None:
+        if self.writer is not None:
+            self.writer.submit(("compact", self.path), self.compact)
+        else:
+            threading.Thread(
+                target=self.compact, name="journal-compaction", daemon=True
+            ).start()
+
+    def _fold(self, payload: bytes, position: int) -> bool:
+        """Make `payload`, the state at `position`, the project file."""
+        with self._io_lock:
+            return self._replace(payload, position)
+
+    def _replace(self, payload: bytes, position: int) -> bool:
+        """
+        `_fold`, with the I/O lock held.
+
+        Only reading where the journal ends and swapping in the rewritten
+        journal take the lock `record` needs; the snapshot and the bulk of
+        the journal are written without it, so edits keep being recorded.
+        """
+        with self._lock:
+            if position < self._start:
+                # A newer snapshot was written meanwhile.
+                return False
+            # Folds are serialized by the I/O lock, so `_start` holds still,
+            # and bytes before `end` are never rewritten by `record`.
+            start, end = self._start, self._end
+        remaining = self._read(position - start, end - start)
+        # Snapshot first: a crash in between leaves edits that replay twice
+        # (most ops are idempotent), never edits that are lost.
+        write_if_changed(self.config_file, payload)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(self.path)}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(remaining)
+                f.flush()
+                os.fsync(f.fileno())
+                with self._lock:
+                    # Carry over the lines recorded while writing.
+                    carried = self._read(end - start, self._end - start)
+                    if carried:
+                        f.write(carried)
+                        if self.fsync:
+                            f.flush()
+                            os.fsync(f.fileno())
+                    f.close()
+                    os.replace(tmp_path, self.path)
+                    self._start = position
+                    self._pending = _count_edits(remaining) + _count_edits(carried)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return True
+
+    def _read(self, begin: int, end: int) -> bytes:
+        """The journal file's bytes from `begin` to `end`."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(begin)
+                return f.read(end - begin)
+        except FileNotFoundError:
+            return b""
+
+    def _schedule_fold(self, project: Project, position: int) -> Future | None:
+        payload = encode_project(project, project_encoding(self.config_file))
+        fold = functools.partial(self._fold, payload, position)
+        if self.writer is None:
+            fold()
+            return None
+        return self.writer.submit(self.config_file, fold)
+
+    def checkpoint(
+        self, project: Project, session: Hashable | None = None
+    ) -> Future | None:
+        """
+        Snapshot `project`, `session`'s current state, as the project file.
+
+        The project is encoded right away, so the caller may keep editing
+        it; with a writer, the write is queued and its future returned. The
+        journal follows `session` from then on.
+        """
+        # Taken before encoding: an edit racing the save is then at worst
+        # replayed over a snapshot that already has it, rather than dropped.
+        with self._lock:
+            snapshot = self._take_over(session, lambda: project)
+            if snapshot is not None:
+                # Until the snapshot is written, replaying the journal must
+                # already give this session's project.
+                self._append(snapshot, pending=False)
+            position = self._end
+        return self._schedule_fold(project, position)
+
+    def compact(self) -> bool:
+        """
+        Fold the journal into the project file.
+
+        The snapshot is rebuilt from the files alone, so edits keep being
+        recorded meanwhile; lines appended after the compaction started are
+        carried over into the new journal.
+        """
+        try:
+            with self._io_lock:
+                with self._lock:
+                    start, position = self._start, self._end
+                folded = self._read(0, position - start)
+                if not folded:
+                    return False
+                encoding = project_encoding(self.config_file)
+                try:
+                    with open(self.config_file, "rb") as f:
+                        project = decode_project(f.read(), encoding)
+                except FileNotFoundError:
+                    project = Project()
+                replay(project, folded)
+                if not self._replace(encode_project(project, encoding), position):
+                    return False
+            with self._lock:
+                self.compactions += 1
+            return True
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "recorded": self.recorded,
+                "pending": self._pending,
+                "compactions": self.compactions,
+            }
@@ -0,0 +1,386 @@
+"""Indexed layout tree for the sketch canvas.
+
+The canvas layout used to be a nested list of component ids (alternating
+Column / Row per nesting level) that every edit walked by index path. The
+`LayoutTree` keeps the same structure as linked nodes with parent pointers
+and an id -> node index, so finding, inserting next to, moving or deleting a
+node costs the same regardless of how deep it sits or how many siblings it
+has. It still converts to and from the nested-list shape, which remains the
+format written to config files.
+
+Node ids: leaves use their component id (>= 0); containers get negative ids,
+with the root column always being `ROOT_ID`.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections.abc import Iterator
+
+ROOT_ID = -1
+
+DIRECTIONS = ("up", "down", "left", "right")
+
+
+class LayoutNode:
+    __slots__ = (
+        "first",
+        "frozen",
+        "id",
+        "is_column",
+        "last",
+        "next",
+        "parent",
+        "prev",
+        "size",
+    )
+
+    def __init__(self, node_id: int, is_column: bool = False):
+        self.id = node_id
+        self.is_column = is_column
+        self.parent: LayoutNode | None = None
+        self.prev: LayoutNode | None = None
+        self.next: LayoutNode | None = None
+        self.first: LayoutNode | None = None
+        self.last: LayoutNode | None = None
+        self.size = 0
+        # Cached `LayoutTree.freeze` of a container's subtree, cleared by edits below it.
+        self.frozen: tuple | None = None
+
+    @property
+    def is_container(self) -> bool:
+        return self.id < 0
+
+    def children(self) -> Iterator[LayoutNode]:
+        child = self.first
+        while child is not None:
+            # Read ahead so callers may detach the child they are visiting.
+            following = child.next
+            yield child
+            child = following
+
+    def __repr__(self):
+        return f"LayoutNode({self.id})"
+
+
+class LayoutTree:
+    """
+    Layout of one sketch, edited in place.
+
+    The tree is not what a session's `gr.State` holds: gradio sees edits
+    through the session's `SketchHandle` (see `sessions.py`), so the tree
+    keeps object identity for equality and hashing.
+    """
+
+    def __init__(self):
+        self.root = LayoutNode(ROOT_ID, is_column=True)
+        self._nodes: dict[int, LayoutNode] = {ROOT_ID: self.root}
+        self._next_container_id = ROOT_ID - 1
+
+    # -- conversion -------------------------------------------------------
+
+    @classmethod
+    def from_list(cls, layout: list) -> LayoutTree:
+        tree = cls()
+
+        def fill(parent: LayoutNode, slot: list | tuple):
+            for element in slot:
+                if isinstance(element, (list, tuple)):
+                    container = tree._new_container(not parent.is_column)
+                    tree._link(container, parent, None)
+                    fill(container, element)
+                else:
+                    tree._link(tree._new_leaf(element), parent, None)
+            if isinstance(slot, tuple):
+                # Frozen input (see `freeze`) is reused as the cache.
+                parent.frozen = slot
+
+        fill(tree.root, layout)
+        return tree
+
+    def to_list(self) -> list:
+        def dump(node: LayoutNode) -> list:
+            return [
+                dump(child) if child.is_container else child.id
+                for child in node.children()
+            ]
+
+        return dump(self.root)
+
+    def freeze(self) -> tuple:
+        """
+        The layout as nested tuples, in the shape of `to_list`.
+
+        Each container's tuple is cached until an edit below it, so freezing
+        after an edit only rebuilds the edited node's ancestors and shares
+        every other subtree with the previous result.
+        """
+        stack = [(self.root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node.frozen is not None:
+                continue
+            if expanded:
+                node.frozen = tuple(
+                    child.frozen if child.is_container else child.id
+                    for child in node.children()
+                )
+                continue
+            stack.append((node, True))
+            stack.extend(
+                (child, False) for child in node.children() if child.is_container
+            )
+        return self.root.frozen
+
+    def __getstate__(self):
+        # Flat pre-order listing, so copying and pickling never recurse along
+        # sibling chains.
+        return {
+            "nodes": [
+                (node.id, node.parent.id, node.is_column) for node in self._walk()
+            ],
+            "next_container_id": self._next_container_id,
+        }
+
+    def __setstate__(self, state):
+        self.__init__()
+        for node_id, parent_id, is_column in state["nodes"]:
+            node = LayoutNode(node_id, is_column)
+            self._nodes[node_id] = node
+            self._link(node, self._nodes[parent_id], None)
+        self._next_container_id = state["next_container_id"]
+
+    def __deepcopy__(self, memo):
+        copied = LayoutTree.__new__(LayoutTree)
+        copied.__setstate__(self.__getstate__())
+        return copied
+
+    def __sizeof__(self):
+        # The nodes and their index, so `sys.getsizeof` reflects the whole tree.
+        node_size = sys.getsizeof(self.root)
+        return (
+            object.__sizeof__(self)
+            + sys.getsizeof(self._nodes)
+            + node_size * len(self._nodes)
+        )
+
+    # -- queries ----------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.root.size
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._nodes
+
+    def node(self, node_id: int) -> LayoutNode:
+        return self._nodes[node_id]
+
+    def component_ids(self) -> list[int]:
+        return [node_id for node_id in self._nodes if node_id >= 0]
+
+    def is_vertical(self, node_id: int) -> bool:
+        """Whether the node sits in a column, i.e. its siblings are stacked vertically."""
+        return self._nodes[node_id].parent.is_column
+
+    def ref(self, node_id: int) -> list[int]:
+        """
+        Refer to a node by a component inside it, as [component id, levels up].
+
+        Container ids are assigned per tree instance and are not preserved by
+        `to_list`, so anything persisted across reloads (the edit journal)
+        uses these instead.
+        """
+        node, levels = self._nodes[node_id], 0
+        while node.is_container:
+            node, levels = node.first, levels + 1
+        return [node.id, levels]
+
+    def resolve(self, ref: list[int]) -> int:
+        """Inverse of `ref`."""
+        component_id, levels = ref
+        node = self._nodes[component_id]
+        for _ in range(levels):
+            node = node.parent
+        return node.id
+
+    def _walk(self) -> Iterator[LayoutNode]:
+        stack = list(reversed(list(self.root.children())))
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.is_container:
+                stack.extend(reversed(list(node.children())))
+
+    # -- edits ------------------------------------------------------------
+
+    def insert(
+        self, component_id: int, anchor_id: int | None = None, direction: str = "down"
+    ) -> LayoutNode:
+        """
+        Place a new component relative to an existing node.
+
+        Directions along the anchor's parent (up/down in a column, left/right
+        in a row) insert a sibling before/after it. Directions across it go
+        into the anchor: a container gets the new node as its first/last
+        child, a component is first wrapped in a new container. Without an
+        anchor the component is appended to the root column.
+        """
+        if component_id in self._nodes:
+            raise ValueError(f"Component {component_id} is already in the layout.")
+        node = self._new_leaf(component_id)
+        if anchor_id is None:
+            self._link(node, self.root, None)
+        else:
+            self._place(node, *self._resolve(anchor_id, direction))
+        return node
+
+    def remove(self, node_id: int) -> list[int]:
+        """Remove a node (and its subtree); return the removed component ids."""
+        node = self._nodes[node_id]
+        if node is self.root:
+            raise ValueError("Cannot remove the root of the layout.")
+        removed = [node_id] if not node.is_container else []
+        if node.is_container:
+            stack = list(node.children())
+            while stack:
+                child = stack.pop()
+                del self._nodes[child.id]
+                if child.is_container:
+                    stack.extend(child.children())
+                else:
+                    removed.append(child.id)
+        parent = node.parent
+        self._unlink(node)
+        del self._nodes[node_id]
+        self._tidy(parent)
+        return removed
+
+    def move(self, node_id: int, anchor_id: int, direction: str) -> None:
+        """Detach a node and place it relative to another, as `insert` would."""
+        node = self._nodes[node_id]
+        ancestor = self._nodes[anchor_id]
+        while ancestor is not None:
+            if ancestor is node:
+                raise ValueError("Cannot move a node relative to its own subtree.")
+            ancestor = ancestor.parent
+        old_parent = node.parent
+        self._unlink(node)
+        self._place(node, *self._resolve(anchor_id, direction))
+        if old_parent.id in self._nodes:
+            self._tidy(old_parent)
+
+    def wrap(self, node_id: int) -> LayoutNode:
+        """Put a component into a new container of the opposite orientation to its parent."""
+        node = self._nodes[node_id]
+        if node.is_container:
+            raise ValueError("Only components can be wrapped.")
+        parent = node.parent
+        container = self._new_container(not parent.is_column)
+        self._link(container, parent, node)
+        self._unlink(node)
+        self._link(node, container, None)
+        return container
+
+    def unwrap(self, node_id: int) -> None:
+        """Dissolve a container, moving its contents into its parent in place."""
+        container = self._nodes[node_id]
+        if not container.is_container or container is self.root:
+            raise ValueError("Only nested containers can be unwrapped.")
+        parent = container.parent
+        for child in container.children():
+            self._unlink(child)
+            self._place(child, parent, container)
+        self._unlink(container)
+        del self._nodes[node_id]
+
+    # -- internals --------------------------------------------------------
+
+    def _new_leaf(self, component_id: int) -> LayoutNode:
+        node = LayoutNode(component_id)
+        self._nodes[component_id] = node
+        return node
+
+    def _new_container(self, is_column: bool) -> LayoutNode:
+        node = LayoutNode(self._next_container_id, is_column)
+        self._nodes[node.id] = node
+        self._next_container_id -= 1
+        return node
+
+    def _resolve(
+        self, anchor_id: int, direction: str
+    ) -> tuple[LayoutNode, LayoutNode | None]:
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction '{direction}'.")
+        anchor = self._nodes[anchor_id]
+        along = ("up", "down") if anchor.parent.is_column else ("left", "right")
+        if direction in along:
+            return anchor.parent, anchor if direction == along[0] else anchor.next
+        to_start = direction in ("up", "left")
+        if anchor.is_container:
+            return anchor, anchor.first if to_start else None
+        container = self.wrap(anchor_id)
+        return container, anchor if to_start else None
+
+    def _place(self, node: LayoutNode, parent: LayoutNode, before: LayoutNode | None):
+        # A container can't sit directly inside one of the same orientation,
+        # so its children are spliced in instead.
+        if node.is_container and node.is_column == parent.is_column:
+            for child in node.children():
+                self._unlink(child)
+                self._link(child, parent, before)
+            del self._nodes[node.id]
+        else:
+            self._link(node, parent, before)
+
+    def _tidy(self, parent: LayoutNode):
+        # Drop containers emptied by an edit and dissolve ones left with a
+        # single child, as deleting from the canvas always has.
+        while parent is not self.root and parent.size == 0:
+            grandparent = parent.parent
+            self._unlink(parent)
+            del self._nodes[parent.id]
+            parent = grandparent
+        if parent is not self.root and parent.size == 1:
+            self.unwrap(parent.id)
+
+    @staticmethod
+    def _invalidate(node: LayoutNode | None):
+        # A cleared node's ancestors are always cleared too.
+        while node is not None and node.frozen is not None:
+            node.frozen = None
+            node = node.parent
+
+    @staticmethod
+    def _link(node: LayoutNode, parent: LayoutNode, before: LayoutNode | None):
+        LayoutTree._invalidate(parent)
+        node.parent = parent
+        if before is None:
+            node.prev, node.next = parent.last, None
+            if parent.last is not None:
+                parent.last.next = node
+            else:
+                parent.first = node
+            parent.last = node
+        else:
+            node.prev, node.next = before.prev, before
+            if before.prev is not None:
+                before.prev.next = node
+            else:
+                parent.first = node
+            before.prev = node
+        parent.size += 1
+
+    @staticmethod
+    def _unlink(node: LayoutNode):
+        parent = node.parent
+        LayoutTree._invalidate(parent)
+        if node.prev is not None:
+            node.prev.next = node.next
+        else:
+            parent.first = node.next
+        if node.next is not None:
+            node.next.prev = node.prev
+        else:
+            parent.last = node.prev
+        parent.size -= 1
+        node.parent = node.prev = node.next = None
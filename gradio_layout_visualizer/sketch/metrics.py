@@ -0,0 +1,286 @@
+"""Latency instrumentation for the builder's event handlers.
+
+When enabled, every handler wired up in `create()` is wrapped so that its
+latency, call count and the size of the state it was called with are
+recorded in a process-wide `HandlerMetrics`. The numbers are shown in an
+optional debug panel and served in Prometheus text format on a local port.
+
+When disabled, `instrument` returns the handler itself and
+`handler_metrics.enabled` is False, so code outside the handlers (such as
+code generation timing) skips recording too, and there is no overhead at
+all.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+
+MAX_SAMPLES = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "gradio_layout_visualizer"
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("GRADIO_LAYOUT_VISUALIZER_METRICS", "").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+
+def state_size(value: Any) -> int:
+    """Rough size of a handler argument: nodes, components or dependencies."""
+    size = getattr(value, "state_size", None)
+    if callable(size):
+        return size()
+    if isinstance(value, LayoutTree):
+        return len(value.component_ids())
+    if isinstance(value, (dict, list, tuple)):
+        return len(value)
+    return 0
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HandlerStats:
+    __slots__ = ("count", "errors", "samples", "state_size", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.samples: deque[float] = deque(maxlen=MAX_SAMPLES)
+        self.state_size = 0
+
+
+class HandlerMetrics:
+    """
+    Thread-safe per-handler latency, call count and state size.
+
+    Callers that time things themselves check `enabled` first.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: dict[str, HandlerStats] = {}
+
+    def record(self, name: str, seconds: float, size: int, error: bool = False):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = HandlerStats()
+            stats.count += 1
+            stats.errors += error
+            stats.total += seconds
+            stats.samples.append(seconds)
+            stats.state_size = size
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            stats = {
+                name: (s.count, s.errors, s.total, list(s.samples), s.state_size)
+                for name, s in self._stats.items()
+            }
+        return {
+            name: {
+                "count": count,
+                "errors": errors,
+                "total": total,
+                **{f"p{int(q * 100)}": percentile(samples, q) for q in QUANTILES},
+                "state_size": size,
+            }
+            for name, (count, errors, total, samples, size) in sorted(stats.items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def table(self) -> list[list]:
+        """Rows for the debug panel: handler, calls, p50/p95/p99 in ms, state size."""
+        return [
+            [
+                name,
+                s["count"],
+                round(s["p50"] * 1000, 2),
+                round(s["p95"] * 1000, 2),
+                round(s["p99"] * 1000, 2),
+                s["state_size"],
+            ]
+            for name, s in self.snapshot().items()
+        ]
+
+    def prometheus(self) -> str:
+        latency = f"{METRIC_PREFIX}_handler_latency_seconds"
+        errors = f"{METRIC_PREFIX}_handler_errors_total"
+        size = f"{METRIC_PREFIX}_handler_state_size"
+        lines = [
+            f"# HELP {latency} Latency of builder event handlers.",
+            f"# TYPE {latency} summary",
+        ]
+        snapshot = self.snapshot()
+        for name, s in snapshot.items():
+            for q in QUANTILES:
+                lines.append(
+                    f'{latency}{{handler="{name}",quantile="{q}"}} '
+                    f"{s[f'p{int(q * 100)}']}"
+                )
+            lines.append(f'{latency}_sum{{handler="{name}"}} {s["total"]}')
+            lines.append(f'{latency}_count{{handler="{name}"}} {s["count"]}')
+        lines += [
+            f"# HELP {errors} Handler calls that raised.",
+            f"# TYPE {errors} counter",
+        ]
+        lines += [f'{errors}{{handler="{n}"}} {s["errors"]}' for n, s in snapshot.items()]
+        lines += [
+            f"# HELP {size} Size of the state passed to the handler on its last call.",
+            f"# TYPE {size} gauge",
+        ]
+        lines += [
+            f'{size}{{handler="{n}"}} {s["state_size"]}' for n, s in snapshot.items()
+        ]
+        return "\n".join(lines) + "\n"
+
+
+handler_metrics = HandlerMetrics(enabled=metrics_enabled())
+
+_stats_providers: dict[str, Callable[[], dict[str, float]]] = {}
+
+
+def register_stats(name: str, provider: Callable[[], dict[str, float]]) -> None:
+    """Expose `provider()`'s numbers (cache hit rates, pool sizes, ...) as gauges."""
+    _stats_providers[name] = provider
+
+
+def collect_stats() -> dict[str, dict[str, float]]:
+    return {name: provider() for name, provider in sorted(_stats_providers.items())}
+
+
+def prometheus_text() -> str:
+    lines = [handler_metrics.prometheus()]
+    for name, stats in collect_stats().items():
+        for key, value in stats.items():
+            metric = f"{METRIC_PREFIX}_{name}_{key}"
+            lines.append(f"# TYPE {metric} gauge\n{metric} {value}\n")
+    return "".join(lines)
+
+
+def instrument(name: str, enabled: bool) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording `name`'s latency in `handler_metrics`.
+
+    Returns the function untouched when `enabled` is False. The wrapper keeps
+    the wrapped signature (gradio inspects it for gr.Request / gr.SelectData
+    parameters) and is a generator / coroutine function exactly when the
+    handler is one, so gradio streams and awaits it the same way. Generators
+    are timed from the first call to exhaustion.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        if not enabled:
+            return fn
+
+        def size_of(args, kwargs):
+            return sum(state_size(a) for a in (*args, *kwargs.values()))
+
+        if inspect.isasyncgenfunction(fn):
+
+            @functools.wraps(fn)
+            async def async_gen_wrapper(*args, **kwargs):
+                start, error = time.perf_counter(), True
+                try:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                    error = False
+                finally:
+                    handler_metrics.record(
+                        name, time.perf_counter() - start, size_of(args, kwargs), error
+                    )
+
+            return async_gen_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                start, error = time.perf_counter(), True
+                try:
+                    yield from fn(*args, **kwargs)
+                    error = False
+                finally:
+                    handler_metrics.record(
+                        name, time.perf_counter() - start, size_of(args, kwargs), error
+                    )
+
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start, error = time.perf_counter(), True
+                try:
+                    result = await fn(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    handler_metrics.record(
+                        name, time.perf_counter() - start, size_of(args, kwargs), error
+                    )
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start, error = time.perf_counter(), True
+            try:
+                result = fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                handler_metrics.record(
+                    name, time.perf_counter() - start, size_of(args, kwargs), error
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve `handler_metrics` at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _PrometheusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,16 @@
+"""Filesystem locations shared by the builder's on-disk caches."""
+
+from __future__ import annotations
+
+import os
+
+
+def get_cache_dir() -> str:
+    """User cache directory, overridable with GRADIO_LAYOUT_VISUALIZER_CACHE_DIR."""
+    override = os.getenv("GRADIO_LAYOUT_VISUALIZER_CACHE_DIR")
+    if override:
+        return override
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "gradio_layout_visualizer")
@@ -0,0 +1,314 @@
+"""Worker processes that run the functions of the Save & Render preview.
+
+Functions written in the sketch used to be exec'd into one namespace inside
+the builder's process and wired straight into the preview, so a function that
+hung or kept the CPU busy stalled the builder for everyone, and every session
+shared its globals. They now run in `preview_pool`, a fixed set of worker
+processes:
+
+- at most `workers` calls run at once; further calls wait for a free worker
+  on the event loop, so waiting holds none of its threads;
+- a call still running after `timeout` seconds has its worker killed and
+  replaced, and fails with `PreviewError`, as does one whose worker dies;
+- each worker may allocate `memory_limit` bytes beyond what it uses once
+  started (enforced with `RLIMIT_AS` where the `resource` module exists);
+- a function's code is run once per session and worker, and the resulting
+  namespace is reused by that session's later calls, so sessions never see
+  each other's globals.
+
+Workers are spawned by `start` ahead of the first call (or by the first call
+itself) and import gradio while idle, so a preview call costs a round trip
+over a pipe rather than a process start. Arguments and return values are pickled.
+
+On POSIX systems workers are fresh interpreters talking over a socket pair,
+so scripts that call `create()` at module level are not re-run in them. On
+other platforms they are started with multiprocessing's "spawn" method,
+which needs the usual `if __name__ == "__main__":` guard in such scripts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import inspect
+import multiprocessing
+import os
+import pickle
+import queue
+import socket
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from multiprocessing.connection import Connection
+from typing import Any
+
+from gradio_layout_visualizer.sketch.metrics import register_stats
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MEMORY_LIMIT = 1 << 30
+
+# Startup (importing gradio) is not counted against a call's timeout.
+STARTUP_TIMEOUT = 120.0
+
+# Namespaces kept per worker; the least recently used is dropped first.
+MAX_NAMESPACES = 64
+
+_WORKER_MAIN = (
+    "import sys\n"
+    "from multiprocessing.connection import Connection\n"
+    "from gradio_layout_visualizer.sketch.preview import _serve\n"
+    "_serve(Connection(int(sys.argv[1])), int(sys.argv[2]))\n"
+)
+
+_PACKAGE_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+class PreviewError(Exception):
+    """A preview function raised, timed out, or took its worker down."""
+
+
+def _limit_memory(limit: int) -> None:
+    try:
+        import resource
+    except ImportError:
+        return
+    try:
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        baseline = 0
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (baseline + limit, baseline + limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _serve(conn, memory_limit: int | None) -> None:
+    """Worker loop: run ("check" | "call", session, code, fn_name, args) requests."""
+    import gradio  # noqa: F401 -- nearly every user function imports it
+
+    if memory_limit:
+        _limit_memory(memory_limit)
+    conn.send(("ready", None))
+    namespaces: OrderedDict[tuple, dict] = OrderedDict()
+    while True:
+        try:
+            kind, session, code, fn_name, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            if kind == "check":
+                namespace = {}
+                exec(code, namespace)  # noqa: S102 -- it runs the user's own code
+                if not callable(namespace.get(fn_name)):
+                    raise NameError(f"Function '{fn_name}' not found in code.")
+                result = None
+            else:
+                namespace = namespaces.pop((session, code), None)
+                if namespace is None:
+                    namespace = {}
+                    exec(code, namespace)  # noqa: S102 -- as above
+                namespaces[(session, code)] = namespace
+                while len(namespaces) > MAX_NAMESPACES:
+                    namespaces.popitem(last=False)
+                result = namespace[fn_name](*args)
+                if inspect.isgenerator(result):
+                    # Streamed updates are not forwarded; the preview shows the last.
+                    last = None
+                    for last in result:
+                        pass
+                    result = last
+            conn.send(("ok", result))
+        except BaseException as e:  # noqa: BLE001 -- sent to the caller
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _WorkerLost(Exception):
+    pass
+
+
+class _Worker:
+    __slots__ = ("conn", "process", "ready")
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.ready = False
+
+    def stop(self) -> None:
+        self.conn.close()
+        self.process.kill()
+        if isinstance(self.process, subprocess.Popen):
+            self.process.wait()
+        else:
+            self.process.join()
+
+
+class PreviewPool:
+    """
+    Worker processes for preview functions; see the module docstring.
+
+    `run` calls a function for a session, `check` runs code in a fresh
+    namespace and verifies it defines the function. Both are coroutines that
+    start the workers if needed and raise `PreviewError` on failure.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        timeout: float = DEFAULT_TIMEOUT,
+        memory_limit: int | None = DEFAULT_MEMORY_LIMIT,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._idle: queue.Queue[_Worker] | None = None
+        # One slot per worker, so a request only takes a thread once a worker
+        # is free for it.
+        self._slots: asyncio.Semaphore | None = None
+        self._started: list[_Worker] = []
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self) -> None:
+        """Spawn the workers if not running yet; they warm up in the background."""
+        with self._lock:
+            if self._idle is not None:
+                return
+            self._idle = queue.Queue()
+            self._slots = asyncio.Semaphore(self.workers)
+            for _ in range(self.workers):
+                self._idle.put(self._spawn())
+        atexit.register(self.shutdown)
+
+    def _spawn(self) -> _Worker:
+        if os.name == "posix":
+            own, theirs = socket.socketpair()
+            with theirs:
+                process = subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-c",
+                        _WORKER_MAIN,
+                        str(theirs.fileno()),
+                        str(self.memory_limit or 0),
+                    ],
+                    pass_fds=[theirs.fileno()],
+                    stdin=subprocess.DEVNULL,
+                    env=dict(
+                        os.environ,
+                        PYTHONPATH=os.pathsep.join(
+                            filter(None, [_PACKAGE_ROOT, os.getenv("PYTHONPATH")])
+                        ),
+                    ),
+                )
+            conn = Connection(own.detach())
+        else:
+            conn, child_conn = self._context.Pipe()
+            process = self._context.Process(
+                target=_serve,
+                args=(child_conn, self.memory_limit),
+                name="gradio-visualizer-preview",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+        worker = _Worker(process, conn)
+        self._started.append(worker)
+        return worker
+
+    def _exchange(self, worker: _Worker, message: tuple) -> tuple[str, Any]:
+        try:
+            if not worker.ready:
+                if not worker.conn.poll(STARTUP_TIMEOUT):
+                    raise _WorkerLost("The preview worker did not start.")
+                worker.conn.recv()
+                worker.ready = True
+            try:
+                worker.conn.send(message)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                # Nothing was written; the worker is still usable.
+                return "error", f"The inputs cannot be sent to the worker: {e}"
+            if not worker.conn.poll(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise _WorkerLost(f"Timed out after {self.timeout:g} s.")
+            return worker.conn.recv()
+        except (EOFError, OSError) as e:
+            raise _WorkerLost(
+                "The preview worker exited, e.g. by exceeding its memory limit."
+            ) from e
+
+    def _request(self, message: tuple) -> Any:
+        self.start()
+        idle = self._idle
+        worker = idle.get()
+        try:
+            status, value = self._exchange(worker, message)
+        except _WorkerLost as e:
+            worker.stop()
+            with self._lock:
+                self._started.remove(worker)
+                self.calls += 1
+                self.errors += 1
+                self.restarts += 1
+                worker = self._spawn()
+            raise PreviewError(str(e)) from None
+        finally:
+            idle.put(worker)
+        with self._lock:
+            self.calls += 1
+            if status == "error":
+                self.errors += 1
+        if status == "error":
+            raise PreviewError(value)
+        return value
+
+    async def _submit(self, message: tuple) -> Any:
+        self.start()
+        async with self._slots:
+            # The wait for a worker that is still starting happens in the
+            # thread too, off the event loop.
+            return await asyncio.to_thread(self._request, message)
+
+    async def run(
+        self, session: Hashable, code: str, fn_name: str, args: tuple
+    ) -> Any:
+        """Call `fn_name` from `code` with `args` in `session`'s namespace."""
+        return await self._submit(("call", session, code, fn_name, tuple(args)))
+
+    async def check(self, code: str, fn_name: str) -> None:
+        """Run `code` in a fresh namespace and check that it defines `fn_name`."""
+        await self._submit(("check", None, code, fn_name, ()))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._started = self._started, []
+            self._idle = None
+        for worker in workers:
+            worker.stop()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            idle = self._idle.qsize() if self._idle is not None else 0
+            return {
+                "workers": len(self._started),
+                "busy": len(self._started) - idle,
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+            }
+
+
+preview_pool = PreviewPool()
+register_stats("preview", preview_pool.stats)
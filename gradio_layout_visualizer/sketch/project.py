@@ -0,0 +1,180 @@
+"""Saved sketch projects.
+
+A project file holds everything needed to resume a sketch: the layout, the
+components, the functions with their prompt history and generated code, and
+the next component id. The encoding is chosen by file extension:
+
+- `.json`: JSON, read and written with orjson
+- `.json.gz`: the same JSON, gzip-compressed
+- `.msgpack`: MessagePack (needs the optional `msgpack` package)
+
+Files carry a format version, and files written before versioning (plain
+`{"layout": ..., "components": {...}}` JSON) are still read.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+import orjson
+
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.storage import write_if_changed
+
+PROJECT_FORMAT = "gradio-layout-visualizer"
+PROJECT_FORMAT_VERSION = 4
+
+
+class ProjectFormatError(ValueError):
+    """A project file could not be read."""
+
+
+@dataclass
+class Project:
+    layout: LayoutTree = field(default_factory=LayoutTree)
+    components: dict[int, list] = field(default_factory=dict)
+    dependencies: list[list] = field(default_factory=list)
+    next_component_id: int = 0
+    # Arguments of the generated app's `demo.queue` call; see `codegen.QUEUE_OPTIONS`.
+    queue: dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "format": PROJECT_FORMAT,
+            "version": PROJECT_FORMAT_VERSION,
+            "next_component_id": self.next_component_id,
+            "layout": self.layout.to_list(),
+            # Rows rather than a mapping: keeps ids as ints in every encoding.
+            "components": [
+                [component_id, name, kwargs, var_name]
+                for component_id, (name, kwargs, var_name) in self.components.items()
+            ],
+            "dependencies": self.dependencies,
+            "queue": self.queue,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Project:
+        version = data.get("version", 1)
+        if version == 1:
+            data = migrate_v1(data)
+        elif not 2 <= version <= PROJECT_FORMAT_VERSION:
+            raise ProjectFormatError(
+                f"Unsupported project format version {version}; this version of "
+                f"the visualizer reads versions 1 to {PROJECT_FORMAT_VERSION}."
+            )
+        components = {
+            int(component_id): [name, kwargs, var_name]
+            for component_id, name, kwargs, var_name in data["components"]
+        }
+        return cls(
+            layout=LayoutTree.from_list(data["layout"]),
+            components=components,
+            dependencies=[
+                normalize_dependency(dep) for dep in data.get("dependencies", [])
+            ],
+            next_component_id=data.get(
+                "next_component_id", max(components, default=-1) + 1
+            ),
+            queue=dict(data.get("queue") or {}),
+        )
+
+
+def normalize_dependency(dep: list) -> list:
+    """
+    Triggers are (component id, event) tuples in memory, lists once encoded.
+
+    The seventh element holds the preview stub's settings, {"latency":
+    seconds, "payload": characters} or None; version 2 functions have none.
+    The eighth holds the event listener's keyword arguments that differ from
+    gradio's defaults (see `codegen.EVENT_OPTIONS`) or None; functions from
+    before version 4 have none.
+    """
+    triggers, inputs, outputs, fn_name, history, code, *extra = dep
+    stub, options = (extra + [None, None])[:2]
+    return [
+        [tuple(trigger) for trigger in triggers],
+        list(inputs),
+        list(outputs),
+        fn_name,
+        [list(turn) for turn in history],
+        code,
+        dict(stub) if stub else None,
+        dict(options) if options else None,
+    ]
+
+
+def migrate_v1(data: dict[str, Any]) -> dict[str, Any]:
+    """Unversioned configs: components keyed by stringified id, no functions."""
+    components = [
+        [int(component_id), *component]
+        for component_id, component in data["components"].items()
+    ]
+    return {
+        "layout": data["layout"],
+        "components": components,
+        "dependencies": [],
+        "next_component_id": max((c[0] for c in components), default=-1) + 1,
+    }
+
+
+def project_encoding(path: str) -> str:
+    if path.endswith(".msgpack"):
+        return "msgpack"
+    if path.endswith(".gz"):
+        return "gzip"
+    return "json"
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ProjectFormatError(
+            "Project files ending in .msgpack need the msgpack package: "
+            "pip install msgpack"
+        ) from e
+    return msgpack
+
+
+def encode_project(project: Project, encoding: str) -> bytes:
+    data = project.to_dict()
+    if encoding == "msgpack":
+        return _msgpack().packb(data, use_bin_type=True, default=str)
+    payload = orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return gzip.compress(payload, compresslevel=6) if encoding == "gzip" else payload
+
+
+def decode_project(payload: bytes, encoding: str) -> Project:
+    try:
+        if encoding == "msgpack":
+            data = _msgpack().unpackb(payload, raw=False, strict_map_key=False)
+        else:
+            data = orjson.loads(
+                gzip.decompress(payload) if encoding == "gzip" else payload
+            )
+        return Project.from_dict(data)
+    except ProjectFormatError:
+        raise
+    except Exception as e:
+        raise ProjectFormatError(f"Invalid project file: {e}") from e
+
+
+def save_project(path: str, project: Project) -> bool:
+    """Atomically write a project file; False if it already held this project."""
+    return write_if_changed(path, encode_project(project, project_encoding(path)))
+
+
+def load_project(path: str) -> Project | None:
+    """Read a project file; None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        payload = f.read()
+    try:
+        return decode_project(payload, project_encoding(path))
+    except ProjectFormatError as e:
+        raise ProjectFormatError(f"{path}: {e}") from e
@@ -0,0 +1,255 @@
+"""Process-wide component schema registry.
+
+Everything the builder needs to know about a Gradio component class (its
+ordered constructor parameters, the enhanced control spec for each of them,
+and its events) is derived once and then served from plain dictionaries, so the sidebar, the
+canvas and the code generator never have to re-run reflection.
+
+The derived tables are also persisted to a JSON file under the user cache
+directory, keyed by the Gradio version and a hash of the rule tables they
+were derived from, so later process starts skip the introspection entirely.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import gradio as gr
+
+from gradio_layout_visualizer.sketch import enhanced_controls
+from gradio_layout_visualizer.sketch.enhanced_controls import (
+    get_param_info_from_parameter,
+)
+from gradio_layout_visualizer.sketch.paths import get_cache_dir
+
+NONCONFIGURABLE_PARAMS = ["every", "inputs", "render", "key", "preserved_by_key"]
+
+DEFAULT_KWARGS_MAP = {
+    gr.Image: {"type": "filepath"},
+    gr.Audio: {"type": "filepath"},
+    gr.Chatbot: {"type": "messages"},
+}
+
+QUICK_COMPONENT_LIST = [
+    gr.Textbox,
+    gr.Number,
+    gr.Button,
+    gr.Markdown,
+    gr.State,
+]
+
+ALL_COMPONENT_LIST = [
+    gr.AnnotatedImage,
+    # gr.Accordion,
+    gr.Audio,
+    gr.BarPlot,
+    gr.BrowserState,
+    gr.Button,
+    gr.Chatbot,
+    gr.Checkbox,
+    gr.CheckboxGroup,
+    gr.Code,
+    gr.ColorPicker,
+    gr.Dataframe,
+    gr.DateTime,
+    gr.Dropdown,
+    gr.File,
+    gr.Gallery,
+    gr.HighlightedText,
+    gr.HTML,
+    gr.Image,
+    gr.ImageEditor,
+    gr.JSON,
+    gr.Label,
+    gr.LinePlot,
+    gr.Markdown,
+    gr.Model3D,
+    gr.MultimodalTextbox,
+    gr.Number,
+    gr.Radio,
+    gr.Slider,
+    gr.State,
+    gr.Textbox,
+    gr.Timer,
+    gr.Video,
+]
+
+
+@dataclass(frozen=True)
+class ComponentSchema:
+    """Derived, read-only description of one component class."""
+
+    name: str
+    component: type
+    params: tuple[str, ...]
+    controls: dict[str, dict[str, Any]]
+    events: tuple[str, ...]
+    default_kwargs: dict[str, Any]
+
+    @property
+    def configurable_params(self) -> list[str]:
+        return [p for p in self.params if p not in NONCONFIGURABLE_PARAMS]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "params": list(self.params),
+            "controls": self.controls,
+            "events": list(self.events),
+            "default_kwargs": self.default_kwargs,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> ComponentSchema:
+        return cls(
+            name=data["name"],
+            component=getattr(gr, data["name"]),
+            params=tuple(data["params"]),
+            controls=data["controls"],
+            events=tuple(data["events"]),
+            default_kwargs=data["default_kwargs"],
+        )
+
+
+def build_schema(component: type) -> ComponentSchema:
+    parameters = list(inspect.signature(component.__init__).parameters.items())[1:]
+    params = tuple(name for name, _ in parameters)
+    controls = {
+        name: get_param_info_from_parameter(name, param) for name, param in parameters
+    }
+    default_kwargs = DEFAULT_KWARGS_MAP.get(component, {})
+    return ComponentSchema(
+        name=component.__name__,
+        component=component,
+        params=params,
+        controls=controls,
+        events=tuple(str(e) for e in getattr(component, "EVENTS", []) or []),
+        default_kwargs=default_kwargs,
+    )
+
+
+class ComponentRegistry:
+    """Name -> ComponentSchema lookup table for the components offered by the builder."""
+
+    def __init__(self, schemas: list[ComponentSchema]):
+        self._schemas = {schema.name: schema for schema in schemas}
+
+    def __getitem__(self, name: str) -> ComponentSchema:
+        return self._schemas[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._schemas
+
+    def __iter__(self):
+        return iter(self._schemas.values())
+
+    def __len__(self) -> int:
+        return len(self._schemas)
+
+    def names(self) -> list[str]:
+        return list(self._schemas)
+
+    def component(self, name: str) -> type:
+        return self._schemas[name].component
+
+
+CACHE_FORMAT_VERSION = 2
+
+
+def get_cache_key() -> str:
+    """
+    Key for the on-disk schema cache.
+
+    Changes whenever the Gradio version, the enhanced control rule tables or
+    the registry's own component tables change.
+    """
+    rules = {
+        "format": CACHE_FORMAT_VERSION,
+        "color": sorted(enhanced_controls.COLOR_PARAMS),
+        "boolean": sorted(enhanced_controls.BOOLEAN_PARAMS),
+        "slider": sorted(
+            [k, list(v)] for k, v in enhanced_controls.SLIDER_PARAMS.items()
+        ),
+        "components": [c.__name__ for c in ALL_COMPONENT_LIST],
+        "default_kwargs": sorted(
+            [c.__name__, kwargs] for c, kwargs in DEFAULT_KWARGS_MAP.items()
+        ),
+    }
+    digest = hashlib.sha256(
+        json.dumps(rules, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{gr.__version__}-{digest}"
+
+
+def get_cache_path() -> str:
+    return os.path.join(get_cache_dir(), f"schema-{get_cache_key()}.json")
+
+
+def load_cached_schemas(path: str) -> list[ComponentSchema] | None:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return [ComponentSchema.from_dict(entry) for entry in data["schemas"]]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_cached_schemas(path: str, schemas: list[ComponentSchema]) -> None:
+    # Defaults that are not JSON serializable are stored as their str(), which
+    # is also how the textbox control would display them.
+    payload = json.dumps(
+        {"key": get_cache_key(), "schemas": [s.to_dict() for s in schemas]},
+        default=str,
+    )
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+_registry: ComponentRegistry | None = None
+startup_timing: dict[str, Any] = {}
+
+
+def get_registry(use_cache: bool = True) -> ComponentRegistry:
+    """
+    Return the process-wide registry, building it on first use.
+
+    The first call loads the on-disk schema cache if one exists for the
+    current cache key, otherwise derives every schema and writes the cache.
+    How long that took and where the schemas came from is recorded in
+    `startup_timing`.
+    """
+    global _registry
+    if _registry is not None:
+        return _registry
+
+    start = time.perf_counter()
+    path = get_cache_path()
+    schemas = load_cached_schemas(path) if use_cache else None
+    source = "cache"
+    if schemas is None:
+        schemas = [build_schema(component) for component in ALL_COMPONENT_LIST]
+        source = "introspection"
+        if use_cache:
+            save_cached_schemas(path, schemas)
+    _registry = ComponentRegistry(schemas)
+    startup_timing.update(
+        {
+            "registry_source": source,
+            "registry_seconds": time.perf_counter() - start,
+            "registry_cache_path": path,
+        }
+    )
+    return _registry
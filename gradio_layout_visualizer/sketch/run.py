@@ -1,118 +1,296 @@
-import json
+import asyncio
+import functools
 import os
 import time
-from inspect import signature
+import uuid
+from collections import OrderedDict
 
 import huggingface_hub as hub
 
 import gradio as gr
 import gradio.utils
+from gradio_layout_visualizer.sketch.codegen import (
+    EVENT_OPTIONS,
+    QUEUE_OPTIONS,
+    CodeEmitter,
+    is_batched,
+    non_default,
+    placeholder_return,
+)
+from gradio_layout_visualizer.sketch.history import History
+from gradio_layout_visualizer.sketch.journal import Journal
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.metrics import (
+    collect_stats,
+    handler_metrics,
+    instrument,
+    metrics_enabled,
+    register_stats,
+)
+from gradio_layout_visualizer.sketch.project import (
+    Project,
+    encode_project,
+    load_project,
+    project_encoding,
+)
+from gradio_layout_visualizer.sketch.preview import PreviewError, preview_pool
+from gradio_layout_visualizer.sketch.sessions import DEFAULT_BUDGET_BYTES, SessionStore
 from gradio_layout_visualizer.sketch.sketchbox import SketchBox
-from gradio_layout_visualizer.sketch.utils import ai, get_header, set_kwarg
+from gradio_layout_visualizer.sketch.storage import background_writer, write_if_changed
+from gradio_layout_visualizer.sketch.utils import (
+    DEFAULT_BATCH_PARALLELISM,
+    ai_async,
+    ai_batch,
+    get_header,
+    set_kwarg,
+)
 from gradio_layout_visualizer.sketch.enhanced_controls import (
-    get_param_type_info,
     create_enhanced_control,
     format_value_for_storage,
 )
+from gradio_layout_visualizer.sketch.registry import (
+    QUICK_COMPONENT_LIST,
+    get_registry,
+)
 
-
-def create(app_file: str, config_file: str):
-    file_name = os.path.basename(app_file)
-    folder_name = os.path.basename(os.path.dirname(app_file))
-    created_fns_namespace = {}
-
-    nonconfigurable_params = ["every", "inputs", "render", "key"]
-    default_kwargs_map = {
-        gr.Image: {"type": "filepath"},
-        gr.Audio: {"type": "filepath"},
-        gr.Chatbot: {"type": "messages"},
+MAX_CODE_EMITTERS = 256
+
+# Edits that cannot change how any function is rendered.
+COMPONENT_ONLY_OPS = frozenset({"add", "set_kwarg", "unset_kwarg", "set_queue"})
+
+# Outputs a preview stub fills when given a simulated payload.
+STUB_PAYLOAD_COMPONENTS = (gr.Textbox, gr.Markdown, gr.HTML, gr.Code)
+
+# Code generations allowed to stream at once across all sessions; further
+# requests wait in gradio's queue, which shows their position.
+MAX_CONCURRENT_GENERATIONS = 8
+
+# Ctrl/Cmd+Z undoes and Ctrl/Cmd+Shift+Z or Ctrl+Y redoes, unless a text field
+# has focus and should handle the keys itself.
+UNDO_SHORTCUTS = """
+<script>
+document.addEventListener("keydown", (event) => {
+    if (!(event.ctrlKey || event.metaKey) || event.altKey) return;
+    if (event.target.closest?.("input, textarea, [contenteditable=true], .cm-editor")) return;
+    const key = event.key.toLowerCase();
+    const id = key === "z" ? (event.shiftKey ? "sketch-redo" : "sketch-undo")
+        : key === "y" ? "sketch-redo" : null;
+    const button = id && document.getElementById(id);
+    if (button) {
+        event.preventDefault();
+        button.click();
     }
+});
+</script>
+"""
 
-    quick_component_list = [
-        gr.Textbox,
-        gr.Number,
-        gr.Button,
-        gr.Markdown,
-        gr.State,
-    ]
-    all_component_list = [
-        gr.AnnotatedImage,
-        # gr.Accordion,
-        gr.Audio,
-        gr.BarPlot,
-        gr.BrowserState,
-        gr.Button,
-        gr.Chatbot,
-        gr.Checkbox,
-        gr.CheckboxGroup,
-        gr.Code,
-        gr.ColorPicker,
-        gr.Dataframe,
-        gr.DateTime,
-        gr.Dropdown,
-        gr.File,
-        gr.Gallery,
-        gr.HighlightedText,
-        gr.HTML,
-        gr.Image,
-        gr.ImageEditor,
-        gr.JSON,
-        gr.Label,
-        gr.LinePlot,
-        gr.Markdown,
-        gr.Model3D,
-        gr.MultimodalTextbox,
-        gr.Number,
-        gr.Radio,
-        gr.Slider,
-        gr.State,
-        gr.Textbox,
-        gr.Timer,
-        gr.Video,
-    ]
 
-    def get_component_by_name(name):
-        return [
-            component for component in all_component_list if component.__name__ == name
-        ][0]
-
-    def get_box(_slot, i, gp=None):
-        parent = _slot
-        target = _slot[i[0]] if isinstance(_slot, list) and i[0] < len(_slot) else None
-        if len(i) > 1:
-            gp, parent, target = get_box(target, i[1:], parent)
-        return gp, parent, target
-
-    def add_component(
-        component, layout, components, dependencies, add_index, new_component_id
-    ):
-        gp, parent, _ = get_box(layout, add_index)
-        if isinstance(parent, int):
-            parent = [parent]
-            if gp:
-                gp[add_index[-2]] = parent
-        parent.insert(add_index[-1], new_component_id)
-        default_kwargs = default_kwargs_map.get(component, {}).copy()
-        components[new_component_id] = [component.__name__, default_kwargs, ""]
-
-        component_name = component.__name__.lower()
-        existing_names = [components[i][2] for i in components]
-        var_name = component_name
-        i = 2
-        while var_name in existing_names:
-            var_name = component_name + "_" + str(i)
-            i += 1
-        components[new_component_id][2] = var_name
+def add_component(
+    component, layout, components, dependencies, add_index, new_component_id
+):
+    if add_index and add_index[0] in layout:
+        layout.insert(new_component_id, *add_index)
+    else:
+        layout.insert(new_component_id)
+    default_kwargs = get_registry()[component.__name__].default_kwargs.copy()
+    components[new_component_id] = [component.__name__, default_kwargs, ""]
+
+    component_name = component.__name__.lower()
+    existing_names = {c[2] for c in components.values()}
+    var_name = component_name
+    i = 2
+    while var_name in existing_names:
+        var_name = component_name + "_" + str(i)
+        i += 1
+    components[new_component_id][2] = var_name
+
+    return (
+        layout,
+        components,
+        dependencies,
+        "modify_component",
+        new_component_id,
+        new_component_id + 1,
+        gr.Button(interactive=True),
+    )
+
+
+def create(
+    app_file: str,
+    config_file: str,
+    metrics: bool | None = None,
+    generation_concurrency: int | None = MAX_CONCURRENT_GENERATIONS,
+    batch_parallelism: int = DEFAULT_BATCH_PARALLELISM,
+    journal: bool = True,
+    session_budget: int | None = DEFAULT_BUDGET_BYTES,
+):
+    if metrics is None:
+        metrics = metrics_enabled()
+    handler_metrics.enabled = metrics
+    timed = functools.partial(instrument, enabled=metrics)
+
+    edit_journal = Journal(config_file, writer=background_writer) if journal else None
+    if edit_journal is not None:
+        register_stats("journal", edit_journal.stats)
+
+    def record(_sketch, op, merge=False):
+        """Journal `op`, already applied to the session's project, and add it to its history."""
+        if edit_journal is not None:
+            edit_journal.record(op, _sketch.key, lambda: store.read(_sketch))
+        history = store.history(_sketch)
+        if history is not None:
+            history.record(op, merge=merge)
+        emitter = code_emitters.get(_sketch.key)
+        if emitter is not None:
+            if "id" in op:
+                emitter.touch(op["id"])
+            if op["op"] not in COMPONENT_ONLY_OPS:
+                emitter.touch_functions()
+
+    def record_dependency(_sketch, _dependencies, index, merge=False):
+        record(
+            _sketch,
+            {
+                "op": "set_dependency",
+                "index": index,
+                "dependency": _dependencies[index],
+            },
+            merge=merge,
+        )
 
+    def put_session(_sketch, project):
+        """Outputs that put a session on `project`: the sketch, next id and sidebar mode."""
+        store.replace(_sketch, project)
         return (
-            layout,
-            components,
-            dependencies,
-            "modify_component",
-            new_component_id,
-            new_component_id + 1,
-            gr.Button(interactive=True),
+            _sketch,
+            project.next_component_id,
+            "default" if project.components else "add_component",
+            None,
+        )
+
+    def step(_sketch, redo=False):
+        """Undo (or redo) the session's last edit."""
+        history = store.history(_sketch)
+        ops = None
+        if history is not None:
+            ops = history.redo() if redo else history.undo()
+        if ops is None:
+            return (gr.skip(),) * 4
+        outputs = put_session(_sketch, history.project())
+        # The history has already moved; the journal learns the net change.
+        if edit_journal is not None:
+            for op in ops:
+                edit_journal.record(op, _sketch.key, lambda: store.read(_sketch))
+        return outputs
+
+    @timed("add_component")
+    def add_component_timed(component, _sketch, _add_index, _new_component_id):
+        project = store.write(_sketch)
+        _layout, _components = project.layout, project.components
+        # The anchor is referenced before the insert, which can wrap it.
+        anchor = (
+            _layout.ref(_add_index[0])
+            if _add_index and _add_index[0] in _layout
+            else None
+        )
+        _, _, _, *outputs = add_component(
+            component,
+            _layout,
+            _components,
+            project.dependencies,
+            _add_index,
+            _new_component_id,
         )
+        name, kwargs, var_name = _components[_new_component_id]
+        project.next_component_id = max(
+            project.next_component_id, _new_component_id + 1
+        )
+        record(
+            _sketch,
+            {
+                "op": "add",
+                "id": _new_component_id,
+                "name": name,
+                "kwargs": kwargs,
+                "var_name": var_name,
+                "anchor": anchor,
+                "direction": _add_index[1] if anchor is not None else None,
+            },
+        )
+        return (_sketch, *outputs)
+
+    file_name = os.path.basename(app_file)
+    folder_name = os.path.basename(os.path.dirname(app_file))
+    code_emitters = OrderedDict()
+    pending_saves = {}
+
+    registry = get_registry()
+
+    def get_component_by_name(name):
+        return registry.component(name)
+
+    def generation_signature(_components, dep):
+        """The (inputs, output_types) arguments of `ai` for a dependency."""
+        inputs = [
+            (
+                _components[c][2],
+                get_component_by_name(_components[c][0]),
+                _components[c][1],
+            )
+            for c in dep[1]
+        ]
+        output_types = [
+            (get_component_by_name(_components[c][0]), _components[c][1])
+            for c in dep[2]
+        ]
+        return inputs, output_types
+
+    @timed("box_action")
+    def box_action(_sketch, _modify_id, data: gr.SelectData):
+        # One listener serves every box on the canvas. The box that fired
+        # carries its layout node id; the sketchbox frontend also sends it as
+        # the select index.
+        node_id = getattr(data.target, "node_id", None)
+        if node_id is None:
+            node_id = data.index
+        if data.value in ("up", "down", "left", "right"):
+            return (_sketch, "add_component", [node_id, data.value], None)
+        if data.value == "delete":
+            project = store.write(_sketch)
+            _layout = project.layout
+            op = {"op": "remove", "node": _layout.ref(node_id)}
+            for component_id in _layout.remove(node_id):
+                del project.components[component_id]
+            record(_sketch, op)
+            return (
+                _sketch,
+                "add_component" if len(_layout) == 0 else "default",
+                None,
+                None,
+            )
+        if data.value == "modify":
+            return (_sketch, "modify_component", None, node_id)
+        if data.value in ["input", "output"]:
+            _dependencies = store.write(_sketch).dependencies
+            component_list = _dependencies[_modify_id][
+                1 if data.value == "input" else 2
+            ]
+            if node_id in component_list:
+                component_list.remove(node_id)
+            else:
+                component_list.append(node_id)
+            record_dependency(_sketch, _dependencies, _modify_id)
+            return (_sketch, "modify_function", None, _modify_id)
+        if data.value.startswith("on:"):
+            event = data.value[3:]
+            _dependencies = store.write(_sketch).dependencies
+            triggers = _dependencies[_modify_id][0]
+            if (node_id, event) in triggers:
+                triggers.remove((node_id, event))
+            else:
+                triggers.append((node_id, event))
+            record_dependency(_sketch, _dependencies, _modify_id)
+            return (_sketch, "modify_function", None, _modify_id)
 
     def set_hf_token(token):
         try:
@@ -122,29 +300,47 @@ def create(app_file: str, config_file: str):
         gr.Success("Token set successfully.", duration=2)
         return token
 
-    with gr.Blocks() as demo:
+    with gr.Blocks(head=UNDO_SHORTCUTS) as demo:
         _id = gr.State(0)
 
-        # Below was giving issues, commenting out for now
-        # if os.path.exists(config_file):
-        #     with open(config_file) as f:
-        #         config = json.load(f)
-        #     _layout = config["layout"]
-        #     _components = {int(k): v for k, v in config["components"].items()}
-        #     _new_component_id = len(_components)
-        #     mode = gr.State("default")
-        # else:
-        _layout = []
-        _components = {}
-        _dependencies = []
-        _new_component_id = 0
-        mode = gr.State("add_component")
+        project = (
+            edit_journal.load()
+            if edit_journal is not None
+            else load_project(config_file)
+        )
+        if project is not None:
+            _layout = project.layout
+            _components = project.components
+            _dependencies = project.dependencies
+            _new_component_id = project.next_component_id
+            _queue = project.queue
+            mode = gr.State("default")
+        else:
+            _layout = LayoutTree()
+            _components = {}
+            _dependencies = []
+            _new_component_id = 0
+            _queue = {}
+            mode = gr.State("add_component")
+        project = Project(
+            _layout, _components, _dependencies, _new_component_id, _queue
+        )
+        store = SessionStore(
+            project,
+            budget=session_budget,
+            writer=background_writer,
+            history=History(),
+        )
+        register_stats("sessions", store.stats)
+        register_stats("history", store.history_stats)
 
         new_component_id = gr.State(_new_component_id)
-        components = gr.State(_components)
-        dependencies = gr.State(_dependencies)
-        layout = gr.State(_layout)
-        add_index = gr.State([_new_component_id])
+        # The session's layout, components and functions, held in `store`.
+        sketch = gr.State(store.handle(), delete_callback=store.discard)
+        # Identifies the browser, so a reloaded page can resume its own session.
+        browser_token = gr.BrowserState(None, storage_key="sketch_session")
+        # Pending placement as [anchor node id, direction]; None appends to the root.
+        add_index = gr.State(None)
         modify_id = gr.State(None)
         saved = gr.State(False)
         hf_token = gr.State(hub.get_token() or os.getenv("HF_TOKEN"))
@@ -159,25 +355,26 @@ def create(app_file: str, config_file: str):
                     mode,
                     add_index,
                     new_component_id,
-                    components,
-                    dependencies,
+                    sketch,
                     modify_id,
                     hf_token,
                 ],
                 show_progress="hidden",
             )
+            @timed("render_sidebar")
             def render_sidebar(
                 _mode,
                 _add_index,
                 _new_component_id,
-                _components,
-                _dependencies,
+                _sketch,
                 _modify_id,
                 _hf_token,
             ):
+                project = store.read(_sketch)
+                _components, _dependencies = project.components, project.dependencies
                 if _mode == "default" and len(_components) == 0:
                     _mode = "add_component"
-                    _add_index = [0]
+                    _add_index = None
                 if _mode == "default":
                     gr.Markdown("## Placement")
                     gr.Markdown("Click on a '+' button to add a component.")
@@ -187,21 +384,17 @@ def create(app_file: str, config_file: str):
                         gr.Markdown("Select first component to place.")
                     else:
                         gr.Markdown("Select component to place in selected area.")
-                    for component in quick_component_list:
+                    for component in QUICK_COMPONENT_LIST:
                         gr.Button(component.__name__, size="md").click(
-                            lambda _layout, _component=component: add_component(
+                            lambda _sketch, _component=component: add_component_timed(
                                 _component,
-                                _layout,
-                                _components,
-                                _dependencies,
+                                _sketch,
                                 _add_index,
                                 _new_component_id,
                             ),
-                            layout,
+                            sketch,
                             [
-                                layout,
-                                components,
-                                dependencies,
+                                sketch,
                                 mode,
                                 modify_id,
                                 new_component_id,
@@ -210,25 +403,21 @@ def create(app_file: str, config_file: str):
                         )
 
                     any_component_search = gr.Dropdown(
-                        [component.__name__ for component in all_component_list],
+                        registry.names(),
                         container=True,
                         label="Other Components...",
                         interactive=True,
                     )
                     any_component_search.change(
-                        lambda _component, _layout: add_component(
+                        lambda _component, _sketch: add_component_timed(
                             get_component_by_name(_component),
-                            _layout,
-                            _components,
-                            _dependencies,
+                            _sketch,
                             _add_index,
                             _new_component_id,
                         ),
-                        [any_component_search, layout],
+                        [any_component_search, sketch],
                         [
-                            layout,
-                            components,
-                            dependencies,
+                            sketch,
                             mode,
                             modify_id,
                             new_component_id,
@@ -243,65 +432,235 @@ def create(app_file: str, config_file: str):
 
                     var_name_box = gr.Textbox(var_name, label="Variable Name")
 
+                    @timed("set_var_name")
                     def set_var_name(name):
-                        _components[_modify_id][2] = name
-                        return _components
+                        store.write(_sketch).components[_modify_id][2] = name
+                        record(
+                            _sketch,
+                            {"op": "rename", "id": _modify_id, "var_name": name},
+                        )
+                        return _sketch
 
                     gr.on(
                         [var_name_box.blur, var_name_box.submit],
                         set_var_name,
                         var_name_box,
-                        components,
+                        sketch,
                     )
 
                     gr.Markdown(
                         '✨ **Enhanced Controls** - Use visual controls for easier configuration.'
                     )
 
-                    component = get_component_by_name(component_name)
-                    arguments = list(signature(component.__init__).parameters.keys())[
-                        1:
-                    ]
-                    for arg in arguments:
-                        if arg in nonconfigurable_params:
-                            continue
+                    schema = registry[component_name]
+                    for arg in schema.configurable_params:
                         arg_value = kwargs.get(arg, "")
 
-                        # Get parameter type info and create enhanced control
-                        param_info = get_param_type_info(component, arg)
+                        # Look up the precomputed control spec and create enhanced control
+                        param_info = schema.controls[arg]
                         control_type = param_info["control_type"]
                         arg_box = create_enhanced_control(
                             arg, param_info, arg_value, component_name
                         )
 
+                        @timed("set_arg")
                         def set_arg(value, arg=arg, ctrl_type=control_type):
                             # Format the value appropriately based on control type
                             formatted_value = format_value_for_storage(value, ctrl_type)
-                            set_kwarg(_components[_modify_id][1], arg, formatted_value)
-                            return _components
+                            kwargs = store.write(_sketch).components[_modify_id][1]
+                            set_kwarg(kwargs, arg, formatted_value)
+                            if arg in kwargs:
+                                record(
+                                    _sketch,
+                                    {
+                                        "op": "set_kwarg",
+                                        "id": _modify_id,
+                                        "key": arg,
+                                        "value": kwargs[arg],
+                                    },
+                                )
+                            else:
+                                record(
+                                    _sketch,
+                                    {"op": "unset_kwarg", "id": _modify_id, "key": arg},
+                                )
+                            return _sketch
 
                         # Use appropriate event based on control type
                         if control_type in ("toggle", "color", "dropdown"):
-                            arg_box.change(set_arg, arg_box, components)
+                            arg_box.change(set_arg, arg_box, sketch)
                         else:
                             gr.on(
-                                [arg_box.blur, arg_box.submit], set_arg, arg_box, components
+                                [arg_box.blur, arg_box.submit], set_arg, arg_box, sketch
                             )
                 if _mode == "modify_function":
                     dep = _dependencies[_modify_id]
-                    _triggers, _inputs, _outputs, var_name, _history, _code = dep
+                    (
+                        _triggers,
+                        _inputs,
+                        _outputs,
+                        var_name,
+                        _history,
+                        _code,
+                        _stub,
+                        _options,
+                    ) = dep
                     gr.Markdown("## Event Listeners")
                     function_name_box = gr.Textbox(var_name, label="Function Name")
 
                     def set_fn_name(name):
-                        dep[3] = name
-                        return _dependencies
+                        deps = store.write(_sketch).dependencies
+                        deps[_modify_id][3] = name
+                        record_dependency(_sketch, deps, _modify_id)
+                        return _sketch
 
                     gr.on(
                         [function_name_box.blur, function_name_box.submit],
                         set_fn_name,
                         function_name_box,
-                        dependencies,
+                        sketch,
+                    )
+
+                    with gr.Accordion("Preview Stub", open=_stub is not None):
+                        gr.Markdown(
+                            "Until the function has code, the preview runs a stub that changes nothing. Slow it down or have it fill text outputs to see how the layout behaves under load."
+                        )
+                        latency_box = gr.Number(
+                            _stub["latency"] if _stub else 0,
+                            label="Simulated latency (seconds)",
+                            minimum=0,
+                        )
+                        payload_box = gr.Number(
+                            _stub["payload"] if _stub else 0,
+                            label="Simulated payload (characters per text output)",
+                            minimum=0,
+                            precision=0,
+                        )
+
+                    def set_stub(latency, payload):
+                        deps = store.write(_sketch).dependencies
+                        latency, payload = float(latency or 0), int(payload or 0)
+                        deps[_modify_id][6] = (
+                            {"latency": latency, "payload": payload}
+                            if latency or payload
+                            else None
+                        )
+                        record_dependency(_sketch, deps, _modify_id)
+                        return _sketch
+
+                    gr.on(
+                        [
+                            latency_box.blur,
+                            latency_box.submit,
+                            payload_box.blur,
+                            payload_box.submit,
+                        ],
+                        set_stub,
+                        [latency_box, payload_box],
+                        sketch,
+                    )
+
+                    options = {**EVENT_OPTIONS, **(_options or {})}
+                    limit = options["concurrency_limit"]
+                    with gr.Accordion("Queue & Concurrency", open=_options is not None):
+                        with gr.Row():
+                            concurrency_limit_box = gr.Number(
+                                None if limit == "default" else limit or 0,
+                                label="Concurrency limit",
+                                info="Empty: the app's default. 0: no limit.",
+                                minimum=0,
+                                precision=0,
+                            )
+                            concurrency_id_box = gr.Textbox(
+                                options["concurrency_id"] or "",
+                                label="Concurrency group",
+                                info="Functions in a group share one limit.",
+                            )
+                        with gr.Row():
+                            queue_box = gr.Checkbox(options["queue"], label="Queue")
+                            batch_box = gr.Checkbox(
+                                options["batch"],
+                                label="Batch",
+                                info="Called with lists of inputs from several users.",
+                            )
+                        with gr.Row():
+                            max_batch_size_box = gr.Number(
+                                options["max_batch_size"],
+                                label="Max batch size",
+                                minimum=1,
+                                precision=0,
+                            )
+                            stream_every_box = gr.Number(
+                                options["stream_every"],
+                                label="Stream every (seconds)",
+                                minimum=0.01,
+                            )
+                        trigger_mode_box = gr.Dropdown(
+                            ["default", "once", "multiple", "always_last"],
+                            value=options["trigger_mode"] or "default",
+                            label="Trigger mode",
+                            info="While a call runs, further triggers are ignored "
+                            "(once), queued (multiple) or kept to the last one "
+                            "(always_last).",
+                        )
+
+                    def set_options(
+                        concurrency_limit,
+                        concurrency_id,
+                        queue,
+                        batch,
+                        max_batch_size,
+                        stream_every,
+                        trigger_mode,
+                    ):
+                        deps = store.write(_sketch).dependencies
+                        if batch and not deps[_modify_id][1]:
+                            # Gradio sizes a batch by the first input.
+                            gr.Warning("Only functions with inputs can be batched.")
+                            batch = False
+                        options = non_default(
+                            {
+                                "concurrency_limit": "default"
+                                if concurrency_limit is None
+                                else int(concurrency_limit) or None,
+                                "concurrency_id": concurrency_id.strip() or None,
+                                "queue": queue,
+                                "batch": batch,
+                                "max_batch_size": int(max_batch_size or 1),
+                                "trigger_mode": None
+                                if trigger_mode == "default"
+                                else trigger_mode,
+                                "stream_every": stream_every
+                                or EVENT_OPTIONS["stream_every"],
+                            },
+                            EVENT_OPTIONS,
+                        )
+                        deps[_modify_id][7] = options or None
+                        record_dependency(_sketch, deps, _modify_id)
+                        return _sketch
+
+                    option_boxes = [
+                        concurrency_limit_box,
+                        concurrency_id_box,
+                        queue_box,
+                        batch_box,
+                        max_batch_size_box,
+                        stream_every_box,
+                        trigger_mode_box,
+                    ]
+                    gr.on(
+                        [
+                            trigger
+                            for box in option_boxes
+                            for trigger in (
+                                [box.input]
+                                if isinstance(box, (gr.Checkbox, gr.Dropdown))
+                                else [box.blur, box.submit]
+                            )
+                        ],
+                        set_options,
+                        option_boxes,
+                        sketch,
                     )
 
                     gr.Markdown(
@@ -351,39 +710,28 @@ def create(app_file: str, config_file: str):
                         )
 
                         __inputs = [_components[c][2] for c in _inputs]
-                        __outputs = [_components[c][2] for c in _outputs]
+                        batch = is_batched(dep)
                         _code = (
                             _code
                             if _code is not None
-                            else f"""{get_header(var_name, __inputs)}
+                            else f"""{get_header(var_name, __inputs, batch)}
     ...
-    return {", ".join(["..." for _ in __outputs])}"""
+    {placeholder_return(len(_outputs), __inputs[0] if batch else None)}"""
                         )
                         fn_code = gr.Code(_code, lines=4, language="python")
                         save_code_btn = gr.Button("Save Code", size="md")
                         history = gr.JSON(_history, visible=False)
 
-                        def generate(_prompt, _history):
-                            yield from ai(
+                        @timed("generate")
+                        async def generate(_prompt, _history):
+                            async for code in ai_async(
                                 _history + [[_prompt, None]],
                                 _hf_token,
                                 var_name,
-                                [
-                                    (
-                                        _components[c][2],
-                                        get_component_by_name(_components[c][0]),
-                                        _components[c][1],
-                                    )
-                                    for c in _inputs
-                                ],
-                                [
-                                    (
-                                        get_component_by_name(_components[c][0]),
-                                        _components[c][1],
-                                    )
-                                    for c in _outputs
-                                ],
-                            )
+                                *generation_signature(_components, dep),
+                                batch=batch,
+                            ):
+                                yield code
 
                         def append_to_history(
                             history: list[tuple[str, str]], prompt: str, code: str
@@ -399,7 +747,11 @@ def create(app_file: str, config_file: str):
                             )
 
                         generate_code_btn.click(
-                            generate, [prompt, history], fn_code
+                            generate,
+                            [prompt, history],
+                            fn_code,
+                            concurrency_limit=generation_concurrency,
+                            concurrency_id="generate",
                         ).then(
                             append_to_history,
                             [history, prompt, fn_code],
@@ -407,50 +759,50 @@ def create(app_file: str, config_file: str):
                             show_progress="hidden",
                         )
 
-                        def reset_code(_dependencies, _modify_id):
-                            _dependencies[_modify_id][4] = []
-                            _dependencies[_modify_id][5] = None
+                        def reset_code(_sketch, _modify_id):
+                            deps = store.write(_sketch).dependencies
+                            deps[_modify_id][4] = []
+                            deps[_modify_id][5] = None
+                            record_dependency(_sketch, deps, _modify_id)
                             return (
-                                get_header(var_name, __inputs),
+                                get_header(var_name, __inputs, batch),
                                 gr.Button(visible=False),
                                 gr.Textbox(placeholder=new_prompt_placeholder),
                                 gr.Button(new_generate_text),
                                 [],
-                                _dependencies,
+                                _sketch,
                             )
 
                         reset_code_btn.click(
                             reset_code,
-                            [dependencies, modify_id],
+                            [sketch, modify_id],
                             [
                                 fn_code,
                                 reset_code_btn,
                                 prompt,
                                 generate_code_btn,
                                 history,
-                                dependencies,
+                                sketch,
                             ],
                         )
 
-                        def save_code(_history, _code):
+                        async def save_code(_history, _code):
                             try:
-                                exec(_code, created_fns_namespace)
-                            except BaseException as e:
+                                await preview_pool.check(_code, var_name)
+                            except PreviewError as e:
                                 raise gr.Error(f"Error saving function: {e}") from e
-                            if var_name not in created_fns_namespace:
-                                raise gr.Error(
-                                    f"Function '{var_name}' not found in code."
-                                )
-                            dep[4] = (
+                            deps = store.write(_sketch).dependencies
+                            deps[_modify_id][4] = (
                                 []
                                 if len(_history) == 0
                                 else _history[:-1] + [[_history[-1][0], _code]]
                             )
-                            dep[5] = _code
+                            deps[_modify_id][5] = _code
+                            record_dependency(_sketch, deps, _modify_id)
                             gr.Success("Function saved.", duration=2)
-                            return _dependencies
+                            return _sketch
 
-                        save_code_btn.click(save_code, [history, fn_code], dependencies)
+                        save_code_btn.click(save_code, [history, fn_code], sketch)
 
                     done_function_btn = gr.Button("Done", variant="primary", size="md")
                     done_function_btn.click(
@@ -461,16 +813,21 @@ def create(app_file: str, config_file: str):
                     )
 
                     def del_function():
-                        del _dependencies[_modify_id]
-                        return _dependencies, "default", None
+                        del store.write(_sketch).dependencies[_modify_id]
+                        record(
+                            _sketch, {"op": "delete_dependency", "index": _modify_id}
+                        )
+                        return _sketch, "default", None
 
                     del_function_btn.click(
-                        del_function, None, [dependencies, mode, modify_id]
+                        del_function, None, [sketch, mode, modify_id]
                     )
 
         with gr.Row():
             gr.Markdown("## Sketching '" + folder_name + "/" + file_name + "'")
             add_fn_btn.render()
+            undo_btn = gr.Button("Undo", scale=0, elem_id="sketch-undo")
+            redo_btn = gr.Button("Redo", scale=0, elem_id="sketch-redo")
             save_btn = gr.Button("Save & Render", variant="primary", scale=0)
 
             deploy_to_spaces_btn = gr.Button(
@@ -482,37 +839,56 @@ def create(app_file: str, config_file: str):
             )
 
         @gr.render(
-            [layout, components, dependencies, saved, modify_id, mode],
+            [sketch, saved, modify_id, mode],
             show_progress="hidden",
         )
-        def app(_layout, _components, _dependencies, saved, _modify_id, _mode):
+        @timed("app")
+        def app(_sketch, saved, _modify_id, _mode):
+            project = store.read(_sketch)
+            _layout = project.layout
+            _components, _dependencies = project.components, project.dependencies
             boxes = []
             rendered_components = {}
             function_mode = _mode == "modify_function"
 
-            def render_slot(slot, is_column, index, depth=1):
-                container = gr.Column() if is_column else gr.Row()
+            # Every block and listener is keyed by its layout node id, so a
+            # re-render reuses the same block ids: the browser keeps the mounted
+            # instances of unchanged nodes and only patches props that differ,
+            # and the session's blocks config doesn't grow with every render.
+            # The sketch and the saved preview key their blocks apart, so
+            # switching between them never carries a block's state over.
+            namespace = "saved" if saved else "sketch"
+
+            def render_slot(node, depth=1):
+                container_key = (namespace, "container", node.id)
+                container = (
+                    gr.Column(key=container_key)
+                    if node.is_column
+                    else gr.Row(key=container_key)
+                )
                 with container:
-                    for i, element in enumerate(slot):
-                        this_index = index + [i]
-                        if isinstance(element, list):
+                    for child in node.children():
+                        if child.is_container:
                             if saved:
-                                render_slot(
-                                    element, not is_column, this_index, depth + 1
-                                )
+                                render_slot(child, depth + 1)
                             else:
                                 with SketchBox(
-                                    is_container=True, function_mode=function_mode
+                                    is_container=True,
+                                    function_mode=function_mode,
+                                    node_id=child.id,
+                                    key=(namespace, "box", child.id),
                                 ) as box:
-                                    render_slot(
-                                        element, not is_column, this_index, depth + 1
-                                    )
-                                boxes.append((box, this_index))
+                                    render_slot(child, depth + 1)
+                                boxes.append(box)
                             continue
+                        element = child.id
                         component_name, kwargs, var_name = _components[element]
-                        component = get_component_by_name(component_name)
+                        schema = registry[component_name]
+                        component = schema.component
                         if saved:
-                            rendered_components[element] = component(**kwargs)
+                            rendered_components[element] = component(
+                                key=(namespace, "component", element), **kwargs
+                            )
                         else:
                             if function_mode:
                                 triggers = [
@@ -527,178 +903,124 @@ def create(app_file: str, config_file: str):
                                 is_input = False
                                 is_output = False
                             with SketchBox(
-                                component_type=component.__name__.lower(),
+                                component_type=schema.name.lower(),
                                 var_name=var_name,
                                 active=_modify_id == element and not function_mode,
                                 function_mode=function_mode,
-                                event_list=component.EVENTS
-                                if hasattr(component, "EVENTS")
+                                # Only function mode offers the events.
+                                event_list=list(schema.events)
+                                if function_mode
                                 else None,
                                 is_input=is_input,
                                 is_output=is_output,
                                 triggers=triggers,
+                                node_id=element,
+                                key=(namespace, "box", element),
                             ) as box:
-                                component(**kwargs)
-                            boxes.append((box, this_index))
-
-            render_slot(_layout, True, [])
-
-            for box, index in boxes:
-
-                def box_action(
-                    _layout,
-                    _components,
-                    _dependencies,
-                    _modify_id,
-                    data: gr.SelectData,
-                    index=index,
-                ):
-                    if data.value in ("up", "down", "left", "right"):
-                        if len(index) % 2 == 1:  # vertical
-                            if data.value == "down":
-                                index[-1] += 1
-                            elif data.value == "left":
-                                index.append(0)
-                            elif data.value == "right":
-                                index.append(1)
-                        elif data.value == "right":
-                            index[-1] += 1
-                        elif data.value == "up":
-                            index.append(0)
-                        elif data.value == "down":
-                            index.append(1)
-                        return (
-                            _layout,
-                            _components,
-                            _dependencies,
-                            "add_component",
-                            index,
-                            None,
-                        )
-                    if data.value == "delete":
-
-                        def delete_index(_layout, index):
-                            gp, parent, target = get_box(_layout, index)
-                            parent.remove(target)
-                            if isinstance(target, int):
-                                del _components[target]
-
-                            if len(parent) == 0 and len(index) > 1:
-                                delete_index(_layout, index[:-1])
-                            elif len(parent) == 1 and gp:
-                                gp[index[-2]] = parent[0]
+                                # Sketch values come from kwargs, not from what was
+                                # typed into the preview, so nothing is preserved.
+                                component(
+                                    key=(namespace, "component", element),
+                                    preserved_by_key=None,
+                                    **kwargs,
+                                )
+                            boxes.append(box)
 
-                        delete_index(_layout, index)
-                        if len(_layout) == 0:
-                            return (
-                                _layout,
-                                _components,
-                                _dependencies,
-                                "add_component",
-                                [0],
-                                None,
-                            )
-                        else:
-                            return (
-                                _layout,
-                                _components,
-                                _dependencies,
-                                "default",
-                                [],
-                                None,
-                            )
-                    if data.value == "modify":
-                        *_, target = get_box(_layout, index)
-                        return (
-                            _layout,
-                            _components,
-                            _dependencies,
-                            "modify_component",
-                            None,
-                            target,
-                        )
-                    if data.value in ["input", "output"]:
-                        *_, target = get_box(_layout, index)
-                        component_list = _dependencies[_modify_id][
-                            1 if data.value == "input" else 2
-                        ]
-                        if target in component_list:
-                            component_list.remove(target)
-                        else:
-                            component_list.append(target)
-                        return (
-                            _layout,
-                            _components,
-                            _dependencies,
-                            "modify_function",
-                            None,
-                            _modify_id,
-                        )
-                    if data.value.startswith("on:"):
-                        *_, target = get_box(_layout, index)
-                        event = data.value[3:]
-                        triggers = _dependencies[_modify_id][0]
-                        if (target, event) in triggers:
-                            triggers.remove((target, event))
-                        else:
-                            triggers.append((target, event))
-                        return (
-                            _layout,
-                            _components,
-                            _dependencies,
-                            "modify_function",
-                            None,
-                            _modify_id,
-                        )
+            render_slot(_layout.root)
 
-                box.select(
+            if boxes:
+                gr.on(
+                    [box.select for box in boxes],
                     box_action,
-                    [layout, components, dependencies, modify_id],
-                    [layout, components, dependencies, mode, add_index, modify_id],
+                    [sketch, modify_id],
+                    [sketch, mode, add_index, modify_id],
+                    key="canvas_select",
                 )
 
             if saved:
-                for triggers, inputs, outputs, fn_name, *_, code in _dependencies:
+                for (
+                    triggers,
+                    inputs,
+                    outputs,
+                    fn_name,
+                    _,
+                    code,
+                    stub,
+                    options,
+                ) in _dependencies:
+                    # As in the generated file, functions without inputs run unbatched.
+                    options = dict(
+                        options or {},
+                        batch=bool(options and options.get("batch") and inputs),
+                    )
                     rendered_triggers = [
                         getattr(rendered_components[c], t) for c, t in triggers
                     ]
                     rendered_inputs = [rendered_components[c] for c in inputs]
                     rendered_outputs = [rendered_components[c] for c in outputs]
                     if code:
+                        # Runs in a preview worker process, in this session's namespace.
+                        async def preview_fn(*args, fn_name=fn_name, code=code):
+                            try:
+                                return await preview_pool.run(
+                                    _sketch.key, code, fn_name, args
+                                )
+                            except PreviewError as e:
+                                raise gr.Error(f"{fn_name}: {e}") from None
+
                         try:
                             gr.on(
                                 rendered_triggers,
-                                created_fns_namespace[fn_name],
+                                preview_fn,
                                 rendered_inputs,
                                 rendered_outputs,
+                                **options,
                             )
                         except Exception:
                             pass
                     else:
-                        output_count = len(rendered_outputs)
-                        fn_output = (
-                            [gr.skip()] * output_count
-                            if output_count > 1
+                        latency = stub["latency"] if stub else 0
+                        payload = stub["payload"] if stub else 0
+                        values = [
+                            "x" * payload
+                            if payload and isinstance(output, STUB_PAYLOAD_COMPONENTS)
                             else gr.skip()
-                            if output_count == 1
+                            for output in rendered_outputs
+                        ]
+                        fn_output = (
+                            tuple(values)
+                            if len(values) > 1
+                            else values[0]
+                            if values
                             else None
                         )
 
-                        def sleep(*_):
-                            print("sleeping")
-                            time.sleep(1)
+                        # Runs on the event loop and holds no worker thread,
+                        # even while simulating latency.
+                        async def stub_fn(*_, fn_output=fn_output, latency=latency):
+                            if latency:
+                                await asyncio.sleep(latency)
                             return fn_output
 
+                        # Stubs return one value per output, so they are never batched.
                         gr.on(
-                            rendered_triggers, sleep, rendered_inputs, rendered_outputs
+                            rendered_triggers,
+                            stub_fn,
+                            rendered_inputs,
+                            rendered_outputs,
+                            **{
+                                k: v
+                                for k, v in options.items()
+                                if k not in ("batch", "max_batch_size")
+                            },
                         )
 
         with gr.Sidebar(position="right", open=False) as right_sidebar:
             gr.Markdown("## Functions")
 
-            @gr.render([dependencies], show_progress="hidden")
-            def render_deps(_dependencies):
-                for i, dep in enumerate(_dependencies):
+            @gr.render([sketch], show_progress="hidden")
+            def render_deps(_sketch):
+                for i, dep in enumerate(store.read(_sketch).dependencies):
                     fn_btn = gr.Button(dep[3], size="md")
 
                     def load_fn(i=i):
@@ -706,89 +1028,273 @@ def create(app_file: str, config_file: str):
 
                     fn_btn.click(load_fn, outputs=[mode, modify_id])
 
-            def add_fn(_dependencies):
+            with gr.Accordion("Generate All Functions", open=False):
+                app_description = gr.Textbox(
+                    label="App description",
+                    lines=3,
+                    placeholder="Describe what the app does. Every function "
+                    "without code is generated from this description.",
+                )
+                generate_all_btn = gr.Button("Generate All", size="md")
+                batch_summary = gr.Markdown()
+                batch_progress = gr.Dataframe(
+                    headers=["function", "status", "seconds"],
+                    interactive=False,
+                    show_label=False,
+                    visible=False,
+                )
+
+            # Keys of the sketches a Generate All run is in progress for.
+            generating_all = set()
+
+            @generate_all_btn.click(
+                inputs=[sketch, hf_token, app_description],
+                outputs=[batch_progress, batch_summary, sketch],
+                # `ai_batch` bounds the requests of each run; runs are
+                # limited to one per session below.
+                concurrency_limit=None,
+            )
+            @timed("generate_all")
+            async def generate_all(_sketch, _hf_token, description):
+                project = store.read(_sketch)
+                _dependencies, _components = project.dependencies, project.components
+                if not _hf_token:
+                    raise gr.Error("Submit an HF token in a function's sidebar first.")
+                if not description.strip():
+                    raise gr.Error("Describe the app to generate its functions.")
+                if _sketch.key in generating_all:
+                    raise gr.Error("Generate All is already running for this sketch.")
+                tasks, jobs = {}, {}
+                for i, dep in enumerate(_dependencies):
+                    triggers, inputs, outputs, fn_name, _, fn_code, *_ = dep
+                    if fn_code is not None or not (inputs or outputs):
+                        continue
+                    events = ", ".join(
+                        f"{_components[c][2]}.{t}" for c, t in triggers
+                    )
+                    tasks[i] = (
+                        f"{description.strip()}\nWrite the '{fn_name}' function of "
+                        f"this app{f', which runs on {events}' if events else ''}."
+                    )
+                    input_specs, output_types = generation_signature(
+                        _components, dep
+                    )
+                    jobs[i] = {
+                        "history": [[tasks[i], None]],
+                        "fn_name": fn_name,
+                        "inputs": input_specs,
+                        "output_types": output_types,
+                        "batch": is_batched(dep),
+                    }
+                if not jobs:
+                    raise gr.Error(
+                        "Every function with inputs or outputs already has code."
+                    )
+
+                # Outcome of saving each finished function, once it was tried.
+                saved = {}
+
+                def rows(progress):
+                    return [
+                        [
+                            jobs[i]["fn_name"],
+                            saved.get(i)
+                            or (
+                                entry["status"]
+                                if entry["error"] is None
+                                else f"error: {entry['error']}"
+                            ),
+                            None
+                            if entry["seconds"] is None
+                            else round(entry["seconds"], 1),
+                        ]
+                        for i, entry in progress.items()
+                    ]
+
+                generated = 0
+                # History revision after the last function was saved; while
+                # nothing else was edited, each one joins the same undo step.
+                revision = None
+
+                async def save(i, code):
+                    nonlocal generated, revision
+                    # As with Save Code, code that does not load is not saved.
+                    try:
+                        await preview_pool.check(code, jobs[i]["fn_name"])
+                    except PreviewError as e:
+                        return f"error: not loadable: {e}"
+                    _dependencies = store.write(_sketch).dependencies
+                    # Functions may have been added, removed or saved while
+                    # generating; write only to the one the code was made for.
+                    if (
+                        i >= len(_dependencies)
+                        or _dependencies[i][3] != jobs[i]["fn_name"]
+                        or _dependencies[i][5] is not None
+                    ):
+                        return "skipped: function changed"
+                    _dependencies[i][4] = [[tasks[i], code]]
+                    _dependencies[i][5] = code
+                    history = store.history(_sketch)
+                    record_dependency(
+                        _sketch,
+                        _dependencies,
+                        i,
+                        merge=history is not None and history.revision == revision,
+                    )
+                    if history is not None:
+                        revision = history.revision
+                    generated += 1
+                    return "done"
+
+                start = time.perf_counter()
+                progress = {}
+                generating_all.add(_sketch.key)
+                try:
+                    async for progress in ai_batch(
+                        jobs, _hf_token, parallelism=batch_parallelism
+                    ):
+                        # Each function is saved as soon as it is generated.
+                        changed = False
+                        for i, entry in progress.items():
+                            if i in saved or entry["status"] not in ("done", "error"):
+                                continue
+                            if entry["status"] == "error" or not entry["code"]:
+                                saved[i] = None
+                                continue
+                            saved[i] = await save(i, entry["code"])
+                            changed = True
+                        done = len(saved)
+                        yield (
+                            gr.Dataframe(rows(progress), visible=True),
+                            (
+                                f"Generating... {done}/{len(jobs)} finished, "
+                                f"{generated} saved, "
+                                f"{time.perf_counter() - start:.1f} s"
+                            ),
+                            _sketch if changed else gr.skip(),
+                        )
+                finally:
+                    generating_all.discard(_sketch.key)
+
+                yield (
+                    gr.Dataframe(rows(progress), visible=True),
+                    (
+                        f"Generated {generated}/{len(jobs)} functions in "
+                        f"{time.perf_counter() - start:.1f} s."
+                    ),
+                    gr.skip(),
+                )
+
+            def add_fn(_sketch):
+                _dependencies = store.write(_sketch).dependencies
                 _dependencies.append(
-                    [[], [], [], f"fn_{len(_dependencies) + 1}", [], None]
+                    [[], [], [], f"fn_{len(_dependencies) + 1}", [], None, None, None]
                 )
+                record_dependency(_sketch, _dependencies, len(_dependencies) - 1)
                 return (
-                    _dependencies,
+                    _sketch,
                     "modify_function",
                     len(_dependencies) - 1,
                     gr.Sidebar(open=True),
                 )
 
             add_fn_btn.click(
-                add_fn, dependencies, [dependencies, mode, modify_id, right_sidebar]
+                add_fn, sketch, [sketch, mode, modify_id, right_sidebar]
             )
 
+            with gr.Accordion("App Queue", open=False):
+                gr.Markdown("Written to the generated file as `demo.queue(...)`.")
+
+                @gr.render([sketch], show_progress="hidden")
+                def render_queue(_sketch):
+                    queue = {**QUEUE_OPTIONS, **store.read(_sketch).queue}
+                    limit = queue["default_concurrency_limit"]
+                    default_limit_box = gr.Number(
+                        None if limit == "not_set" else limit or 0,
+                        label="Default concurrency limit",
+                        info="Calls of each function running at once, unless the "
+                        "function sets its own. Empty: 1. 0: no limit.",
+                        minimum=0,
+                        precision=0,
+                    )
+                    max_size_box = gr.Number(
+                        queue["max_size"] or 0,
+                        label="Max queue size",
+                        info="Further requests are rejected. 0: unbounded.",
+                        minimum=0,
+                        precision=0,
+                    )
+
+                    def set_queue(default_limit, max_size):
+                        project = store.write(_sketch)
+                        project.queue = non_default(
+                            {
+                                "default_concurrency_limit": "not_set"
+                                if default_limit is None
+                                else int(default_limit) or None,
+                                "max_size": int(max_size or 0) or None,
+                            },
+                            QUEUE_OPTIONS,
+                        )
+                        record(_sketch, {"op": "set_queue", "queue": project.queue})
+                        return _sketch
+
+                    gr.on(
+                        [
+                            default_limit_box.blur,
+                            default_limit_box.submit,
+                            max_size_box.blur,
+                            max_size_box.submit,
+                        ],
+                        set_queue,
+                        [default_limit_box, max_size_box],
+                        sketch,
+                    )
+
             gr.Markdown("## Generated File")
             code = gr.Code(language="python", interactive=False, show_label=False)
 
             @gr.on(
-                inputs=[layout, components, dependencies],
+                inputs=[sketch],
                 outputs=code,
                 show_progress="hidden",
             )
-            def render_code(_layout, _components, _dependencies):
-                code_str = ""
-
-                def render_code_slot(slot, is_column, index, depth=1):
-                    nonlocal code_str
-                    for i, element in enumerate(slot):
-                        this_index = index + [i]
-                        if isinstance(element, list):
-                            code_str += (
-                                "    " * depth
-                                + "with gr."
-                                + ("Row" if is_column else "Column")
-                                + "():\n"
-                            )
-                            render_code_slot(
-                                element, not is_column, this_index, depth + 1
-                            )
-                            continue
-                        component_name, kwargs, var_name = _components[element]
-                        code_str += (
-                            "    " * depth + var_name + " = gr." + component_name + "("
-                        )
-                        for i, (k, v) in enumerate(kwargs.items()):
-                            v = (
-                                f'"{v}"'.replace("\n", "\\n")
-                                if isinstance(v, str)
-                                else v
-                            )
-                            if i != 0:
-                                code_str += ", "
-                            code_str += f"{k}={v}"
-                        code_str += ")\n"
-
-                render_code_slot(_layout, True, [])
-
-                for dep in _dependencies:
-                    triggers = [_components[c][2] + "." + t for c, t in dep[0]]
-                    inputs = [_components[c][2] for c in dep[1]]
-                    outputs = [_components[c][2] for c in dep[2]]
-                    fn_name = dep[3]
-                    if dep[5] is not None:
-                        fn_code = dep[5].replace("\n", "\n    ")
-                    else:
-                        fn_code = f"""def {fn_name}({", ".join(inputs)}):
-        ...
-        return {", ".join(["..." for _ in outputs])}"""
-
-                    code_str += f"""
-    @{triggers[0] + "(" if len(triggers) == 1 else "gr.on([" + ", ".join(triggers) + "], "}inputs=[{", ".join(inputs)}], outputs=[{", ".join(outputs)}])
-    {fn_code}
-"""
-                code_str = f"""import gradio as gr
-
-with gr.Blocks() as demo:
-{code_str}
-demo.launch()"""
-                return code_str
+            @timed("render_code")
+            def render_code(_sketch):
+                # Kept in place, so `record` never misses it while it moves.
+                emitter = code_emitters.get(_sketch.key)
+                if emitter is None:
+                    emitter = code_emitters[_sketch.key] = CodeEmitter()
+                else:
+                    code_emitters.move_to_end(_sketch.key)
+                while len(code_emitters) > MAX_CODE_EMITTERS:
+                    code_emitters.popitem(last=False)
+                project = store.read(_sketch)
+                code_str = emitter.emit_if_changed(
+                    project.layout,
+                    project.components,
+                    project.dependencies,
+                    project.queue,
+                )
+                return gr.skip() if code_str is None else code_str
+
+            if metrics:
+                with gr.Accordion("Handler Metrics", open=False):
+                    metrics_table = gr.Dataframe(
+                        headers=["handler", "calls", "p50 ms", "p95 ms", "p99 ms", "state"],
+                        interactive=False,
+                        show_label=False,
+                    )
+                    metrics_stats = gr.JSON(show_label=False)
+                    gr.Timer(2).tick(
+                        lambda: (handler_metrics.table(), collect_stats()),
+                        None,
+                        [metrics_table, metrics_stats],
+                        show_progress="hidden",
+                    )
 
         @save_btn.click(
-            inputs=[saved, code, dependencies],
+            inputs=[saved, code, sketch, new_component_id],
             outputs=[
                 saved,
                 save_btn,
@@ -800,16 +1306,36 @@ demo.launch()"""
             ],
             show_progress="hidden",
         )
-        def save(saved, code, deps):
-            with open(app_file, "w") as f:
-                f.write(code)
-            with open(config_file, "w") as f:
-                json.dump(
-                    {
-                        "layout": _layout,
-                        "components": _components,
-                    },
-                    f,
+        @timed("save")
+        def save(saved, code, _sketch, _new_component_id):
+            # Files are written on the background writer; a failure surfaces
+            # on the next save.
+            for path, future in pending_saves.items():
+                if future.done() and future.exception() is not None:
+                    gr.Warning(
+                        f"Saving {os.path.basename(path)} failed: {future.exception()}"
+                    )
+            pending_saves[app_file] = background_writer.submit(
+                app_file,
+                functools.partial(write_if_changed, app_file, code.encode("utf-8")),
+            )
+            current = store.read(_sketch)
+            project = Project(
+                current.layout,
+                current.components,
+                current.dependencies,
+                _new_component_id,
+                current.queue,
+            )
+            if edit_journal is not None:
+                pending_saves[config_file] = edit_journal.checkpoint(
+                    project, _sketch.key
+                )
+            else:
+                payload = encode_project(project, project_encoding(config_file))
+                pending_saves[config_file] = background_writer.submit(
+                    config_file,
+                    functools.partial(write_if_changed, config_file, payload),
                 )
             return [
                 not saved,
@@ -818,9 +1344,38 @@ demo.launch()"""
                 gr.Button(visible=not saved),
                 "default",
                 gr.Sidebar(open=saved),
-                gr.Sidebar(open=saved and len(deps) > 0),
+                gr.Sidebar(open=saved and len(project.dependencies) > 0),
             ]
 
+        history_outputs = [sketch, new_component_id, mode, modify_id]
+        undo_btn.click(
+            timed("undo")(step),
+            sketch,
+            history_outputs,
+            show_progress="hidden",
+        )
+        redo_btn.click(
+            timed("redo")(functools.partial(step, redo=True)),
+            sketch,
+            history_outputs,
+            show_progress="hidden",
+        )
+
+        @demo.load(
+            inputs=[sketch, browser_token],
+            outputs=[*history_outputs, browser_token],
+            show_progress="hidden",
+        )
+        def resume(_sketch, token):
+            # Sessions start from the project as loaded at startup; a reloaded
+            # page picks up the edits, and the undo history, of the session
+            # it replaces in the same browser, and no other.
+            if token is None:
+                token = uuid.uuid4().hex
+            if not store.adopt(_sketch, token):
+                return (*(gr.skip(),) * 4, token)
+            return (*put_session(_sketch, store.read(_sketch)), token)
+
         deploy_to_spaces_btn.click(
             fn=None,
             inputs=code,
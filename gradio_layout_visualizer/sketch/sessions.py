@@ -0,0 +1,522 @@
+"""Server-side store of each session's sketch.
+
+The layout, components and functions used to be three `gr.State`s. gradio
+deep-copies every State's initial value into each new session and, around
+every event, hashes each State output that has change listeners with
+`gradio.utils.deep_hash`, which walks and re-serializes the whole value:
+about 50 ms and 480 KB of allocations per event on a 1,000-component sketch.
+
+Sessions now hold a `SketchHandle` in a single State instead. The handle
+names the session's project in a `SessionStore` and hashes by a version
+number that the store bumps on every write, so hashing it is O(1) and gradio
+still sees every edit. Projects are copy-on-write: every session reads the
+project loaded at startup until its first edit, which gives it a private
+copy, so opening the builder no longer copies the sketch at all. With a
+`History`, the first edit also forks the undo history of the startup project
+for the session, so each session undoes only its own edits.
+
+Private copies count against a memory budget shared by all sessions. Once
+it is exceeded, the least recently used sessions that have been idle for
+`idle_seconds` are pickled to a spill directory and dropped from memory; the
+session's next event loads its project back. Handles are unaffected, so a
+spilled session looks the same to gradio and to the handlers. A session's
+undo history counts towards the budget too, and is spilled with it.
+
+A closed session is kept for its browser's next session (see
+`SessionStore.adopt`) for `closed_seconds`, then dropped along with its
+spill file.
+"""
+
+from __future__ import annotations
+
+import copy
+import itertools
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from gradio_layout_visualizer.sketch.history import History
+from gradio_layout_visualizer.sketch.project import Project
+from gradio_layout_visualizer.sketch.storage import BackgroundWriter
+
+DEFAULT_BUDGET_BYTES = 1 << 30
+
+DEFAULT_IDLE_SECONDS = 60.0
+
+DEFAULT_CLOSED_SECONDS = 24 * 3600.0
+
+# Minimum time between two eviction sweeps.
+SWEEP_INTERVAL = 5.0
+
+
+def resident_bytes(project: Project) -> int:
+    """Approximate memory held by a project, as `sys.getsizeof` over its objects."""
+    total = sys.getsizeof(project.layout)
+    seen = set()
+    stack = [project.components, project.dependencies]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
+
+class SketchHandle:
+    """
+    What a session's State holds: a key into a `SessionStore` and a version.
+
+    gradio deep-copies a State's initial value for each new session; copying
+    a handle just issues a fresh one from the same store.
+    """
+
+    __slots__ = ("key", "store", "token", "version")
+
+    def __init__(self, store: SessionStore, key: int):
+        self.store = store
+        self.key = key
+        self.version = 0
+        # Names the browser the session runs in; see `SessionStore.adopt`.
+        self.token: str | None = None
+
+    def __hash__(self):
+        return hash((self.key, self.version))
+
+    def __deepcopy__(self, memo):
+        return self.store.handle()
+
+    def __copy__(self):
+        return self.store.handle()
+
+    def state_size(self) -> int:
+        return len(self.store.read(self).components)
+
+    def __repr__(self):
+        return f"SketchHandle({self.key}, version={self.version})"
+
+
+class _Session:
+    __slots__ = (
+        "dirty",
+        "history",
+        "history_bytes",
+        "loading",
+        "nbytes",
+        "project",
+        "spilled",
+        "used",
+    )
+
+    def __init__(self, project: Project, nbytes: int, history: History | None):
+        self.project: Project | None = project
+        # Spilled and read back together with the project.
+        self.history = history
+        # `history.nbytes` as last counted; see `size`.
+        self.history_bytes = 0 if history is None else history.nbytes
+        # Size as of the last measurement; `dirty` once written since.
+        self.nbytes = nbytes
+        self.dirty = True
+        self.used = time.monotonic()
+        self.spilled: str | None = None
+        # Set while a spilled project is being read back.
+        self.loading = False
+
+    def size(self) -> int:
+        """Bytes counted against the store's budget."""
+        if self.history is None:
+            return self.nbytes
+        # The history keeps a replica of the project besides its steps.
+        return 2 * self.nbytes + self.history_bytes
+
+
+class SessionStore:
+    """
+    Projects of every session, shared until written.
+
+    `read` returns the project a session currently sees and must not be
+    mutated; `write` returns the session's own copy for editing and marks the
+    handle changed. Both are O(1) apart from the one copy on a session's
+    first write and loading a spilled project back.
+
+    With a `budget` in bytes, sweeps run at most every `SWEEP_INTERVAL`
+    seconds on `writer` (or their own thread) and spill idle sessions until
+    the resident projects fit. Sizes are measured with `resident_bytes` when
+    a session goes idle; until then a fresh copy counts as the base's size.
+
+    With a `history`, which is reset to the base, every session's first
+    write also gives it a fork of that history, returned by `history`. Its
+    `nbytes`, and the copy of the project it keeps, count towards the
+    session's size, updated on every `write` and `history` call.
+
+    Sweeps also drop sessions closed more than `closed_seconds` ago.
+    """
+
+    def __init__(
+        self,
+        base: Project | None = None,
+        budget: int | None = None,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        spill_dir: str | None = None,
+        writer: BackgroundWriter | None = None,
+        history: History | None = None,
+        closed_seconds: float = DEFAULT_CLOSED_SECONDS,
+    ):
+        self._base = base if base is not None else Project()
+        self._base_bytes = resident_bytes(self._base)
+        self._history = history
+        if history is not None:
+            history.reset(self._base)
+        self.budget = budget
+        self.idle_seconds = idle_seconds
+        self.closed_seconds = closed_seconds
+        self.writer = writer
+        self._spill_dir = spill_dir
+        # Least recently used first.
+        self._sessions: OrderedDict[int, _Session] = OrderedDict()
+        self._keys = itertools.count()
+        # Browser token -> key of the last session registered under it.
+        self._tokens: dict[str, int] = {}
+        # Closed sessions kept for their browser's next session, oldest
+        # first, with when they were closed.
+        self._closed: dict[int, float] = {}
+        self._lock = threading.Lock()
+        # Notified whenever a spilled project has been read back.
+        self._loaded = threading.Condition(self._lock)
+        self._sweep_lock = threading.Lock()
+        self._resident_bytes = 0
+        self._next_sweep = 0.0
+        self._sweeping = False
+        self.copies = 0
+        self.evictions = 0
+        self.rehydrations = 0
+        self.expirations = 0
+
+    def handle(self) -> SketchHandle:
+        return SketchHandle(self, next(self._keys))
+
+    def _touch(self, key: int) -> _Session | None:
+        """
+        The session for `key`, with its project in memory, or None.
+
+        Called with the lock held. A spilled project is read back with the
+        lock released, so other sessions are not held up meanwhile; other
+        events of the same session wait for it.
+        """
+        while True:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            self._sessions.move_to_end(key)
+            session.used = time.monotonic()
+            if session.project is not None:
+                return session
+            if session.loading:
+                self._loaded.wait()
+                continue
+            session.loading = True
+            path = session.spilled
+            self._lock.release()
+            try:
+                with open(path, "rb") as f:
+                    project, history = pickle.load(f)
+                os.remove(path)
+            finally:
+                self._lock.acquire()
+                session.loading = False
+                self._loaded.notify_all()
+            if self._sessions.get(key) is session:
+                session.project, session.spilled = project, None
+                session.history = history
+                self._resident_bytes += session.size()
+                self.rehydrations += 1
+
+    def read(self, handle: SketchHandle) -> Project:
+        with self._lock:
+            session = self._touch(handle.key)
+            project = self._base if session is None else session.project
+        self._maybe_sweep()
+        return project
+
+    def write(self, handle: SketchHandle) -> Project:
+        with self._lock:
+            session = self._touch(handle.key)
+            if session is None:
+                session = _Session(
+                    copy.deepcopy(self._base),
+                    self._base_bytes,
+                    None if self._history is None else self._history.fork(),
+                )
+                self._sessions[handle.key] = session
+                self._resident_bytes += session.size()
+                self.copies += 1
+            self._count_history(session)
+            session.dirty = True
+            handle.version += 1
+            project = session.project
+        self._maybe_sweep()
+        return project
+
+    def replace(
+        self, handle: SketchHandle, project: Project, history: History | None = None
+    ) -> None:
+        """
+        Give the session `project`, which it then owns.
+
+        The session keeps its history (or, before its first write, gets a
+        fork of the base's) unless `history` is given.
+        """
+        with self._lock:
+            previous = self._touch(handle.key)
+            if history is None:
+                if previous is not None:
+                    history = previous.history
+                elif self._history is not None:
+                    history = self._history.fork()
+            self._drop(handle.key)
+            session = _Session(
+                project,
+                self._base_bytes if previous is None else previous.nbytes,
+                history,
+            )
+            self._sessions[handle.key] = session
+            self._resident_bytes += session.size()
+            handle.version += 1
+        self._maybe_sweep()
+
+    def history(self, handle: SketchHandle) -> History | None:
+        """The session's undo history; None until its first write."""
+        with self._lock:
+            session = self._touch(handle.key)
+            if session is None:
+                return None
+            self._count_history(session)
+            return session.history
+
+    def _count_history(self, session: _Session) -> None:
+        """Count what a resident session's history grew by; called with the lock held."""
+        if session.history is not None:
+            delta = session.history.nbytes - session.history_bytes
+            session.history_bytes += delta
+            self._resident_bytes += delta
+
+    def adopt(self, handle: SketchHandle, token: str) -> bool:
+        """
+        Register the session under browser `token`, taking over the sketch.
+
+        If an earlier session in the same browser (e.g. before a reload)
+        made edits, the session takes over its project and history, and so
+        can undo those edits; returns whether it did. A session that is
+        still open, in another tab, is copied instead. Only that browser's
+        own session is ever taken over.
+        """
+        with self._lock:
+            handle.token = token
+            key = self._tokens.get(token)
+            self._tokens[token] = handle.key
+            if key is None or key == handle.key:
+                return False
+            previous = self._touch(key)
+            if previous is None:
+                self._closed.pop(key, None)
+                return False
+            project, history = previous.project, previous.history
+            if key in self._closed:
+                del self._closed[key]
+                self._drop(key)
+            else:
+                project = copy.deepcopy(project)
+                history = None if history is None else history.fork()
+                self.copies += 1
+        self.replace(handle, project, history)
+        return True
+
+    def discard(self, handle: SketchHandle) -> None:
+        """
+        Forget a closed session.
+
+        A session registered under a browser token is kept until another
+        session of that browser adopts it or registers instead, so reloading
+        the page does not lose the sketch.
+        """
+        with self._lock:
+            token = handle.token
+            if token is not None and self._tokens.get(token) == handle.key:
+                self._closed[handle.key] = time.monotonic()
+            else:
+                self._drop(handle.key)
+
+    def _drop(self, key: int) -> _Session | None:
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return None
+        if session.project is not None:
+            self._resident_bytes -= session.size()
+        elif not session.loading:
+            # Otherwise the loading thread removes the file.
+            os.remove(session.spilled)
+        return session
+
+    def _spill_path(self, key: int) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="gradio-visualizer-sessions-")
+            weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return os.path.join(self._spill_dir, f"{key}.pickle")
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._sweeping or now < self._next_sweep:
+                return
+            over_budget = (
+                self.budget is not None
+                and self._base_bytes + self._resident_bytes > self.budget
+            )
+            if not over_budget and not self._expired(now):
+                return
+            self._sweeping = True
+            self._next_sweep = now + SWEEP_INTERVAL
+        if self.writer is not None:
+            self.writer.submit(("sessions", id(self)), self.sweep)
+        else:
+            threading.Thread(
+                target=self.sweep, name="session-eviction", daemon=True
+            ).start()
+
+    def sweep(self) -> int:
+        """
+        Drop expired closed sessions, then spill idle sessions, least
+        recently used first, until within budget; returns how many spilled.
+        """
+        with self._sweep_lock:
+            try:
+                self._expire()
+                return 0 if self.budget is None else self._sweep()
+            finally:
+                with self._lock:
+                    self._sweeping = False
+
+    def _expired(self, now: float) -> bool:
+        """Whether a closed session is due to be dropped; called with the lock held."""
+        oldest = next(iter(self._closed.values()), None)
+        return oldest is not None and oldest <= now - self.closed_seconds
+
+    def _expire(self) -> int:
+        """Drop sessions closed more than `closed_seconds` ago; returns how many."""
+        deadline = time.monotonic() - self.closed_seconds
+        expired = set()
+        with self._lock:
+            while self._closed:
+                key, closed = next(iter(self._closed.items()))
+                if closed > deadline:
+                    break
+                del self._closed[key]
+                self._drop(key)
+                expired.add(key)
+            if expired:
+                self._tokens = {
+                    token: key
+                    for token, key in self._tokens.items()
+                    if key not in expired
+                }
+                self.expirations += len(expired)
+        return len(expired)
+
+    def _sweep(self) -> int:
+        deadline = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = []
+            for key, session in self._sessions.items():
+                if session.used > deadline:
+                    break
+                if session.project is not None:
+                    idle.append((key, session))
+        # Projects are measured and pickled without the lock. A session that
+        # has an event meanwhile may be edited while that happens, so the
+        # result is only published if the session was not used since.
+        for _, session in idle:
+            with self._lock:
+                project, used = session.project, session.used
+                if not session.dirty or project is None:
+                    continue
+            size = resident_bytes(project)
+            with self._lock:
+                if session.project is project and session.used == used:
+                    before = session.size()
+                    session.nbytes, session.dirty = size, False
+                    self._resident_bytes += session.size() - before
+        evicted = 0
+        for key, session in idle:
+            with self._lock:
+                if self._base_bytes + self._resident_bytes <= self.budget:
+                    break
+                if (
+                    self._sessions.get(key) is not session
+                    or session.project is None
+                    or session.used > deadline
+                ):
+                    continue
+                project, used = session.project, session.used
+                path = self._spill_path(key)
+            try:
+                payload = pickle.dumps(
+                    (project, session.history), pickle.HIGHEST_PROTOCOL
+                )
+            except RuntimeError:
+                # Changed while being pickled, so no longer idle.
+                continue
+            with open(path, "wb") as f:
+                f.write(payload)
+            with self._lock:
+                if (
+                    self._sessions.get(key) is session
+                    and session.project is not None
+                    and session.used == used
+                ):
+                    session.project, session.spilled = None, path
+                    self._resident_bytes -= session.size()
+                    self.evictions += 1
+                    evicted += 1
+                    continue
+            # The session had another event meanwhile.
+            os.remove(path)
+        return evicted
+
+    def history_stats(self) -> dict[str, int]:
+        """Undo and redo steps, and their bytes, held by the sessions in memory."""
+        with self._lock:
+            histories = [
+                s.history
+                for s in self._sessions.values()
+                if s.project is not None and s.history is not None
+            ]
+        totals = {"undo_steps": 0, "redo_steps": 0, "bytes": 0}
+        for history in histories:
+            for name, value in history.stats().items():
+                totals[name] += value
+        return totals
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            resident = sum(s.project is not None for s in self._sessions.values())
+            return {
+                "resident_sessions": resident,
+                "spilled_sessions": len(self._sessions) - resident,
+                "resident_bytes": self._base_bytes + self._resident_bytes,
+                "evictions": self.evictions,
+                "rehydrations": self.rehydrations,
+                "copies": self.copies,
+                "closed_sessions": len(self._closed),
+                "expirations": self.expirations,
+            }
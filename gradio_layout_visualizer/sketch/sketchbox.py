@@ -19,6 +19,8 @@ class SketchBox(BlockContext, metaclass=ComponentMeta):
         is_input: bool = False,
         is_output: bool = False,
         triggers: list[str] | None = None,
+        node_id: int | None = None,
+        key: int | str | tuple[int | str, ...] | None = None,
     ):
         self.row = False
         self.is_container = is_container
@@ -30,7 +32,8 @@ class SketchBox(BlockContext, metaclass=ComponentMeta):
         self.is_input = is_input
         self.is_output = is_output
         self.triggers = triggers or []
-        super().__init__()
+        self.node_id = node_id
+        super().__init__(key=key)
 
     def __exit__(self, exc_type: type[BaseException] | None = None, *args):
         from gradio.layouts import Row
@@ -0,0 +1,131 @@
+"""Crash-safe, non-blocking file writes for saved projects and apps.
+
+Files are written to a temporary file in the same directory, fsynced and
+renamed over the target, so a reader or a crash never sees a half-written
+`app.py` or project file. Writes whose content matches what was last
+written (or what is on disk) are skipped.
+
+`background_writer` runs writes on a single I/O thread, off gradio's handler
+threads, in submission order. A write submitted while another for the same
+key is still queued replaces it, so rapid repeated saves of one project
+result in a single write of the latest content.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from gradio_layout_visualizer.sketch.metrics import register_stats
+
+_lock = threading.Lock()
+_written_hashes: dict[str, str] = {}
+writer_stats = {"written": 0, "skipped": 0, "coalesced": 0, "failed": 0}
+
+
+def _count(name: str) -> None:
+    with _lock:
+        writer_stats[name] += 1
+
+
+def _digest(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+def atomic_write(path: str, payload: bytes) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_if_changed(path: str, payload: bytes) -> bool:
+    """Atomically write `payload` to `path` unless it already holds it."""
+    path = os.path.abspath(path)
+    digest = _digest(payload)
+    with _lock:
+        known = _written_hashes.get(path)
+    if known is None:
+        try:
+            with open(path, "rb") as f:
+                known = _digest(f.read())
+        except OSError:
+            pass
+    if known == digest and os.path.exists(path):
+        _count("skipped")
+        return False
+    atomic_write(path, payload)
+    with _lock:
+        _written_hashes[path] = digest
+        writer_stats["written"] += 1
+    return True
+
+
+class BackgroundWriter:
+    """
+    Runs write callables on one I/O thread, coalescing by key.
+
+    `submit(key, fn)` returns a future for `fn()`. If a write for `key` is
+    queued but not yet started, `fn` replaces it and the same future is
+    returned.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="gradio-visualizer-save"
+        )
+        self._lock = threading.Lock()
+        self._queued: dict[Hashable, tuple[Callable[[], Any], Future]] = {}
+
+    def submit(self, key: Hashable, fn: Callable[[], Any]) -> Future:
+        with self._lock:
+            if key in self._queued:
+                future = self._queued[key][1]
+                self._queued[key] = (fn, future)
+                _count("coalesced")
+                return future
+            future = Future()
+            self._queued[key] = (fn, future)
+        self._executor.submit(self._run, key)
+        return future
+
+    def _run(self, key: Hashable) -> None:
+        with self._lock:
+            fn, future = self._queued.pop(key)
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:  # noqa: BLE001 -- handed to the future, as concurrent.futures does
+            _count("failed")
+            future.set_exception(e)
+
+    def flush(self) -> None:
+        """Wait for every write submitted so far."""
+        self._executor.submit(lambda: None).result()
+
+
+def stats() -> dict[str, int]:
+    with _lock:
+        return dict(writer_stats)
+
+
+background_writer = BackgroundWriter()
+register_stats("saves", stats)
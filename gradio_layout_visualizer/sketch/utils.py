@@ -1,12 +1,34 @@
 import ast
+import asyncio
+import functools
 import inspect
-from collections.abc import Callable
-from typing import Union
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Hashable
+from typing import Any, Union
 
-import huggingface_hub
+from gradio_layout_visualizer.sketch.generation_cache import (
+    generation_cache,
+    generation_key,
+)
+from gradio_layout_visualizer.sketch.inference import async_client_pool, client_pool
+from gradio_layout_visualizer.sketch.metrics import handler_metrics
 
 code_model = "Qwen/Qwen2.5-Coder-32B-Instruct"
 
+# Streamed code is pushed to the browser at most this often, or after this
+# many tokens, whichever comes first.
+STREAM_YIELD_INTERVAL = 0.05
+STREAM_YIELD_TOKENS = 16
+
+# "Generate all functions" runs this many generations at once by default and
+# refreshes its progress table at most this often.
+DEFAULT_BATCH_PARALLELISM = 4
+BATCH_UPDATE_INTERVAL = 0.25
+
+VALUE_DESCRIPTION_CACHE_SIZE = 1024
+
 
 def is_number(s: str) -> bool:
     try:
@@ -35,28 +57,94 @@ def set_kwarg(obj: dict, key: str, value: str) -> None:
         obj[key] = value
 
 
-def get_header(fn_name: str, inputs: list[str]):
+def get_header(fn_name: str, inputs: list[str], batch: bool = False):
+    if batch:
+        inputs = [f"{name}: list" for name in inputs]
     return f"def {fn_name}({', '.join(inputs)}):"
 
 
-def ai(
+class CodeFenceParser:
+    """
+    Extracts the code of the first ```python block from a streamed response.
+
+    Each chunk is scanned once: only the chunk plus the last few characters
+    of the previous ones (enough to catch a fence split across chunks) are
+    searched. Until an opening fence arrives the whole response counts as
+    code, matching models that answer without backticks. Text after the
+    closing fence is ignored.
+    """
+
+    OPEN = "```python\n"
+    CLOSE = "\n```"
+    _OVERLAP = max(len(OPEN), len(CLOSE)) - 1
+
+    def __init__(self):
+        self._parts: list[str] = []
+        self._length = 0
+        self._tail = ""
+        self._start: int | None = None
+        self._end: int | None = None
+
+    @property
+    def closed(self) -> bool:
+        return self._end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; return whether the extracted code changed."""
+        if not chunk or self.closed:
+            return False
+        window = self._tail + chunk
+        offset = self._length - len(self._tail)
+        if self._start is None:
+            found = window.find(self.OPEN)
+            if found != -1:
+                self._start = offset + found + len(self.OPEN)
+        if self._start is not None:
+            found = window.find(self.CLOSE, max(0, self._start - offset))
+            if found != -1:
+                self._end = offset + found
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        self._tail = window[-self._OVERLAP :]
+        return True
+
+    @property
+    def code(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        content = self._parts[0] if self._parts else ""
+        if self._start is None:
+            return content
+        return content[self._start : self._end]
+
+
+def build_chat_history(
     history: list[tuple[str, str]],
-    hf_token: str,
     fn_name: str,
     inputs: list[tuple[str, type, dict]],
     output_types: list[tuple[type, dict]],
-):
+    batch: bool = False,
+) -> list[dict]:
     full_prompt = f"""Create a python function with the following header:
-`{get_header(fn_name, [i[0] for i in inputs])}`\n"""
+`{get_header(fn_name, [i[0] for i in inputs], batch)}`\n"""
+    if batch:
+        full_prompt += "The function is called with a batch of requests at once: each argument is a list holding one value per request, and all the lists have the same length.\n"
     if len(inputs) > 0:
         if len(inputs) == 1:
-            full_prompt += f"""The value of '{inputs[0][0]}' is passed as: {get_value_description(inputs[0][1], inputs[0][2])}.\n"""
+            if batch:
+                full_prompt += f"""Each element of '{inputs[0][0]}' is passed as: {get_value_description(inputs[0][1], inputs[0][2])}.\n"""
+            else:
+                full_prompt += f"""The value of '{inputs[0][0]}' is passed as: {get_value_description(inputs[0][1], inputs[0][2])}.\n"""
         else:
             full_prompt += "The inputs are passed as follows:\n"
             for i in inputs:
-                full_prompt += f"""- '{i[0]}' is passed as: {get_value_description(i[1], i[2])}.\n"""
+                full_prompt += f"""- {"each element of " if batch else ""}'{i[0]}' is passed as: {get_value_description(i[1], i[2])}.\n"""
     if len(output_types) > 0:
-        if len(output_types) == 1:
+        if batch:
+            full_prompt += "The function should return a tuple with one list per output, even if there is only one output. Each list holds one value per request, in the order of the inputs:\n"
+            for index, o in enumerate(output_types):
+                full_prompt += f"""- index {index} should be a list of: {get_value_description(o[0], o[1])}.\n"""
+        elif len(output_types) == 1:
             full_prompt += f"""The function should return a value as: {get_value_description(output_types[0][0], output_types[0][1])}.\n"""
         else:
             full_prompt += (
@@ -67,6 +155,8 @@ def ai(
     full_prompt += (
         f"""The function should perform the following task: {history[0][0]}\n"""
     )
+    if batch:
+        full_prompt += "Process the whole batch at once where possible, e.g. with vectorized numpy or pandas operations or one batched model call, rather than looping over the requests.\n"
     full_prompt += "Return only the python code of the function in your response. Do not wrap the code in backticks or include any description before the response. Return ONLY the function code. Start your response with the header provided. Include any imports inside the function.\n"
     full_prompt += """If using an LLM would help with the task, use the huggingface_hub library. For example:
 ```python
@@ -93,25 +183,223 @@ If an LLM is not helpful for the task, there is no need to use huggingface_hub.
         chat_history.append({"role": "user", "content": user_msg})
         if bot_msg is not None:
             chat_history.append({"role": "assistant", "content": bot_msg})
+    return chat_history
 
-    client = huggingface_hub.InferenceClient(token=hf_token)
-    content = ""
-    for token in client.chat_completion(chat_history, stream=True, model=code_model):
-        content += token.choices[0].delta.content or "" if token.choices else ""
-        if "```python\n" in content:
-            start = content.index("```python\n") + len("```python\n")
-            end = content.find("\n```", start)
-            yield content[start:end] if end != -1 else content[start:]
-        else:
-            yield content
 
+class CodeStream:
+    """
+    Per-generation bookkeeping shared by `ai` and `ai_async`.
 
-def get_value_description(component_class, config):
-    component = component_class(render=False, **config)
-    value_description = getattr(component, "_value_description", None)
-    if value_description is not None:
-        return value_description
+    Feeds streamed chunks to a `CodeFenceParser` and decides when to yield:
+    once `yield_interval` seconds or `yield_tokens` changed chunks have
+    passed since the last yield. `finish` returns any code still held back,
+    records the timing and stores the result in `generation_cache`.
+    """
+
+    def __init__(self, key: str, yield_interval: float, yield_tokens: int):
+        self.key = key
+        self.yield_interval = yield_interval
+        self.yield_tokens = yield_tokens
+        self.parser = CodeFenceParser()
+        self.pending = 0
+        self.last_yield = 0.0
+        self.start = time.perf_counter()
+        self.first_token: float | None = None
+
+    def feed(self, token) -> str | None:
+        chunk = token.choices[0].delta.content or "" if token.choices else ""
+        if not self.parser.feed(chunk):
+            return None
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+            if handler_metrics.enabled:
+                handler_metrics.record("generate.ttft", now - self.start, 0)
+        self.pending += 1
+        if (
+            self.pending >= self.yield_tokens
+            or now - self.last_yield >= self.yield_interval
+        ):
+            self.pending, self.last_yield = 0, now
+            return self.parser.code
+        return None
+
+    def finish(self) -> str | None:
+        if handler_metrics.enabled:
+            handler_metrics.record(
+                "generate.total", time.perf_counter() - self.start, 0
+            )
+        code = self.parser.code
+        if code:
+            generation_cache.put(self.key, code)
+        return code if self.pending else None
+
+
+def ai(
+    history: list[tuple[str, str]],
+    hf_token: str,
+    fn_name: str,
+    inputs: list[tuple[str, type, dict]],
+    output_types: list[tuple[type, dict]],
+    yield_interval: float = STREAM_YIELD_INTERVAL,
+    yield_tokens: int = STREAM_YIELD_TOKENS,
+    batch: bool = False,
+):
+    """
+    Stream the generated function code.
+
+    Updates are coalesced: the code is yielded when at least `yield_interval`
+    seconds or `yield_tokens` tokens have passed since the last yield, and
+    once more at the end so the final code is never held back. A request
+    identical to an earlier completed one is answered from `generation_cache`
+    in a single yield. With `batch`, the function is asked to take a list per
+    input and return a list per output, for a `batch=True` event listener.
+    """
+    chat_history = build_chat_history(
+        history, fn_name, inputs, output_types, batch
+    )
+    key = generation_key(code_model, chat_history)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    stream = CodeStream(key, yield_interval, yield_tokens)
+    with client_pool.client(hf_token, code_model) as client:
+        for token in client.chat_completion(
+            chat_history, stream=True, model=code_model
+        ):
+            code = stream.feed(token)
+            if code is not None:
+                yield code
+    code = stream.finish()
+    if code is not None:
+        yield code
+
+
+async def ai_async(
+    history: list[tuple[str, str]],
+    hf_token: str,
+    fn_name: str,
+    inputs: list[tuple[str, type, dict]],
+    output_types: list[tuple[type, dict]],
+    yield_interval: float = STREAM_YIELD_INTERVAL,
+    yield_tokens: int = STREAM_YIELD_TOKENS,
+    batch: bool = False,
+):
+    """
+    Same as `ai`, on `AsyncInferenceClient`.
+
+    Runs on the event loop, so a generation in flight does not occupy one
+    of gradio's worker threads while it waits on the model.
+    """
+    chat_history = build_chat_history(
+        history, fn_name, inputs, output_types, batch
+    )
+    key = generation_key(code_model, chat_history)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    stream = CodeStream(key, yield_interval, yield_tokens)
+    async with async_client_pool.client(hf_token, code_model) as client:
+        async for token in await client.chat_completion(
+            chat_history, stream=True, model=code_model
+        ):
+            code = stream.feed(token)
+            if code is not None:
+                yield code
+    code = stream.finish()
+    if code is not None:
+        yield code
+
+
+async def ai_batch(
+    jobs: dict[Hashable, dict],
+    hf_token: str,
+    parallelism: int = DEFAULT_BATCH_PARALLELISM,
+    update_interval: float = BATCH_UPDATE_INTERVAL,
+) -> AsyncIterator[dict[Hashable, dict]]:
+    """
+    Generate several functions concurrently.
+
+    `jobs` maps a key to the keyword arguments of `ai_async` (history,
+    fn_name, inputs, output_types and optionally batch). At most `parallelism` generations stream
+    at once. Yields snapshots of every job's progress, at most once per
+    `update_interval` seconds and once more when all have finished; each
+    entry has a `status` ("queued", "generating", "done" or "error"), the
+    latest `code`, the `seconds` it took and the `error` message, if any.
+    """
+    progress = {
+        key: {"status": "queued", "code": None, "seconds": None, "error": None}
+        for key in jobs
+    }
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+    changed = asyncio.Event()
+
+    async def run(key: Hashable, job: dict):
+        entry = progress[key]
+        async with semaphore:
+            entry["status"] = "generating"
+            changed.set()
+            start = time.perf_counter()
+            try:
+                async for code in ai_async(hf_token=hf_token, **job):
+                    entry["code"] = code
+                    changed.set()
+                entry["status"] = "done"
+            except Exception as e:  # noqa: BLE001 -- reported per job, the batch goes on
+                entry["status"], entry["error"] = "error", str(e)
+            entry["seconds"] = time.perf_counter() - start
+            changed.set()
 
+    tasks = [asyncio.create_task(run(key, job)) for key, job in jobs.items()]
+    try:
+        while not all(task.done() for task in tasks):
+            await changed.wait()
+            changed.clear()
+            yield {key: dict(entry) for key, entry in progress.items()}
+            await asyncio.sleep(update_interval)
+        yield {key: dict(entry) for key, entry in progress.items()}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def freeze_config(value: Any) -> Hashable:
+    """Hashable, key-order-independent form of a component config."""
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), freeze_config(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(freeze_config(v) for v in value))
+    try:
+        hash(value)
+    except TypeError:
+        return ("repr", repr(value))
+    # Keep 1, 1.0 and True apart.
+    return (type(value).__name__, value)
+
+
+@functools.cache
+def sets_value_description(component_class: type) -> bool:
+    """
+    Whether constructing the component can set `_value_description`.
+
+    Read from the bytecode of the `__init__`s in its MRO, where the attribute
+    only ever appears as an assignment target. Components that never set it
+    are described by their `value` type hint alone.
+    """
+    for cls in component_class.__mro__:
+        init = cls.__dict__.get("__init__")
+        code = getattr(inspect.unwrap(init), "__code__", None) if init else None
+        if code is not None and "_value_description" in code.co_names:
+            return True
+    return False
+
+
+@functools.cache
+def get_type_hint_description(component_class: type) -> str:
     value_type_hint = extract_value_type_hint(component_class.__init__)
     all_hints = value_type_hint.split(" | ")
     if "None" in all_hints:
@@ -121,6 +409,38 @@ def get_value_description(component_class, config):
     return " | ".join(all_hints)
 
 
+_value_descriptions: OrderedDict[tuple, str] = OrderedDict()
+_value_descriptions_lock = threading.Lock()
+
+
+def get_value_description(component_class, config):
+    """
+    Describe how a component's value is passed to and returned from functions.
+
+    Components whose constructor never sets `_value_description` are described
+    from their class alone. The others are instantiated once per distinct
+    (class, config), with the result kept in a bounded LRU.
+    """
+    if not sets_value_description(component_class):
+        return get_type_hint_description(component_class)
+    key = (component_class, freeze_config(config))
+    with _value_descriptions_lock:
+        value_description = _value_descriptions.get(key)
+        if value_description is not None:
+            _value_descriptions.move_to_end(key)
+            return value_description
+
+    component = component_class(render=False, **config)
+    value_description = getattr(component, "_value_description", None)
+    if value_description is None:
+        value_description = get_type_hint_description(component_class)
+    with _value_descriptions_lock:
+        _value_descriptions[key] = value_description
+        while len(_value_descriptions) > VALUE_DESCRIPTION_CACHE_SIZE:
+            _value_descriptions.popitem(last=False)
+    return value_description
+
+
 def extract_value_type_hint(func: Callable) -> str:
     sig = inspect.signature(func)
 
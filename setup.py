@@ -9,7 +9,11 @@ setup(
     install_requires=[
         "gradio>=5.0.0",
         "huggingface-hub>=0.20.0",
+        "orjson>=3.0",
     ],
+    extras_require={
+        "msgpack": ["msgpack>=1.0"],
+    },
     python_requires=">=3.8",
     entry_points={
         "console_scripts": [
@@ -0,0 +1,164 @@
+"""Incremental code generation against the original whole-file generator."""
+
+import copy
+
+import pytest
+
+from gradio_layout_visualizer.bench import synthetic_sketch
+from gradio_layout_visualizer.sketch.codegen import CodeEmitter
+
+
+def baseline_render_code(layout, components, dependencies):
+    """`render_code` as it was before `CodeEmitter`, over the nested-list layout."""
+    code_str = ""
+
+    def render_code_slot(slot, is_column, depth=1):
+        nonlocal code_str
+        for element in slot:
+            if isinstance(element, list):
+                code_str += (
+                    "    " * depth
+                    + "with gr."
+                    + ("Row" if is_column else "Column")
+                    + "():\n"
+                )
+                render_code_slot(element, not is_column, depth + 1)
+                continue
+            component_name, kwargs, var_name = components[element]
+            code_str += "    " * depth + var_name + " = gr." + component_name + "("
+            for i, (k, v) in enumerate(kwargs.items()):
+                v = f'"{v}"'.replace("\n", "\\n") if isinstance(v, str) else v
+                if i != 0:
+                    code_str += ", "
+                code_str += f"{k}={v}"
+            code_str += ")\n"
+
+    render_code_slot(layout, True)
+
+    for dep in dependencies:
+        triggers = [components[c][2] + "." + t for c, t in dep[0]]
+        inputs = [components[c][2] for c in dep[1]]
+        outputs = [components[c][2] for c in dep[2]]
+        fn_name = dep[3]
+        if dep[5] is not None:
+            fn_code = dep[5].replace("\n", "\n    ")
+        else:
+            fn_code = f"""def {fn_name}({", ".join(inputs)}):
+        ...
+        return {", ".join(["..." for _ in outputs])}"""
+
+        code_str += f"""
+    @{triggers[0] + "(" if len(triggers) == 1 else "gr.on([" + ", ".join(triggers) + "], "}inputs=[{", ".join(inputs)}], outputs=[{", ".join(outputs)}])
+    {fn_code}
+"""
+    return f"""import gradio as gr
+
+with gr.Blocks() as demo:
+{code_str}
+demo.launch()"""
+
+
+def expected(layout, components, dependencies):
+    return baseline_render_code(layout.to_list(), components, dependencies)
+
+
+def depth(layout, component_id):
+    node, levels = layout.node(component_id), 0
+    while node.parent is not None:
+        node, levels = node.parent, levels + 1
+    return levels
+
+
+@pytest.fixture
+def sketch():
+    return synthetic_sketch(300, seed=3)
+
+
+def test_emit_matches_baseline_on_nested_sketch(sketch):
+    layout, components, dependencies = sketch
+    assert any(isinstance(e, list) for e in layout.to_list())
+    code = CodeEmitter().emit(layout, components, dependencies)
+    assert code == expected(layout, components, dependencies)
+
+
+def test_touched_edits_match_baseline(sketch):
+    layout, components, dependencies = sketch
+    emitter = CodeEmitter()
+    emitter.emit(layout, components, dependencies)
+    # A component nested a few levels deep, and one directly in the root.
+    deep = max(layout.component_ids(), key=lambda c: depth(layout, c))
+    shallow = min(layout.component_ids(), key=lambda c: depth(layout, c))
+    assert depth(layout, deep) > 2 and depth(layout, shallow) == 1
+    for step, component_id in enumerate([deep, shallow, deep]):
+        components[component_id][1]["label"] = f"edit {step}"
+        components[component_id][2] = f"renamed_{step}"
+        emitter.touch(component_id)
+        # Renames show up in the functions too.
+        emitter.touch_functions()
+        code = emitter.emit_if_changed(layout, components, dependencies)
+        assert code == expected(layout, components, dependencies)
+
+
+def test_structural_edits_match_baseline(sketch):
+    layout, components, dependencies = sketch
+    emitter = CodeEmitter()
+    emitter.emit(layout, components, dependencies)
+    layout.insert(1000, 5, "right")
+    components[1000] = ["Textbox", {}, "textbox_1000"]
+    emitter.touch(1000)
+    assert emitter.emit(layout, components, dependencies) == expected(
+        layout, components, dependencies
+    )
+    removed = set(layout.remove(layout.node(7).parent.id))
+    for component_id in removed:
+        del components[component_id]
+    dependencies[:] = [
+        dep
+        for dep in dependencies
+        if removed.isdisjoint([c for c, _ in dep[0]] + dep[1] + dep[2])
+    ]
+    emitter.touch_functions()
+    assert emitter.emit(layout, components, dependencies) == expected(
+        layout, components, dependencies
+    )
+    # Up to the root column, so the moved line changes depth.
+    deep = max(layout.component_ids(), key=lambda c: depth(layout, c))
+    shallow = min(layout.component_ids(), key=lambda c: depth(layout, c))
+    layout.move(deep, shallow, "down")
+    assert emitter.emit(layout, components, dependencies) == expected(
+        layout, components, dependencies
+    )
+
+
+def test_untouched_emit_reports_no_change(sketch):
+    layout, components, dependencies = sketch
+    emitter = CodeEmitter()
+    assert emitter.emit_if_changed(layout, components, dependencies) is not None
+    assert emitter.emit_if_changed(layout, components, dependencies) is None
+    emitter.touch(3)
+    assert emitter.emit_if_changed(layout, components, dependencies) is None
+
+
+def test_functions_are_only_rerendered_when_touched(sketch):
+    layout, components, dependencies = sketch
+    emitter = CodeEmitter()
+    emitter.emit(layout, components, dependencies)
+    dependencies[0][3] = "renamed_fn"
+    assert "renamed_fn" not in emitter.emit(layout, components, dependencies)
+    emitter.touch_functions()
+    assert emitter.emit(layout, components, dependencies) == expected(
+        layout, components, dependencies
+    )
+
+
+def test_replaced_layout_starts_over(sketch):
+    layout, components, dependencies = sketch
+    emitter = CodeEmitter()
+    emitter.emit(layout, components, dependencies)
+    # As undo does: a new tree, and entries changed without `touch`.
+    restored = copy.deepcopy(layout)
+    components = copy.deepcopy(components)
+    components[0][1]["label"] = "restored"
+    assert emitter.emit(restored, components, dependencies) == expected(
+        restored, components, dependencies
+    )
@@ -0,0 +1,170 @@
+"""Code generation against the local mock completion server."""
+
+import asyncio
+
+import gradio as gr
+import pytest
+
+from gradio_layout_visualizer.mock_inference import MockCompletionServer
+from gradio_layout_visualizer.sketch import utils
+from gradio_layout_visualizer.sketch.generation_cache import GenerationCache
+from gradio_layout_visualizer.sketch.inference import async_client_pool, client_pool
+from gradio_layout_visualizer.sketch.metrics import handler_metrics
+from gradio_layout_visualizer.sketch.utils import (
+    CodeFenceParser,
+    ai,
+    ai_async,
+    ai_batch,
+)
+
+INPUTS = [("textbox", gr.Textbox, {})]
+OUTPUT_TYPES = [(gr.Markdown, {})]
+
+EXPECTED = "def fn_1(textbox):\n    # Generated offline\n    return None"
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockCompletionServer(first_token_delay=0.05, token_delay=0.001) as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def mock_inference(server, monkeypatch):
+    monkeypatch.setattr(client_pool, "base_url", server.url)
+    monkeypatch.setattr(async_client_pool, "base_url", server.url)
+    monkeypatch.setattr(utils, "generation_cache", GenerationCache())
+    yield
+    client_pool.clear()
+    # Async clients belong to the event loop of the test that made them.
+    async_client_pool.clear()
+
+
+def job(fn_name="fn_1", prompt="Echo the text."):
+    return {
+        "history": [[prompt, None]],
+        "fn_name": fn_name,
+        "inputs": INPUTS,
+        "output_types": OUTPUT_TYPES,
+    }
+
+
+async def collect(stream):
+    return [code async for code in stream]
+
+
+def test_ai_streams_the_generated_function(server):
+    requests = server.requests
+    codes = list(ai(hf_token="hf_test", **job()))
+    assert codes[-1] == EXPECTED
+    assert server.requests == requests + 1
+
+
+def test_ai_async_streams_the_generated_function(server):
+    codes = asyncio.run(collect(ai_async(hf_token="hf_test", **job())))
+    assert codes[-1] == EXPECTED
+
+
+def test_identical_request_is_served_from_cache(server):
+    list(ai(hf_token="hf_test", **job()))
+    requests = server.requests
+    assert list(ai(hf_token="hf_test", **job())) == [EXPECTED]
+    assert asyncio.run(collect(ai_async(hf_token="hf_test", **job()))) == [EXPECTED]
+    assert server.requests == requests
+    assert utils.generation_cache.stats()["memory_hits"] == 2
+
+
+def test_changed_prompt_misses_cache(server):
+    list(ai(hf_token="hf_test", **job()))
+    requests = server.requests
+    list(ai(hf_token="hf_test", **job(prompt="Shout the text.")))
+    assert server.requests == requests + 1
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_generation_timing_is_only_recorded_with_metrics_enabled(
+    server, monkeypatch, enabled
+):
+    monkeypatch.setattr(handler_metrics, "enabled", enabled)
+    handler_metrics.reset()
+    list(ai(hf_token="hf_test", **job()))
+    recorded = set(handler_metrics.snapshot())
+    assert recorded == ({"generate.ttft", "generate.total"} if enabled else set())
+
+
+def test_ai_batch_generates_every_job_within_parallelism(server):
+    jobs = {i: job(fn_name=f"fn_{i}") for i in range(6)}
+
+    async def run():
+        server.max_in_flight = 0
+        snapshots = [p async for p in ai_batch(jobs, "hf_test", parallelism=2)]
+        return snapshots[-1]
+
+    progress = asyncio.run(run())
+    assert 0 < server.max_in_flight <= 2
+    for i, entry in progress.items():
+        assert entry["status"] == "done"
+        assert entry["error"] is None
+        assert entry["code"].startswith(f"def fn_{i}(textbox):")
+
+
+def test_ai_batch_reports_failures_per_job(monkeypatch):
+    monkeypatch.setattr(async_client_pool, "base_url", "http://127.0.0.1:9/v1")
+    jobs = {"a": job()}
+
+    async def run():
+        return [p async for p in ai_batch(jobs, "hf_test")][-1]
+
+    entry = asyncio.run(run())["a"]
+    assert entry["status"] == "error"
+    assert entry["error"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 1000])
+def test_code_fence_parser_handles_any_chunking(size):
+    text = "Here you go:\n```python\ndef f():\n    return 1\n```\nDone."
+    parser = CodeFenceParser()
+    for i in range(0, len(text), size):
+        parser.feed(text[i : i + size])
+    assert parser.closed
+    assert parser.code == "def f():\n    return 1"
+
+
+def test_code_fence_parser_without_fence_returns_everything():
+    parser = CodeFenceParser()
+    parser.feed("def f():\n")
+    parser.feed("    return 1")
+    assert not parser.closed
+    assert parser.code == "def f():\n    return 1"
+
+
+def test_code_fence_parser_ignores_text_after_closing_fence():
+    parser = CodeFenceParser()
+    assert parser.feed("```python\nx = 1\n```")
+    assert not parser.feed("more")
+    assert parser.code == "x = 1"
+
+
+def test_generation_cache_persists_to_disk(tmp_path):
+    GenerationCache(directory=str(tmp_path)).put("ab12", "code")
+    cache = GenerationCache(directory=str(tmp_path))
+    assert cache.get("ab12") == "code"
+    assert cache.get("ab12") == "code"
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_generation_cache_evicts_least_recently_used():
+    cache = GenerationCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+
+def test_disabled_generation_cache_always_misses():
+    cache = GenerationCache(enabled=False)
+    cache.put("a", "1")
+    assert cache.get("a") is None
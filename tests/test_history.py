@@ -0,0 +1,178 @@
+"""Undo and redo over persistent project versions."""
+
+import copy
+import pickle
+
+from gradio_layout_visualizer.sketch.history import ComponentTable, History, _diff
+from gradio_layout_visualizer.sketch.journal import apply_op
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import Project
+
+
+def start_project():
+    return Project(
+        layout=LayoutTree.from_list([0, [1, 2]]),
+        components={
+            0: ["Textbox", {"label": "Name"}, "name"],
+            1: ["Button", {}, "button"],
+            2: ["Markdown", {}, "markdown"],
+        },
+        dependencies=[[[(1, "click")], [0], [2], "greet", [], None, None, None]],
+        next_component_id=3,
+    )
+
+
+def snapshot(project):
+    return (
+        project.layout.to_list(),
+        copy.deepcopy(project.components),
+        copy.deepcopy(project.dependencies),
+        dict(project.queue),
+    )
+
+
+EDITS = [
+    {"op": "set_kwarg", "id": 0, "key": "label", "value": "Your name"},
+    {
+        "op": "add",
+        "id": 3,
+        "anchor": [2, 0],
+        "direction": "down",
+        "name": "Image",
+        "kwargs": {},
+        "var_name": "image",
+    },
+    {"op": "rename", "id": 1, "var_name": "go"},
+    {"op": "remove", "node": [0, 0]},
+    {"op": "set_queue", "queue": {"max_size": 4}},
+    {
+        "op": "set_dependency",
+        "index": 0,
+        "dependency": [[(1, "click")], [], [2], "greet", [], None, None, None],
+    },
+]
+
+
+def edited(project, history, ops):
+    """Apply `ops` as handlers do; returns the snapshot after each one."""
+    states = [snapshot(project)]
+    for op in ops:
+        apply_op(project, op)
+        history.record(op)
+        states.append(snapshot(project))
+    return states
+
+
+def test_undo_and_redo_return_the_net_change():
+    project, history = start_project(), History()
+    history.reset(project)
+    states = edited(project, history, EDITS)
+    for expected in reversed(states[:-1]):
+        for op in history.undo():
+            apply_op(project, op)
+        assert snapshot(project) == expected
+        assert snapshot(history.project()) == expected
+    assert history.undo() is None
+    for expected in states[1:]:
+        for op in history.redo():
+            apply_op(project, op)
+        assert snapshot(project) == expected
+    assert history.redo() is None
+    assert history.stats()["undo_steps"] == len(EDITS)
+
+
+def test_new_edit_drops_redo_and_merge_joins_steps():
+    project, history = start_project(), History()
+    history.reset(project)
+    edited(project, history, EDITS[:2])
+    history.undo()
+    assert history.stats()["redo_steps"] == 1
+    project = history.project()
+    apply_op(project, EDITS[2])
+    history.record(EDITS[2])
+    apply_op(project, EDITS[0])
+    history.record(EDITS[0], merge=True)
+    assert history.stats() == {
+        "undo_steps": 2,
+        "redo_steps": 0,
+        "bytes": history.nbytes,
+    }
+    history.undo()
+    expected = start_project()
+    apply_op(expected, EDITS[0])
+    assert snapshot(history.project()) == snapshot(expected)
+
+
+def test_max_steps_drops_the_oldest():
+    project, history = start_project(), History(max_steps=2)
+    history.reset(project)
+    edited(project, history, EDITS[:4])
+    assert history.stats()["undo_steps"] == 2
+    assert history.undo() and history.undo()
+    assert history.undo() is None
+
+
+def test_nbytes_follows_the_steps_held():
+    project, history = start_project(), History()
+    history.reset(project)
+    assert history.nbytes == 0
+    edited(project, history, EDITS[:3])
+    held = history.nbytes
+    assert held > 0
+    history.undo()
+    history.undo()
+    assert history.nbytes == held
+    # Recording drops the two undone steps.
+    project = history.project()
+    apply_op(project, EDITS[4])
+    history.record(EDITS[4])
+    assert 0 < history.nbytes < held
+
+
+def test_fork_is_independent():
+    project, history = start_project(), History()
+    history.reset(project)
+    edited(project, history, EDITS[:2])
+    forked = history.fork()
+    forked.undo()
+    assert history.stats()["undo_steps"] == 2
+    forked_project = forked.project()
+    apply_op(forked_project, EDITS[2])
+    forked.record(EDITS[2])
+    assert history.project().components[1][2] == "button"
+    assert forked.project().components[1][2] == "go"
+
+
+def test_pickled_history_keeps_its_steps():
+    project, history = start_project(), History()
+    history.reset(project)
+    states = edited(project, history, EDITS)
+    restored = pickle.loads(pickle.dumps(history))
+    restored.undo()
+    assert snapshot(restored.project()) == states[-2]
+
+
+def test_diff_only_lists_what_changed():
+    project, history = start_project(), History()
+    history.reset(project)
+    before = history._current
+    edited(project, history, EDITS[:1])
+    assert _diff(before, history._current) == [
+        {
+            "op": "put_component",
+            "id": 0,
+            "name": "Textbox",
+            "kwargs": {"label": "Your name"},
+            "var_name": "name",
+        }
+    ]
+    assert _diff(history._current, history._current) == []
+
+
+def test_component_table_shares_untouched_branches():
+    table = ComponentTable.from_dict({i: ("Button", {}, f"b{i}") for i in range(100)})
+    changed = table.set(40, ("Textbox", {}, "t")).set(1000, ("Image", {}, "i"))
+    assert sorted(table.changed(changed)) == [40, 1000]
+    assert changed.get(41) is table.get(41)
+    assert changed.set(40, None).get(40) is None
+    assert dict(changed.items())[1000] == ("Image", {}, "i")
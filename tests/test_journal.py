@@ -0,0 +1,143 @@
+"""Journal replay, compaction and crash recovery."""
+
+import copy
+import threading
+
+from gradio_layout_visualizer.sketch import journal as journal_module
+from gradio_layout_visualizer.sketch.journal import Journal, apply_op
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import (
+    Project,
+    load_project,
+    save_project,
+)
+
+
+def add(component_id):
+    return {
+        "op": "add",
+        "id": component_id,
+        "anchor": None,
+        "direction": None,
+        "name": "Button",
+        "kwargs": {"value": f"Button {component_id}"},
+        "var_name": f"button_{component_id}",
+    }
+
+
+def edit(journal, project, op, session=None):
+    apply_op(project, op)
+    journal.record(op, session, lambda: project)
+
+
+def assert_same(loaded, project):
+    assert loaded.layout.to_list() == project.layout.to_list()
+    assert loaded.components == project.components
+    assert loaded.next_component_id == project.next_component_id
+
+
+def start(tmp_path, **kwargs):
+    config_file = str(tmp_path / "app.json")
+    project = Project(
+        layout=LayoutTree.from_list([0]),
+        components={0: ["Textbox", {}, "textbox"]},
+        next_component_id=1,
+    )
+    save_project(config_file, project)
+    journal = Journal(config_file, **kwargs)
+    return journal, journal.load()
+
+
+def test_edits_are_replayed_over_the_project_file(tmp_path):
+    journal, project = start(tmp_path)
+    for component_id in (1, 2):
+        edit(journal, project, add(component_id))
+    edit(journal, project, {"op": "set_kwarg", "id": 1, "key": "label", "value": "Go"})
+    edit(journal, project, {"op": "remove", "node": project.layout.ref(2)})
+    assert_same(Journal(journal.config_file).load(), project)
+    assert load_project(journal.config_file).components.keys() == {0}
+
+
+def test_compact_folds_the_journal_into_the_project_file(tmp_path):
+    journal, project = start(tmp_path)
+    for component_id in range(1, 6):
+        edit(journal, project, add(component_id))
+    assert journal.stats()["pending"] == 5
+    assert journal.compact()
+    assert journal.stats() == {"recorded": 5, "pending": 0, "compactions": 1}
+    assert_same(load_project(journal.config_file), project)
+    with open(journal.path, "rb") as f:
+        assert f.read() == b""
+    # Positions carry on past the truncation.
+    edit(journal, project, add(6))
+    assert_same(Journal(journal.config_file).load(), project)
+
+
+def test_compaction_starts_every_compact_every_edits(tmp_path):
+    journal, project = start(tmp_path, compact_every=3)
+    for component_id in range(1, 4):
+        edit(journal, project, add(component_id))
+    for _ in range(100):
+        if journal.stats()["compactions"]:
+            break
+        threading.Event().wait(0.02)
+    assert journal.stats()["compactions"] == 1
+    assert_same(load_project(journal.config_file), project)
+
+
+def test_torn_line_is_dropped(tmp_path):
+    journal, project = start(tmp_path)
+    edit(journal, project, add(1))
+    with open(journal.path, "ab") as f:
+        f.write(b'{"op":"set_kwarg","id":1,"ke')
+    journal = Journal(journal.config_file)
+    assert_same(journal.load(), project)
+    # The next edit starts on a line of its own.
+    edit(journal, project, add(2))
+    assert_same(Journal(journal.config_file).load(), project)
+
+
+def test_take_over_is_folded_and_not_counted(tmp_path):
+    journal, first = start(tmp_path)
+    second = copy.deepcopy(first)
+    edit(journal, first, add(1), session="a")
+    edit(journal, second, add(2), session="b")
+    assert journal.stats()["pending"] == 0
+    # The other session's snapshot replaced the journal lines before it.
+    assert_same(load_project(journal.config_file), second)
+    with open(journal.path, "rb") as f:
+        assert f.read() == b""
+    edit(journal, second, add(3), session="b")
+    assert journal.stats()["pending"] == 1
+    assert_same(Journal(journal.config_file).load(), second)
+
+
+def test_edits_are_recorded_while_a_snapshot_is_written(tmp_path, monkeypatch):
+    journal, project = start(tmp_path)
+    edit(journal, project, add(1))
+    writing, release = threading.Event(), threading.Event()
+    write_if_changed = journal_module.write_if_changed
+
+    def slow_write(path, payload):
+        writing.set()
+        release.wait(10)
+        return write_if_changed(path, payload)
+
+    monkeypatch.setattr(journal_module, "write_if_changed", slow_write)
+    folding = threading.Thread(
+        target=journal.checkpoint, args=(copy.deepcopy(project),)
+    )
+    folding.start()
+    assert writing.wait(10)
+    recording = threading.Thread(
+        target=lambda: [edit(journal, project, add(i)) for i in (2, 3, 4)]
+    )
+    recording.start()
+    recording.join(5)
+    assert not recording.is_alive()
+    release.set()
+    folding.join(10)
+    # The snapshot holds the first edit; the ones made meanwhile stay journaled.
+    assert load_project(journal.config_file).components.keys() == {0, 1}
+    assert journal.stats()["pending"] == 3
+    assert_same(Journal(journal.config_file).load(), project)
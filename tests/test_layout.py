@@ -0,0 +1,107 @@
+"""Indexed layout tree edits, against the nested-list config format."""
+
+import copy
+import pickle
+
+import pytest
+
+from gradio_layout_visualizer.sketch.layout import ROOT_ID, LayoutTree
+
+
+def tree(layout):
+    return LayoutTree.from_list(layout)
+
+
+def test_list_round_trip():
+    layout = [0, [1, [2, 3], 4], 5]
+    assert tree(layout).to_list() == layout
+    assert len(tree(layout)) == 3
+
+
+def test_insert_along_and_across_the_parent():
+    layout = tree([0])
+    layout.insert(1, 0, "down")
+    layout.insert(2, 0, "up")
+    assert layout.to_list() == [2, 0, 1]
+    layout.insert(3, 0, "right")
+    assert layout.to_list() == [2, [0, 3], 1]
+    layout.insert(4, 3, "down")
+    assert layout.to_list() == [2, [0, [3, 4]], 1]
+    layout.insert(5)
+    assert layout.to_list() == [2, [0, [3, 4]], 1, 5]
+
+
+def test_insert_into_a_container():
+    layout = tree([[0, 1]])
+    row = layout.node(0).parent.id
+    layout.insert(2, row, "left")
+    layout.insert(3, row, "down")
+    assert layout.to_list() == [[2, 0, 1], 3]
+    with pytest.raises(ValueError):
+        layout.insert(2)
+    with pytest.raises(ValueError):
+        layout.insert(4, 0, "sideways")
+
+
+def test_remove_tidies_emptied_and_single_child_containers():
+    layout = tree([0, [1, [2, 3]], 4])
+    assert layout.remove(2) == [2]
+    assert layout.to_list() == [0, [1, 3], 4]
+    assert layout.remove(1) == [1]
+    assert layout.to_list() == [0, 3, 4]
+    assert 1 not in layout and 3 in layout
+    with pytest.raises(ValueError):
+        layout.remove(ROOT_ID)
+
+
+def test_remove_container_returns_its_components():
+    layout = tree([0, [1, [2, 3]]])
+    removed = layout.remove(layout.node(1).parent.id)
+    assert sorted(removed) == [1, 2, 3]
+    assert layout.to_list() == [0]
+    assert layout.component_ids() == [0]
+
+
+def test_move_and_unwrap():
+    layout = tree([0, [1, 2], 3])
+    layout.move(3, 1, "left")
+    assert layout.to_list() == [0, [3, 1, 2]]
+    layout.unwrap(layout.node(1).parent.id)
+    assert layout.to_list() == [0, 3, 1, 2]
+    with pytest.raises(ValueError):
+        layout.move(ROOT_ID, 0, "down")
+
+
+def test_move_splices_a_container_into_one_of_its_orientation():
+    layout = tree([[0, [1, 2]], 3])
+    column = layout.node(1).parent.id
+    layout.move(column, 3, "down")
+    assert layout.to_list() == [0, 3, 1, 2]
+
+
+def test_ref_survives_a_reload():
+    layout = tree([0, [1, [2, 3]]])
+    column = layout.node(2).parent.id
+    ref = layout.ref(column)
+    assert ref == [2, 1]
+    reloaded = tree(layout.to_list())
+    assert reloaded.resolve(ref) == reloaded.node(2).parent.id
+
+
+def test_freeze_shares_untouched_subtrees():
+    layout = tree([0, [1, 2], [3, [4, 5]]])
+    before = layout.freeze()
+    layout.insert(6, 1, "right")
+    after = layout.freeze()
+    assert after == (0, (1, 6, 2), (3, (4, 5)))
+    assert after[2] is before[2]
+    assert after[1] is not before[1]
+    assert tree(after).to_list() == layout.to_list()
+
+
+def test_deepcopy_and_pickle_are_independent():
+    layout = tree([0, [1, [2, 3]]])
+    for copied in (copy.deepcopy(layout), pickle.loads(pickle.dumps(layout))):
+        assert copied.to_list() == layout.to_list()
+        copied.remove(2)
+        assert layout.to_list() == [0, [1, [2, 3]]]
@@ -0,0 +1,71 @@
+"""Preview worker processes: isolation, timeouts and the memory limit."""
+
+import asyncio
+
+import pytest
+
+from gradio_layout_visualizer.sketch.preview import PreviewError, PreviewPool
+
+COUNTER = (
+    "counter = 0\n"
+    "def fn(x):\n"
+    "    global counter\n"
+    "    counter += 1\n"
+    "    return f'{x}-{counter}'\n"
+)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    # One worker, so every call lands in the same process.
+    pool = PreviewPool(workers=1, timeout=2, memory_limit=256 << 20)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def run(pool, code, args=(), session="a"):
+    return asyncio.run(pool.run(session, code, "fn", args))
+
+
+def test_sessions_keep_their_own_globals(pool):
+    assert run(pool, COUNTER, ("x",)) == "x-1"
+    assert run(pool, COUNTER, ("x",)) == "x-2"
+    assert run(pool, COUNTER, ("y",), session="b") == "y-1"
+
+
+def test_errors_are_reported_and_the_worker_kept(pool):
+    restarts = pool.stats()["restarts"]
+    with pytest.raises(PreviewError, match="ValueError: bad input"):
+        run(pool, "def fn():\n    raise ValueError('bad input')\n")
+    with pytest.raises(PreviewError, match="not found"):
+        asyncio.run(pool.check("def other():\n    pass\n", "fn"))
+    asyncio.run(pool.check("def fn():\n    pass\n", "fn"))
+    assert pool.stats()["restarts"] == restarts
+
+
+def test_timed_out_call_replaces_its_worker(pool):
+    before = pool.stats()
+    with pytest.raises(PreviewError, match="Timed out after 2 s"):
+        run(pool, "def fn():\n    while True:\n        pass\n")
+    after = pool.stats()
+    assert after["timeouts"] == before["timeouts"] + 1
+    assert after["restarts"] == before["restarts"] + 1
+    assert after["workers"] == 1
+    # The replacement starts with no namespaces.
+    assert run(pool, COUNTER, ("x",), session="fresh") == "x-1"
+
+
+def test_memory_limit_stops_large_allocations(pool):
+    pytest.importorskip("resource")
+    with pytest.raises(PreviewError, match="MemoryError"):
+        run(pool, "def fn():\n    return bytearray(1 << 30)\n")
+    assert run(pool, "def fn():\n    return len(bytearray(1 << 20))\n") == 1 << 20
+
+
+def test_worker_exit_is_reported(pool):
+    restarts = pool.stats()["restarts"]
+    with pytest.raises(PreviewError, match="exited"):
+        run(pool, "import os\ndef fn():\n    os._exit(3)\n")
+    assert pool.stats()["restarts"] == restarts + 1
+    assert run(pool, "def fn():\n    return 'back'\n") == "back"
@@ -0,0 +1,133 @@
+"""Saving and loading projects in every encoding."""
+
+import json
+import os
+
+import pytest
+
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import (
+    PROJECT_FORMAT_VERSION,
+    Project,
+    ProjectFormatError,
+    load_project,
+    save_project,
+)
+
+
+def sample_project():
+    return Project(
+        layout=LayoutTree.from_list([0, [1, 2]]),
+        components={
+            0: ["Textbox", {"label": "Name", "lines": 2}, "name"],
+            1: ["Button", {"value": "Go"}, "button"],
+            # Ids left by a deletion are never reused.
+            2: ["Markdown", {}, "markdown"],
+        },
+        dependencies=[
+            [
+                [(1, "click")],
+                [0],
+                [2],
+                "greet",
+                [["Say hello", "def greet(name):\n    return name"]],
+                "def greet(name):\n    return name",
+                {"latency": 0.5, "payload": 10},
+                {"concurrency_limit": 2},
+            ]
+        ],
+        next_component_id=5,
+        queue={"max_size": 8},
+    )
+
+
+def assert_same(loaded, project):
+    assert loaded.layout.to_list() == project.layout.to_list()
+    assert loaded.components == project.components
+    assert loaded.dependencies == project.dependencies
+    assert loaded.next_component_id == project.next_component_id
+    assert loaded.queue == project.queue
+
+
+@pytest.mark.parametrize("extension", [".json", ".json.gz", ".msgpack"])
+def test_round_trip(tmp_path, extension):
+    if extension == ".msgpack":
+        pytest.importorskip("msgpack")
+    path = str(tmp_path / f"app{extension}")
+    project = sample_project()
+    assert save_project(path, project)
+    loaded = load_project(path)
+    assert_same(loaded, project)
+    # Triggers come back as tuples, whatever the encoding made of them.
+    assert loaded.dependencies[0][0] == [(1, "click")]
+    assert not save_project(path, loaded)
+
+
+def test_gzip_is_compressed_json(tmp_path):
+    plain, packed = str(tmp_path / "app.json"), str(tmp_path / "app.json.gz")
+    save_project(plain, sample_project())
+    save_project(packed, sample_project())
+    with open(packed, "rb") as f:
+        assert f.read(2) == b"\x1f\x8b"
+    assert_same(load_project(packed), load_project(plain))
+
+
+def test_missing_file_loads_as_none(tmp_path):
+    assert load_project(str(tmp_path / "app.json")) is None
+
+
+def test_unversioned_config_is_migrated(tmp_path):
+    path = tmp_path / "app.json"
+    path.write_text(
+        json.dumps(
+            {
+                "layout": [0, [3, 1]],
+                "components": {
+                    "0": ["Textbox", {}, "textbox"],
+                    "1": ["Button", {}, "button"],
+                    "3": ["Markdown", {}, "markdown"],
+                },
+            }
+        )
+    )
+    loaded = load_project(str(path))
+    assert loaded.layout.to_list() == [0, [3, 1]]
+    assert sorted(loaded.components) == [0, 1, 3]
+    assert loaded.dependencies == []
+    assert loaded.next_component_id == 4
+
+
+def test_version_2_functions_get_defaults(tmp_path):
+    path = tmp_path / "app.json"
+    path.write_text(
+        json.dumps(
+            {
+                "format": "gradio-layout-visualizer",
+                "version": 2,
+                "next_component_id": 2,
+                "layout": [0, 1],
+                "components": [[0, "Textbox", {}, "textbox"], [1, "Button", {}, "b"]],
+                "dependencies": [[[[1, "click"]], [0], [], "fn_1", [], None]],
+            }
+        )
+    )
+    (dep,) = load_project(str(path)).dependencies
+    assert dep == [[(1, "click")], [0], [], "fn_1", [], None, None, None]
+
+
+def test_newer_version_is_rejected(tmp_path):
+    path = tmp_path / "app.json"
+    path.write_text(
+        json.dumps({"version": PROJECT_FORMAT_VERSION + 1, "components": []})
+    )
+    with pytest.raises(ProjectFormatError, match="Unsupported"):
+        load_project(str(path))
+
+
+@pytest.mark.parametrize("extension", [".json", ".json.gz"])
+def test_corrupt_file_names_the_path(tmp_path, extension):
+    path = str(tmp_path / f"app{extension}")
+    with open(path, "wb") as f:
+        f.write(b"\x00not a project")
+    with pytest.raises(ProjectFormatError, match=os.path.basename(path)):
+        load_project(path)
@@ -0,0 +1,111 @@
+"""Per-session projects: copy-on-write, spilling, adoption and expiry."""
+
+import os
+
+from gradio_layout_visualizer.sketch.history import History
+from gradio_layout_visualizer.sketch.journal import apply_op
+from gradio_layout_visualizer.sketch.layout import LayoutTree
+from gradio_layout_visualizer.sketch.project import Project
+from gradio_layout_visualizer.sketch.sessions import SessionStore
+
+
+def base_project():
+    return Project(
+        layout=LayoutTree.from_list([0, 1]),
+        components={0: ["Textbox", {}, "textbox"], 1: ["Button", {}, "button"]},
+        next_component_id=2,
+    )
+
+
+def label(store, handle, value):
+    op = {"op": "set_kwarg", "id": 0, "key": "label", "value": value}
+    apply_op(store.write(handle), op)
+    store.history(handle).record(op)
+
+
+def store_in(tmp_path, **kwargs):
+    kwargs.setdefault("history", History())
+    return SessionStore(base_project(), spill_dir=str(tmp_path), **kwargs)
+
+
+def test_sessions_share_the_base_until_they_write(tmp_path):
+    store = store_in(tmp_path)
+    first, second = store.handle(), store.handle()
+    assert store.read(first) is store.read(second)
+    assert store.history(first) is None
+    label(store, first, "Name")
+    assert store.read(first).components[0][1] == {"label": "Name"}
+    assert store.read(second).components[0][1] == {}
+    assert store.stats()["copies"] == 1
+
+
+def test_idle_sessions_are_spilled_and_read_back(tmp_path):
+    store = store_in(tmp_path, budget=1, idle_seconds=0)
+    handle = store.handle()
+    label(store, handle, "Name")
+    assert store.sweep() == 1
+    assert store.stats()["spilled_sessions"] == 1
+    assert os.listdir(tmp_path) == [f"{handle.key}.pickle"]
+    assert store.read(handle).components[0][1] == {"label": "Name"}
+    assert store.history(handle).stats()["undo_steps"] == 1
+    assert store.stats()["rehydrations"] == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_history_counts_towards_the_budget(tmp_path):
+    store = store_in(tmp_path)
+    handle = store.handle()
+    label(store, handle, "first")
+    history = store.history(handle)
+    before = store.stats()["resident_bytes"], history.nbytes
+    for step in range(50):
+        label(store, handle, f"label {step}")
+    assert store.history(handle) is history
+    assert history.nbytes > before[1]
+    # The store's count follows the history's every time it is looked up.
+    assert store.stats()["resident_bytes"] - before[0] == history.nbytes - before[1]
+    assert store.history_stats()["bytes"] == history.nbytes
+
+
+def test_reload_adopts_the_closed_session(tmp_path):
+    store = store_in(tmp_path)
+    closed = store.handle()
+    store.adopt(closed, "browser")
+    label(store, closed, "Name")
+    history = store.history(closed)
+    store.discard(closed)
+    reloaded = store.handle()
+    assert store.adopt(reloaded, "browser")
+    assert store.read(reloaded).components[0][1] == {"label": "Name"}
+    assert store.history(reloaded) is history
+    assert store.stats()["closed_sessions"] == 0
+
+
+def test_other_tab_gets_a_copy(tmp_path):
+    store = store_in(tmp_path)
+    open_tab = store.handle()
+    store.adopt(open_tab, "browser")
+    label(store, open_tab, "Name")
+    new_tab = store.handle()
+    assert store.adopt(new_tab, "browser")
+    assert store.read(new_tab).components[0][1] == {"label": "Name"}
+    label(store, new_tab, "Other")
+    assert store.read(open_tab).components[0][1] == {"label": "Name"}
+    assert store.history(new_tab) is not store.history(open_tab)
+
+
+def test_closed_sessions_expire_with_their_spill_files(tmp_path):
+    store = store_in(tmp_path, budget=1, idle_seconds=0, closed_seconds=0)
+    closed = store.handle()
+    store.adopt(closed, "browser")
+    label(store, closed, "Name")
+    assert store.sweep() == 1
+    store.discard(closed)
+    assert store.stats()["closed_sessions"] == 1
+    store.sweep()
+    assert os.listdir(tmp_path) == []
+    stats = store.stats()
+    assert stats["closed_sessions"] == 0 and stats["spilled_sessions"] == 0
+    assert stats["expirations"] == 1
+    # The browser's next session starts from the base again.
+    assert not store.adopt(store.handle(), "browser")